@@ -1,19 +1,40 @@
 # aec_dia.py
-from deepseek_client import deepseek_client
+from deepseek_client import get_deepseek_client
+from rules_first import is_rules_first, run_rules_first, RulesFirstCompletion
+from metrics import record_assessment, timed_assessment
+from prompt_builder import record_prompt_size
+from result_schema import EXCLUSION_RESULT_SCHEMA, parse_llm_result, parse_llm_result_async
 
-def assess_absolute_exclusion_criteria(exclusion_data):
-    """
-    使用DeepSeek根据绝对排除标准判断是否为原发性帕金森综合症
-    
-    Args:
-        exclusion_data: 字典包含绝对排除标准的各项判断结果
-        
-    Returns:
-        dict: 评估结果
-    """
-    
-    # 系统提示词
-    system_prompt = """你是一个专业的神经科医生助手。请严格按照给定的判断步骤分析绝对排除标准数据，判断患者是否患有原发性帕金森综合症。
+# 绝对排除标准判断项：(数据键, 判断项名称, 判断说明)，编号固定为列表顺序
+EXCLUSION_CRITERIA = [
+    ('drug_induced', "多巴胺受体阻滞剂或多巴胺耗竭剂服用史",
+     "多巴胺受体阻滞剂或多巴胺耗竭剂治疗诱导的帕金森综合征，其剂量和时程与药物性帕金森综合征相一致"),
+    ('progressive_aphasia', "进行性失语", "存在明确的进行性失语"),
+    ('cerebellar_ataxia', "小脑性共济失调", "存在明确的小脑性共济失调"),
+    ('cerebellar_oculomotor', "小脑性眼动异常", "小脑性眼动异常(持续的凝视诱发的眼震、巨大方波跳动、超节律扫视)"),
+    ('vertical_saccade_slowing', "向下的垂直性扫视选择性减慢", "向下的垂直性扫视选择性减慢"),
+    ('vertical_gaze_palsy', "向下的垂直性核上性凝视麻痹", "出现向下的垂直性核上性凝视麻痹"),
+    ('ideomotor_apraxia', "观念性运动性失用", "存在明确的肢体观念运动性失用"),
+    ('ftd_ppa', "发病后5年内诊断FTD或PPA",
+     "在发病后5年内，患者被诊断为高度怀疑的行为变异型额颞叶痴呆或原发性进行性失语"),
+    ('lower_limb_parkinsonism', "发病3年后仍局限于下肢的帕金森样症状", "发病3年后仍局限于下肢的帕金森样症状"),
+]
+
+EXCLUSION_RULE = '只要有任意一条判断项的结论为"是"，则说明该患者不是原发型帕金森综合症，而是继发性帕金森综合症或叠加型帕金森综合症。'
+
+# 输出格式范例（{count}为核对的判断项数量）
+EXCLUSION_OUTPUT_TEMPLATE = """如果所有标准都为"否"：
+## 步骤二：评估绝对排除标准
+### 绝对排除标准核对结果：
+核对了总共{count}条绝对排除的判断项，结论都为"否"。该患者疑似原发性帕金森综合症，因此继续根据《继发性病因清单》分辨患者是否为继发性帕金森综合症。
+
+如果有任意标准为"是"：
+## 步骤二：评估绝对排除标准
+### 绝对排除标准核对结果：
+核对了总共{count}条绝对排除的判断项，发现了[具体的阳性标准描述]，即相关判断项的结论为"是"。判断患者非原发性帕金森综合症，将移交至其他科室。"""
+
+# 角色说明、输出格式与判断规则（系统提示词的开头部分）
+EXCLUSION_FORMAT_PROMPT = """你是一个专业的神经科医生助手。请严格按照给定的判断步骤分析绝对排除标准数据，判断患者是否患有原发性帕金森综合症。
 
 请严格按照以下JSON格式返回评估结果：
 {
@@ -26,96 +47,132 @@ def assess_absolute_exclusion_criteria(exclusion_data):
 
 判断规则：只要有任意一条判断项的结论为"是"，则说明该患者不是原发型帕金森综合症，而是继发性帕金森综合症或叠加型帕金森综合症。"""
 
+# 系统提示词包含判断规则、全部判断项说明和输出格式，作为各次调用相同的前缀；用户提示词只有各判断项结论
+EXCLUSION_SYSTEM_PROMPT = EXCLUSION_FORMAT_PROMPT + """
+
+判断项（编号. 名称：判断说明）：
+""" + "\n".join(
+    f"{number}. {name}：{description}"
+    for number, (_, name, description) in enumerate(EXCLUSION_CRITERIA, start=1)
+) + """
+
+用户将以"编号=是/否"的形式提供本次核对的判断项结论。请根据判断规则，仿照如下格式输出详细的绝对排除标准核对结果（N为本次核对的判断项数量）：
+
+""" + EXCLUSION_OUTPUT_TEMPLATE.format(count="N")
+
+# 规则优先模式下与LLM结论比对的字段
+EXCLUSION_VERDICT_KEYS = ["is_primary_parkinson", "positive_criteria_count"]
+
+@timed_assessment("exclusion")
+def assess_absolute_exclusion_criteria(exclusion_data):
+    """
+    使用DeepSeek根据绝对排除标准判断是否为原发性帕金森综合症
+    
+    Args:
+        exclusion_data: 字典包含绝对排除标准的各项判断结果
+        
+    Returns:
+        dict: 评估结果
+    """
+    
+    if is_rules_first():
+        return assess_exclusion_rules_first(exclusion_data)
+    
     # 构建用户提示词
     user_prompt = build_exclusion_prompt(exclusion_data)
     
     # 调用DeepSeek API
-    result = deepseek_client.call_deepseek(system_prompt, user_prompt)
+    client = get_deepseek_client()
+    result = client.call_deepseek(EXCLUSION_SYSTEM_PROMPT, user_prompt, schema=EXCLUSION_RESULT_SCHEMA)
+    parsed = parse_llm_result(result, EXCLUSION_RESULT_SCHEMA, client) if result["success"] else None
     
-    if result["success"]:
-        return result["parsed_content"]
+    if parsed is not None:
+        record_assessment("exclusion", "ai")
+        return parsed
     else:
-        # API调用失败时使用规则回退
+        # API调用失败或输出无法修复时使用规则回退
+        record_assessment("exclusion", "fallback")
         return fallback_exclusion_assessment(exclusion_data)
 
-def build_exclusion_prompt(exclusion_data):
-    """构建绝对排除标准评估的用户提示词"""
-    
-    # 构建标准描述文本
-    criteria_text = ""
-    criteria_count = 0
-    
-    # 标准1: 多巴胺受体阻滞剂或多巴胺耗竭剂服用史
-    if 'drug_induced' in exclusion_data:
-        criteria_count += 1
-        criteria_text += f"{criteria_count}. 多巴胺受体阻滞剂或多巴胺耗竭剂服用史: {'是' if exclusion_data['drug_induced'] else '否'}\n"
-        criteria_text += "   - 判断: 多巴胺受体阻滞剂或多巴胺耗竭剂治疗诱导的帕金森综合征，其剂量和时程与药物性帕金森综合征相一致\n\n"
-    
-    # 标准2: 进行性失语
-    if 'progressive_aphasia' in exclusion_data:
-        criteria_count += 1
-        criteria_text += f"{criteria_count}. 进行性失语: {'是' if exclusion_data['progressive_aphasia'] else '否'}\n"
-        criteria_text += "   - 判断: 存在明确的进行性失语\n\n"
-    
-    # 标准3: 小脑性共济失调
-    if 'cerebellar_ataxia' in exclusion_data:
-        criteria_count += 1
-        criteria_text += f"{criteria_count}. 小脑性共济失调: {'是' if exclusion_data['cerebellar_ataxia'] else '否'}\n"
-        criteria_text += "   - 判断: 存在明确的小脑性共济失调\n\n"
-    
-    # 标准4: 小脑性眼动异常
-    if 'cerebellar_oculomotor' in exclusion_data:
-        criteria_count += 1
-        criteria_text += f"{criteria_count}. 小脑性眼动异常: {'是' if exclusion_data['cerebellar_oculomotor'] else '否'}\n"
-        criteria_text += "   - 判断: 小脑性眼动异常(持续的凝视诱发的眼震、巨大方波跳动、超节律扫视)\n\n"
-    
-    # 标准5: 向下的垂直性扫视选择性减慢
-    if 'vertical_saccade_slowing' in exclusion_data:
-        criteria_count += 1
-        criteria_text += f"{criteria_count}. 向下的垂直性扫视选择性减慢: {'是' if exclusion_data['vertical_saccade_slowing'] else '否'}\n"
-        criteria_text += "   - 判断: 向下的垂直性扫视选择性减慢\n\n"
-    
-    # 标准6: 向下的垂直性核上性凝视麻痹
-    if 'vertical_gaze_palsy' in exclusion_data:
-        criteria_count += 1
-        criteria_text += f"{criteria_count}. 向下的垂直性核上性凝视麻痹: {'是' if exclusion_data['vertical_gaze_palsy'] else '否'}\n"
-        criteria_text += "   - 判断: 出现向下的垂直性核上性凝视麻痹\n\n"
-    
-    # 标准7: 观念性运动性失用
-    if 'ideomotor_apraxia' in exclusion_data:
-        criteria_count += 1
-        criteria_text += f"{criteria_count}. 观念性运动性失用: {'是' if exclusion_data['ideomotor_apraxia'] else '否'}\n"
-        criteria_text += "   - 判断: 存在明确的肢体观念运动性失用\n\n"
-    
-    # 标准8: 发病后5年内诊断FTD或PPA
-    if 'ftd_ppa' in exclusion_data:
-        criteria_count += 1
-        criteria_text += f"{criteria_count}. 发病后5年内诊断FTD或PPA: {'是' if exclusion_data['ftd_ppa'] else '否'}\n"
-        criteria_text += "   - 判断: 在发病后5年内，患者被诊断为高度怀疑的行为变异型额颞叶痴呆或原发性进行性失语\n\n"
-    
-    # 标准9: 发病3年后仍局限于下肢的帕金森样症状
-    if 'lower_limb_parkinsonism' in exclusion_data:
-        criteria_count += 1
-        criteria_text += f"{criteria_count}. 发病3年后仍局限于下肢的帕金森样症状: {'是' if exclusion_data['lower_limb_parkinsonism'] else '否'}\n"
-        criteria_text += "   - 判断: 发病3年后仍局限于下肢的帕金森样症状\n\n"
-
-    prompt = f"""请读取绝对排除标准的判断项和对应结果。这些判断项是用来判断患者是否患有原发型帕金森综合症的，判断规则如下：只要有任意一条判断项的结论为"是"，则说明该患者不是原发型帕金森综合症，而是继发性帕金森综合症或叠加型帕金森综合症。
-
-当前患者的绝对排除标准评估数据：
-{criteria_text}
-
-请你根据上述的判断规则，仿照如下格式输出详细的绝对排除标准核对结果：
-
-如果所有标准都为"否"：
-## 步骤二：评估绝对排除标准
-### 绝对排除标准核对结果：
-核对了总共{criteria_count}条绝对排除的判断项，结论都为"否"。该患者疑似原发性帕金森综合症，因此继续根据《继发性病因清单》分辨患者是否为继发性帕金森综合症。
+@timed_assessment("exclusion")
+async def assess_absolute_exclusion_criteria_async(exclusion_data, client):
+    """
+    assess_absolute_exclusion_criteria的异步版本，供并发评估使用
+    
+    Args:
+        exclusion_data: 字典包含绝对排除标准的各项判断结果
+        client: AsyncDeepSeekClient实例
+        
+    Returns:
+        dict: 评估结果
+    """
+    if is_rules_first():
+        return assess_exclusion_rules_first(exclusion_data)
+    
+    user_prompt = build_exclusion_prompt(exclusion_data)
+    result = await client.call_deepseek(EXCLUSION_SYSTEM_PROMPT, user_prompt, schema=EXCLUSION_RESULT_SCHEMA)
+    parsed = await parse_llm_result_async(result, EXCLUSION_RESULT_SCHEMA, client) if result["success"] else None
+    
+    if parsed is not None:
+        record_assessment("exclusion", "ai")
+        return parsed
+    else:
+        record_assessment("exclusion", "fallback")
+        return fallback_exclusion_assessment(exclusion_data)
 
-如果有任意标准为"是"：
-## 步骤二：评估绝对排除标准
-### 绝对排除标准核对结果：
-核对了总共{criteria_count}条绝对排除的判断项，发现了[具体的阳性标准描述]，即相关判断项的结论为"是"。判断患者非原发性帕金森综合症，将移交至其他科室。"""
+def assess_exclusion_rules_first(exclusion_data):
+    """
+    规则优先评估：本地规则立即给出结论，DeepSeek仅用于可选叙述并核对结论
+    
+    Args:
+        exclusion_data: 字典包含绝对排除标准的各项判断结果
+        
+    Returns:
+        dict: 规则评估结果
+    """
+    exclusion_data = dict(exclusion_data)
+    record_assessment("exclusion", "rules_first")
+    return run_rules_first(
+        "exclusion",
+        fallback_exclusion_assessment(exclusion_data),
+        lambda: get_deepseek_client().call_deepseek(EXCLUSION_SYSTEM_PROMPT, build_exclusion_prompt(exclusion_data),
+                                                    schema=EXCLUSION_RESULT_SCHEMA),
+        EXCLUSION_VERDICT_KEYS,
+        "assessment",
+        EXCLUSION_RESULT_SCHEMA
+    )
+
+def stream_absolute_exclusion_criteria(exclusion_data):
+    """
+    流式版本的绝对排除标准评估，评估描述文本随生成逐段输出
     
+    Args:
+        exclusion_data: 字典包含绝对排除标准的各项判断结果
+        
+    Returns:
+        StreamingCompletion: 迭代得到assessment文本片段，结束后final_result为评估结果
+    """
+    if is_rules_first():
+        return RulesFirstCompletion(assess_exclusion_rules_first(exclusion_data), "assessment")
+    
+    user_prompt = build_exclusion_prompt(exclusion_data)
+    return get_deepseek_client().stream_deepseek(
+        EXCLUSION_SYSTEM_PROMPT, user_prompt,
+        field="assessment",
+        fallback=lambda: fallback_exclusion_assessment(exclusion_data),
+        assessor="exclusion",
+        schema=EXCLUSION_RESULT_SCHEMA
+    )
+
+def build_exclusion_prompt(exclusion_data):
+    """构建绝对排除标准评估的用户提示词（只包含各判断项结论，说明与格式在系统提示词中）"""
+    results = [
+        f"{number}={'是' if exclusion_data[key] else '否'}"
+        for number, (key, _, _) in enumerate(EXCLUSION_CRITERIA, start=1)
+        if key in exclusion_data
+    ]
+    prompt = f"本次核对{len(results)}条判断项：{'，'.join(results)}"
+    record_prompt_size("exclusion", EXCLUSION_SYSTEM_PROMPT, prompt)
     return prompt
 
 def fallback_exclusion_assessment(exclusion_data):
@@ -1,11 +1,34 @@
 # ai_blood_analysis.py
-import pandas as pd
 import json
+import threading
+from metrics import record_assessment, timed_assessment
+from prompt_builder import compact_lab_rows, record_prompt_size
+from result_schema import BLOOD_RESULT_SCHEMA, parse_llm_result, parse_llm_result_async
+
+# 系统提示词
+BLOOD_SYSTEM_PROMPT = """你是一个专业的神经科医生助手。请根据患者的血检数据分析是否存在继发性帕金森综合征的病因。
+        
+请严格按照以下JSON格式返回分析结果：
+{
+    "diagnosis_type": "疑似帕金森综合征/继发性帕金森综合征",
+    "diagnosis_label": "具体的诊断标签",
+    "abnormal_items": ["异常项目1", "异常项目2"],
+    "reasoning": "详细的分析推理过程",
+    "suggested_conditions": ["梅毒", "HIV", "电解质紊乱", "甲状腺功能亢进", "甲状旁腺功能异常", "肝豆状核变性", "无"]
+}
+
+分析逻辑：
+1. 如果梅毒抗体或HIV抗体为阳性，诊断为感染性帕金森综合征（继发性）
+2. 如果存在电解质紊乱（低钠血症快速纠正）、甲状腺功能亢进、甲状旁腺功能异常、肝豆状核变性（需进一步完善肝肾功能、电解质、甲状腺功能、甲状旁腺激素等检查），诊断为内分泌或代谢所致的帕金森综合征（继发性）
+3. 如果以上均无异常，诊断为疑似帕金森综合征
+
+注意：suggested_conditions字段要返回所有相关的条件，包括"无"选项。"""
 
 class BloodTestAnalyzer:
     def __init__(self, deepseek_client=None):
         self.deepseek_client = deepseek_client
     
+    @timed_assessment("blood")
     def analyze_blood_tests(self, lab_data):
         """
         分析血检数据，判断是否为继发性帕金森综合征
@@ -14,110 +37,113 @@ class BloodTestAnalyzer:
         if self.deepseek_client:
             return self._analyze_with_ai(lab_data)
         else:
+            record_assessment("blood", "rules")
             return self._analyze_with_rules(lab_data)
     
     def _analyze_with_ai(self, lab_data):
         """
         使用DeepSeek API分析血检数据
         """
-        system_prompt = """你是一个专业的神经科医生助手。请根据患者的血检数据分析是否存在继发性帕金森综合征的病因。
-        
-请严格按照以下JSON格式返回分析结果：
-{
-    "diagnosis_type": "疑似帕金森综合征/继发性帕金森综合征",
-    "diagnosis_label": "具体的诊断标签",
-    "abnormal_items": ["异常项目1", "异常项目2"],
-    "reasoning": "详细的分析推理过程",
-    "suggested_conditions": ["梅毒", "HIV", "电解质紊乱", "甲状腺功能亢进", "甲状旁腺功能异常", "肝豆状核变性", "无"]
-}
-
-分析逻辑：
-1. 如果梅毒抗体或HIV抗体为阳性，诊断为感染性帕金森综合征（继发性）
-2. 如果存在电解质紊乱（低钠血症快速纠正）、甲状腺功能亢进、甲状旁腺功能异常、肝豆状核变性（需进一步完善肝肾功能、电解质、甲状腺功能、甲状旁腺激素等检查），诊断为内分泌或代谢所致的帕金森综合征（继发性）
-3. 如果以上均无异常，诊断为疑似帕金森综合征
-
-注意：suggested_conditions字段要返回所有相关的条件，包括"无"选项。"""
-
         # 构建用户提示词
-        user_prompt = f"""请分析以下血检数据：
-
-{lab_data.to_string()}
-
-请根据分析逻辑判断患者是否为继发性帕金森综合征，并返回指定的JSON格式结果。"""
+        user_prompt = self._build_user_prompt(lab_data)
 
         # 调用DeepSeek API
-        result = self.deepseek_client.call_deepseek(system_prompt, user_prompt)
+        result = self.deepseek_client.call_deepseek(BLOOD_SYSTEM_PROMPT, user_prompt, schema=BLOOD_RESULT_SCHEMA)
+        parsed = parse_llm_result(result, BLOOD_RESULT_SCHEMA, self.deepseek_client) if result["success"] else None
+        
+        if parsed is not None:
+            record_assessment("blood", "ai")
+            return parsed
+        else:
+            # API调用失败或输出无法修复时回退到规则分析
+            record_assessment("blood", "fallback")
+            return self._analyze_with_rules(lab_data)
+    
+    def stream_blood_tests(self, lab_data):
+        """
+        流式版本的血检AI分析，分析推理文本随生成逐段输出（需要已设置DeepSeek客户端）
+        
+        Returns:
+            StreamingCompletion: 迭代得到reasoning文本片段，结束后final_result为分析结果
+        """
+        user_prompt = self._build_user_prompt(lab_data)
+        return self.deepseek_client.stream_deepseek(
+            BLOOD_SYSTEM_PROMPT, user_prompt,
+            field="reasoning",
+            fallback=lambda: self._analyze_with_rules(lab_data),
+            assessor="blood",
+            schema=BLOOD_RESULT_SCHEMA
+        )
+    
+    @timed_assessment("blood")
+    async def analyze_blood_tests_async(self, lab_data, client):
+        """
+        analyze_blood_tests的异步版本，供并发评估使用
+        
+        Args:
+            lab_data: 血检数据DataFrame
+            client: AsyncDeepSeekClient实例
+        """
+        user_prompt = self._build_user_prompt(lab_data)
+        result = await client.call_deepseek(BLOOD_SYSTEM_PROMPT, user_prompt, schema=BLOOD_RESULT_SCHEMA)
+        parsed = await parse_llm_result_async(result, BLOOD_RESULT_SCHEMA, client) if result["success"] else None
         
-        if result["success"]:
-            return result["parsed_content"]
+        if parsed is not None:
+            record_assessment("blood", "ai")
+            return parsed
         else:
-            # API调用失败时回退到规则分析
+            record_assessment("blood", "fallback")
             return self._analyze_with_rules(lab_data)
     
+    def _build_user_prompt(self, lab_data):
+        """构建血检分析的用户提示词（紧凑格式：跳过未填写的项目，不含分类列和列宽填充）"""
+        prompt = f"""血检数据（名称=结果 单位（参考值））：
+{compact_lab_rows(lab_data)}"""
+        record_prompt_size("blood", BLOOD_SYSTEM_PROMPT, prompt)
+        return prompt
+    
     def _analyze_with_rules(self, lab_data):
         """
         基于规则的血液分析（DeepSeek API不可用时的回退方案）
         """
-        # 从lab_data中提取关键信息
-        lab_dict = {}
-        for _, row in lab_data.iterrows():
-            lab_dict[row['名称']] = row['结果']
+        # 按参考值区间向量化判定各项目，推导相关条件（lab_reference依赖numpy/pandas，按需导入）
+        from lab_reference import LAB_CONDITION_RULES, derive_lab_conditions
+        if lab_data.empty:
+            # 没有任何检测行时各条件均不成立（与逐项判定一致，结果为疑似帕金森综合征）
+            return self._build_rules_result({rule[0]: False for rule in LAB_CONDITION_RULES})
+        conditions = derive_lab_conditions(lab_data).iloc[0]
+        return self._build_rules_result(conditions)
+    
+    def analyze_many(self, lab_data, patient_column):
+        """
+        基于规则批量分析多名患者堆叠的血检数据
         
-        abnormal_items = []
+        Args:
+            lab_data: 多名患者堆叠的血检数据DataFrame
+            patient_column: 患者ID列名
+            
+        Returns:
+            dict: 患者ID -> 分析结果
+        """
+        from lab_reference import derive_lab_conditions
+        conditions = derive_lab_conditions(lab_data, patient_column)
+        return {patient_id: self._build_rules_result(row) for patient_id, row in conditions.iterrows()}
+    
+    def _build_rules_result(self, conditions):
+        """根据推导出的条件构建规则分析结果"""
+        from lab_reference import abnormal_items_from_conditions
+        abnormal_items = abnormal_items_from_conditions(conditions)
         suggested_conditions = []
         
-        # 检查梅毒和HIV
-        if '梅毒抗体' in lab_dict and lab_dict['梅毒抗体'] == '阳性':
-            abnormal_items.append("梅毒抗体阳性")
+        if conditions['syphilis']:
             suggested_conditions.append("梅毒")
-        
-        if 'HIV抗体' in lab_dict and lab_dict['HIV抗体'] == '阳性':
-            abnormal_items.append("HIV抗体阳性")
+        if conditions['hiv']:
             suggested_conditions.append("HIV")
         
-        # 检查电解质
-        electrolyte_abnormal = False
-        if '钠(Na)' in lab_dict and lab_dict['钠(Na)']:
-            try:
-                na_value = float(lab_dict['钠(Na)'])
-                if na_value < 135:
-                    abnormal_items.append("低钠血症")
-                    electrolyte_abnormal = True
-            except:
-                pass
-        
-        # 检查甲状腺功能
-        thyroid_abnormal = False
-        if '游离T3(FT3)' in lab_dict and lab_dict['游离T3(FT3)']:
-            try:
-                ft3_value = float(lab_dict['游离T3(FT3)'])
-                if ft3_value > 6.5:
-                    abnormal_items.append("甲状腺功能亢进(FT3升高)")
-                    thyroid_abnormal = True
-            except:
-                pass
-        
-        # 检查甲状旁腺功能
-        parathyroid_abnormal = False
-        if '甲状旁腺激素(PTH)' in lab_dict and lab_dict['甲状旁腺激素(PTH)']:
-            try:
-                pth_value = float(lab_dict['甲状旁腺激素(PTH)'])
-                if pth_value > 65 or pth_value < 15:
-                    abnormal_items.append("甲状旁腺功能异常")
-                    parathyroid_abnormal = True
-            except:
-                pass
-        
-        # 检查肝功能（肝豆状核变性相关）
-        liver_abnormal = False
-        if any(key in lab_dict for key in ['谷丙转氨酶(ALT)', '谷草转氨酶(AST)', '总胆红素(TBIL)']):
-            alt_abnormal = '谷丙转氨酶(ALT)' in lab_dict and lab_dict['谷丙转氨酶(ALT)'] and float(lab_dict['谷丙转氨酶(ALT)']) > 40
-            ast_abnormal = '谷草转氨酶(AST)' in lab_dict and lab_dict['谷草转氨酶(AST)'] and float(lab_dict['谷草转氨酶(AST)']) > 40
-            tbil_abnormal = '总胆红素(TBIL)' in lab_dict and lab_dict['总胆红素(TBIL)'] and float(lab_dict['总胆红素(TBIL)']) > 20.5
-            
-            if alt_abnormal or ast_abnormal or tbil_abnormal:
-                abnormal_items.append("肝功能异常")
-                liver_abnormal = True
+        electrolyte_abnormal = conditions['electrolyte']
+        thyroid_abnormal = conditions['thyroid']
+        parathyroid_abnormal = conditions['parathyroid']
+        liver_abnormal = conditions['liver']
         
         # 根据异常情况确定诊断
         if "梅毒抗体阳性" in abnormal_items or "HIV抗体阳性" in abnormal_items:
@@ -166,5 +192,22 @@ class BloodTestAnalyzer:
         else:
             return f"发现以下轻微异常指标：{items_text}，但这些异常不足以诊断为继发性帕金森综合征。"
 
-# 创建全局分析器实例
-blood_analyzer = BloodTestAnalyzer()
\ No newline at end of file
+_default_analyzer = None
+_default_analyzer_lock = threading.Lock()
+
+
+def get_blood_analyzer():
+    """获取进程级共享的血检分析器（首次使用时创建并接入共享的DeepSeek客户端）"""
+    global _default_analyzer
+    with _default_analyzer_lock:
+        if _default_analyzer is None:
+            from deepseek_client import get_deepseek_client
+            _default_analyzer = BloodTestAnalyzer(get_deepseek_client())
+        return _default_analyzer
+
+
+def __getattr__(name):
+    # 兼容旧写法 from ai_blood_analysis import blood_analyzer
+    if name == "blood_analyzer":
+        return get_blood_analyzer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,78 @@
+# assessment_runner.py
+import asyncio
+import time
+
+from deepseek_client import AsyncDeepSeekClient
+from updrs_dia import assess_updrs_parkinson_async, fallback_updrs_assessment
+from aec_dia import assess_absolute_exclusion_criteria_async, fallback_exclusion_assessment
+from ai_blood_analysis import get_blood_analyzer
+
+
+async def run_assessments_async(updrs_data=None, exclusion_data=None, lab_data=None,
+                                max_concurrency=3, client=None, semaphore=None):
+    """
+    并发执行UPDRS、绝对排除标准和血检三项评估，总耗时取决于最慢的一项
+
+    Args:
+        updrs_data: UPDRS评分DataFrame（为None时跳过）
+        exclusion_data: 绝对排除标准字典（为None时跳过）
+        lab_data: 血检数据DataFrame（为None时跳过）
+        max_concurrency: 同时进行的DeepSeek请求上限
+        client: AsyncDeepSeekClient实例，为None时内部创建并在结束后关闭
+        semaphore: 可选的共享asyncio.Semaphore，用于在多名患者之间统一限制并发
+
+    Returns:
+        dict: {"updrs": ..., "exclusion": ..., "blood": ..., "elapsed": 秒}
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max_concurrency)
+    own_client = client is None
+    if own_client:
+        client = AsyncDeepSeekClient(max_connections=max_concurrency)
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    jobs = {}
+    fallbacks = {}
+    if updrs_data is not None:
+        jobs["updrs"] = assess_updrs_parkinson_async(updrs_data, client)
+        fallbacks["updrs"] = lambda: fallback_updrs_assessment(updrs_data)
+    if exclusion_data is not None:
+        jobs["exclusion"] = assess_absolute_exclusion_criteria_async(exclusion_data, client)
+        fallbacks["exclusion"] = lambda: fallback_exclusion_assessment(exclusion_data)
+    if lab_data is not None:
+        blood_analyzer = get_blood_analyzer()
+        jobs["blood"] = blood_analyzer.analyze_blood_tests_async(lab_data, client)
+        fallbacks["blood"] = lambda: blood_analyzer._analyze_with_rules(lab_data)
+
+    start = time.perf_counter()
+    try:
+        outcomes = await asyncio.gather(
+            *(bounded(coro) for coro in jobs.values()),
+            return_exceptions=True
+        )
+    finally:
+        if own_client:
+            await client.aclose()
+
+    results = {}
+    for name, outcome in zip(jobs.keys(), outcomes):
+        # 单项评估出现意外异常时退回规则评估，不影响其他评估
+        if isinstance(outcome, Exception):
+            results[name] = fallbacks[name]()
+        else:
+            results[name] = outcome
+    results["elapsed"] = time.perf_counter() - start
+    return results
+
+
+def run_assessments(updrs_data=None, exclusion_data=None, lab_data=None, max_concurrency=3):
+    """run_assessments_async的同步入口，供Streamlit脚本线程直接调用"""
+    return asyncio.run(run_assessments_async(
+        updrs_data=updrs_data,
+        exclusion_data=exclusion_data,
+        lab_data=lab_data,
+        max_concurrency=max_concurrency
+    ))
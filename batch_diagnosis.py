@@ -0,0 +1,372 @@
+# batch_diagnosis.py
+"""
+队列（批量）诊断引擎：无界面地对大量患者执行 UPDRS → 绝对排除标准 → 血检 → 影像 → 步骤5 流程。
+
+输入可以是目录（每名患者一个子目录）或清单CSV：
+
+    cohort/
+        P0001/
+            updrs.csv        步骤2格式：第一列检测项目，第二列评分
+            lab.csv          步骤4格式：项目, 名称, 结果, 单位, 参考值
+            patient.json     可选，步骤1的patient_info字段（病史、体格检查勾选）
+            exclusion.json   可选，步骤3的exclusion_criteria字典
+            imaging.json     可选，{"ct_findings": [...], "mri_findings": [...]}
+            followup.json    可选，{"warning_signs": [...], "supportive_criteria": [...],
+                                    "msa_features": [...], "psp_features": [...], "mrpi_index": 0}
+
+清单CSV需包含patient_id列，以及updrs、lab、patient、exclusion、imaging、followup中的任意列
+（文件路径，相对于清单所在目录）。
+
+用法：
+    python batch_diagnosis.py cohort/ --output results.jsonl [--llm] [--parquet results.parquet]
+
+输出的JSONL同时作为断点：重新运行时会跳过已写入的患者。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from updrs_dia import fallback_updrs_assessment
+from aec_dia import fallback_exclusion_assessment
+from ai_blood_analysis import BloodTestAnalyzer
+from lab_utils import validate_uploaded_csv
+from sop_rules import (
+    SECONDARY_HISTORY_KEYS, EXCLUSION_SIGN_KEYS,
+    derive_step4_result, classify_primary_vs_atypical, derive_diagnosis_tag
+)
+
+PATIENT_FILES = {
+    "updrs": "updrs.csv",
+    "lab": "lab.csv",
+    "patient": "patient.json",
+    "exclusion": "exclusion.json",
+    "imaging": "imaging.json",
+    "followup": "followup.json",
+}
+
+
+def iter_patient_records(input_path):
+    """从患者目录或清单CSV中逐个产生患者记录（各输入文件的路径）"""
+    if os.path.isdir(input_path):
+        entries = sorted((e for e in os.scandir(input_path) if e.is_dir()), key=lambda e: e.name)
+        for entry in entries:
+            record = {"patient_id": entry.name}
+            for key, filename in PATIENT_FILES.items():
+                path = os.path.join(entry.path, filename)
+                record[key] = path if os.path.exists(path) else None
+            yield record
+    else:
+        base_dir = os.path.dirname(os.path.abspath(input_path))
+        for chunk in pd.read_csv(input_path, dtype=str, chunksize=1000):
+            for row in chunk.to_dict('records'):
+                record = {"patient_id": row["patient_id"]}
+                for key in PATIENT_FILES:
+                    value = row.get(key)
+                    record[key] = os.path.join(base_dir, value) if isinstance(value, str) and value else None
+                yield record
+
+
+def load_updrs_csv(path):
+    """按步骤2的映射规则读取UPDRS CSV"""
+    df = pd.read_csv(path)
+    if len(df.columns) < 2:
+        raise ValueError("CSV文件需要至少包含两列数据")
+    return pd.DataFrame({
+        '检测项目': df.iloc[:, 0],
+        '评分': pd.to_numeric(df.iloc[:, 1], errors='coerce').fillna(0).astype(int)
+    })
+
+
+def load_lab_csv(path):
+    """读取并校验步骤4格式的血检CSV"""
+    df = pd.read_csv(path, dtype={'结果': str}, keep_default_na=False)
+    is_valid, message = validate_uploaded_csv(df)
+    if not is_valid:
+        raise ValueError(message)
+    return df
+
+
+def _load_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_patient_inputs(record):
+    """
+    读取一名患者的全部输入
+
+    Returns:
+        tuple: (inputs字典, 错误列表)
+    """
+    loaders = {
+        "updrs": load_updrs_csv,
+        "lab": load_lab_csv,
+        "patient": _load_json,
+        "exclusion": _load_json,
+        "imaging": _load_json,
+        "followup": _load_json,
+    }
+    inputs = {}
+    errors = []
+    for key, loader in loaders.items():
+        path = record.get(key)
+        if not path:
+            inputs[key] = None
+            continue
+        try:
+            inputs[key] = loader(path)
+        except Exception as e:
+            inputs[key] = None
+            errors.append(f"{key}: {str(e)}")
+    return inputs, errors
+
+
+def run_rule_pipeline(record):
+    """
+    对一名患者执行纯规则流程（在进程池中运行）
+
+    Returns:
+        dict: 该患者的诊断结果
+    """
+    return run_rule_pipeline_with_inputs(record)[0]
+
+
+def run_rule_pipeline_with_inputs(record):
+    """
+    执行纯规则流程并一并返回已读取的输入，供LLM阶段复用而不必再次读取文件
+
+    Returns:
+        tuple: (该患者的诊断结果, inputs字典)
+    """
+    inputs, errors = load_patient_inputs(record)
+    result = {
+        "patient_id": record["patient_id"],
+        "source": "rules",
+        "updrs": None,
+        "exclusion": None,
+        "blood": None,
+        "errors": errors,
+    }
+
+    if inputs["updrs"] is not None:
+        result["updrs"] = fallback_updrs_assessment(inputs["updrs"])
+    if inputs["exclusion"] is not None:
+        result["exclusion"] = fallback_exclusion_assessment(inputs["exclusion"])
+    if inputs["lab"] is not None:
+        result["blood"] = BloodTestAnalyzer()._analyze_with_rules(inputs["lab"])
+
+    return finalize_patient_result(result, inputs), inputs
+
+
+def finalize_patient_result(result, inputs):
+    """根据步骤2-4的结果计算影像、步骤5及最终诊断标签"""
+    patient = inputs.get("patient") or {}
+    imaging = inputs.get("imaging")
+    followup = inputs.get("followup")
+
+    # 步骤4：与界面、随访记录使用同一判定（血检建议的病因、CT、MRI均完成时才给出汇总结果）
+    imaging = imaging or {}
+    step4_result = derive_step4_result(
+        result["blood"].get("suggested_conditions", []) if result["blood"] else [],
+        imaging.get("ct_findings", []),
+        imaging.get("mri_findings", [])
+    )
+    result["step4_result"] = step4_result
+
+    has_parkinson = result["updrs"]["has_parkinson"] if result["updrs"] else None
+    is_primary = result["exclusion"]["is_primary_parkinson"] if result["exclusion"] else None
+
+    # 步骤5：仅当前序步骤均为疑似时才进行
+    step5 = None
+    if followup is not None and has_parkinson and is_primary is not False and step4_result == "疑似帕金森综合征":
+        step5 = classify_primary_vs_atypical(
+            followup.get("warning_signs", []),
+            followup.get("supportive_criteria", []),
+            followup.get("msa_features", []),
+            followup.get("psp_features", []),
+            followup.get("mrpi_index", 0)
+        )
+    result["step5"] = step5
+
+    result["diagnosis_tag"] = derive_diagnosis_tag(
+        secondary_history=any(patient.get(key, False) for key in SECONDARY_HISTORY_KEYS),
+        exclusion_signs=any(patient.get(key, False) for key in EXCLUSION_SIGN_KEYS),
+        has_parkinson=has_parkinson,
+        is_primary_parkinson=is_primary,
+        step4_result=step4_result,
+        step5_result=step5["diagnosis"] if step5 else None
+    )
+    return result
+
+
+async def run_llm_stage(batch_inputs, batch_results, max_concurrency):
+    """
+    对一批患者并发调用DeepSeek评估（受共享信号量约束），并用LLM结论重新汇总
+
+    Args:
+        batch_inputs: 规则阶段已读取的各患者输入（事件循环中不再读取文件）
+        batch_results: 规则阶段的各患者结果
+        max_concurrency: 同时进行的DeepSeek请求上限
+    """
+    from assessment_runner import run_assessments_async
+    from deepseek_client import AsyncDeepSeekClient
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async with AsyncDeepSeekClient(max_connections=max_concurrency) as client:
+        async def assess(inputs, result):
+            llm_results = await run_assessments_async(
+                updrs_data=inputs["updrs"],
+                exclusion_data=inputs["exclusion"],
+                lab_data=inputs["lab"],
+                client=client,
+                semaphore=semaphore
+            )
+            result["source"] = "llm"
+            result["updrs"] = llm_results.get("updrs", result["updrs"])
+            result["exclusion"] = llm_results.get("exclusion", result["exclusion"])
+            result["blood"] = llm_results.get("blood", result["blood"])
+            return finalize_patient_result(result, inputs)
+
+        return await asyncio.gather(*(assess(inputs, res) for inputs, res in zip(batch_inputs, batch_results)))
+
+
+def _json_default(value):
+    # numpy标量等类型
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def load_completed_ids(output_path):
+    """读取已完成的患者ID，并截掉中断时写了一半的末行"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    valid_length = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                completed.add(json.loads(line)["patient_id"])
+            except (ValueError, KeyError):
+                break
+            valid_length += len(line)
+
+    if valid_length != os.path.getsize(output_path):
+        with open(output_path, 'r+b') as f:
+            f.truncate(valid_length)
+    return completed
+
+
+def _iter_batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_batch(input_path, output_path, workers=None, use_llm=False, llm_concurrency=8, batch_size=256):
+    """
+    执行批量诊断
+
+    Args:
+        input_path: 患者目录或清单CSV
+        output_path: JSONL输出路径（同时作为断点文件）
+        workers: 规则流程的进程数
+        use_llm: 是否调用DeepSeek评估
+        llm_concurrency: 同时进行的DeepSeek请求上限
+        batch_size: 每批处理的患者数
+
+    Returns:
+        dict: 运行统计
+    """
+    completed = load_completed_ids(output_path)
+    pending = (r for r in iter_patient_records(input_path) if r["patient_id"] not in completed)
+
+    stats = {"skipped": len(completed), "processed": 0, "errors": 0}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            open(output_path, 'a', encoding='utf-8') as out:
+        for batch in _iter_batches(pending, batch_size):
+            chunksize = max(1, len(batch) // 32)
+            if use_llm:
+                # 规则阶段读取的输入随结果一并返回，LLM阶段直接复用
+                outcomes = list(executor.map(run_rule_pipeline_with_inputs, batch, chunksize=chunksize))
+                results = [result for result, _ in outcomes]
+                batch_inputs = [inputs for _, inputs in outcomes]
+                results = asyncio.run(run_llm_stage(batch_inputs, results, llm_concurrency))
+            else:
+                results = list(executor.map(run_rule_pipeline, batch, chunksize=chunksize))
+
+            for result in results:
+                out.write(json.dumps(result, ensure_ascii=False, default=_json_default) + "\n")
+                stats["processed"] += 1
+                if result["errors"]:
+                    stats["errors"] += 1
+            # 每批落盘后才算完成，保证中断后可从断点继续
+            out.flush()
+            os.fsync(out.fileno())
+
+            elapsed = time.perf_counter() - start
+            print(f"已处理 {stats['processed']} 名患者（{stats['processed'] / elapsed:.1f} 名/秒）",
+                  file=sys.stderr)
+
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def export_parquet(jsonl_path, parquet_path):
+    """将JSONL结果转换为Parquet（嵌套字段序列化为JSON字符串，需要pyarrow）"""
+    df = pd.read_json(jsonl_path, lines=True)
+    for column in df.columns:
+        if df[column].map(lambda v: isinstance(v, (dict, list))).any():
+            df[column] = df[column].map(lambda v: json.dumps(v, ensure_ascii=False, default=_json_default))
+    df.to_parquet(parquet_path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="帕金森病诊断系统批量诊断")
+    parser.add_argument("input", help="患者目录或清单CSV")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL输出路径（同时作为断点）")
+    parser.add_argument("--parquet", help="完成后额外导出的Parquet路径")
+    parser.add_argument("--workers", type=int, default=None, help="规则流程进程数（默认CPU核数）")
+    parser.add_argument("--llm", action="store_true", help="调用DeepSeek评估（默认仅使用规则）")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="同时进行的DeepSeek请求上限")
+    parser.add_argument("--batch-size", type=int, default=256, help="每批处理的患者数")
+    args = parser.parse_args(argv)
+
+    stats = run_batch(
+        args.input, args.output,
+        workers=args.workers,
+        use_llm=args.llm,
+        llm_concurrency=args.llm_concurrency,
+        batch_size=args.batch_size
+    )
+    print(f"完成：处理 {stats['processed']} 名，跳过 {stats['skipped']} 名，"
+          f"含错误 {stats['errors']} 名，用时 {stats['elapsed']:.1f} 秒", file=sys.stderr)
+
+    if args.parquet:
+        try:
+            export_parquet(args.output, args.parquet)
+        except ImportError:
+            print("导出Parquet需要安装pyarrow", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+# blob_store.py
+"""
+内容寻址的影像文件存储：文件按SHA-256摘要保存在本地磁盘（不同患者上传的相同文件只存一份），
+上传时在线程池中预先生成缩小的缩略图；会话中只保存摘要，页面重跑时显示缩略图而不再解码原图。
+
+目录结构（默认data/blobs，环境变量PD_BLOB_DIR）：
+    objects/ab/abcdef...     原文件
+    thumbs/ab/abcdef....png  缩略图
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 缩略图最长边（像素）
+DEFAULT_THUMBNAIL_SIZE = 320
+
+
+def blob_digest(data):
+    """计算文件内容的SHA-256摘要"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path, data):
+    # 先写临时文件再改名，并发写入同一摘要时读方不会看到半个文件
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class BlobStore:
+    """本地磁盘上的内容寻址文件存储，附带后台缩略图生成"""
+
+    def __init__(self, root, thumbnail_size=DEFAULT_THUMBNAIL_SIZE, max_workers=2):
+        self.root = root
+        self.thumbnail_size = thumbnail_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pd-thumb")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._stats = {"stored": 0, "deduplicated": 0, "thumbnails": 0, "thumbnail_failures": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def path(self, digest):
+        """原文件路径"""
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def thumbnail_path(self, digest):
+        """缩略图路径（不保证已生成）"""
+        return os.path.join(self.root, "thumbs", digest[:2], digest + ".png")
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data, thumbnail=True):
+        """
+        保存文件内容并在后台生成缩略图，已存在的内容直接复用
+
+        Args:
+            data: 文件字节
+            thumbnail: 是否生成缩略图（DICOM等Pillow无法识别的格式应传False）
+
+        Returns:
+            str: 内容摘要
+        """
+        digest = blob_digest(data)
+        if self.exists(digest):
+            self._count("deduplicated")
+        else:
+            _write_atomic(self.path(digest), data)
+            self._count("stored")
+        if thumbnail:
+            self._schedule_thumbnail(digest)
+        return digest
+
+    def read(self, digest):
+        """读取原文件内容"""
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    def _schedule_thumbnail(self, digest):
+        if Image is None or os.path.exists(self.thumbnail_path(digest)):
+            return
+        with self._lock:
+            if digest in self._pending:
+                return
+            self._pending[digest] = self._executor.submit(self._build_thumbnail, digest)
+
+    def _build_thumbnail(self, digest):
+        try:
+            with Image.open(self.path(digest)) as image:
+                # JPEG在解码阶段即按比例缩小（DCT缩放），大图无需完整解码
+                image.draft('RGB', (self.thumbnail_size, self.thumbnail_size))
+                image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                buffer = io.BytesIO()
+                image.save(buffer, format='PNG')
+            target = self.thumbnail_path(digest)
+            _write_atomic(target, buffer.getvalue())
+            self._count("thumbnails")
+            return target
+        except Exception:
+            # 无法识别的格式（如DICOM）或损坏的文件不生成缩略图
+            self._count("thumbnail_failures")
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(digest, None)
+
+    def thumbnail(self, digest, timeout=None):
+        """
+        获取缩略图路径，正在生成时最多等待timeout秒
+
+        Returns:
+            str: 缩略图路径，未安装Pillow、无法生成或等待超时时为None
+        """
+        target = self.thumbnail_path(digest)
+        if os.path.exists(target):
+            return target
+        with self._lock:
+            future = self._pending.get(digest)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def get_stats(self):
+        """获取存储统计（新写入、去重复用、缩略图生成与失败次数）"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending_thumbnails"] = len(self._pending)
+        stats["thumbnails_enabled"] = Image is not None
+        return stats
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """获取进程级共享的文件存储（配置来自环境变量）"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = BlobStore(
+                root=os.getenv('PD_BLOB_DIR', os.path.join('data', 'blobs')),
+                thumbnail_size=int(os.getenv('PD_THUMBNAIL_SIZE', DEFAULT_THUMBNAIL_SIZE)),
+                max_workers=int(os.getenv('PD_THUMBNAIL_WORKERS', 2))
+            )
+        return _default_store
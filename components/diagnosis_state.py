@@ -0,0 +1,45 @@
+# components/diagnosis_state.py
+import streamlit as st
+
+from diagnosis_machine import DiagnosisStateMachine
+
+
+def get_diagnosis_machine():
+    """获取当前会话的诊断状态机（首次使用时由会话状态构建）"""
+    if 'diagnosis_machine' not in st.session_state:
+        st.session_state.diagnosis_machine = DiagnosisStateMachine.from_state(st.session_state)
+    return st.session_state.diagnosis_machine
+
+
+def reset_diagnosis_machine():
+    """丢弃状态机，下次读取时由会话状态重新构建（如加载已有患者后）"""
+    st.session_state.pop('diagnosis_machine', None)
+
+
+def dispatch_diagnosis_event(*events):
+    """
+    向诊断状态机发送事件，输入未变化的事件不会使任何步骤失效
+
+    Returns:
+        bool: 是否有事件改变了状态机输入
+    """
+    machine = get_diagnosis_machine()
+    changed = False
+    for event in events:
+        changed = machine.dispatch(event) or changed
+    return changed
+
+
+def get_diagnosis_state():
+    """
+    获取当前诊断状态，只重算被事件标记为脏的步骤
+
+    Returns:
+        dict: tag、history、updrs、exclusion、blood、imaging、step4、step5
+    """
+    state = get_diagnosis_machine().evaluate()
+    # 诊断标签同时写回patient_info，供持久化与批量导出使用
+    patient_info = st.session_state.get('patient_info')
+    if patient_info is not None and patient_info.get('diagnosis_tag') != state["tag"]:
+        patient_info['diagnosis_tag'] = state["tag"]
+    return state
@@ -0,0 +1,141 @@
+# components/dicom_panel.py
+from functools import lru_cache
+
+import streamlit as st
+
+from blob_store import get_blob_store
+from dicom_series import DICOM_SUPPORTED, SEQUENCE_TYPES, build_series_index, missing_sequences, find_series
+from job_queue import FAILED
+from components.render_utils import fragment
+from components.job_panel import start_job, take_finished_job, display_job_progress
+
+# 预览图最长边（像素）
+PREVIEW_SIZE = 256
+
+
+@lru_cache(maxsize=16)
+def load_series_index(digests):
+    """
+    按内容摘要解析DICOM文件头并建立序列索引（内容寻址，相同文件集合在各会话间共用索引）
+
+    Args:
+        digests: 已存入文件存储的DICOM文件摘要（tuple）
+
+    Returns:
+        tuple: ({SeriesInstanceUID: DicomSeries}, 无法解析的文件数)
+    """
+    store = get_blob_store()
+    series, skipped = build_series_index([store.path(digest) for digest in digests])
+    return series, len(skipped)
+
+
+@fragment
+def _series_preview(series):
+    """序列预览（片段：切换序列或层面只重跑本区域）"""
+    ordered = sorted(series.values(), key=lambda item: (item.series_number, item.description))
+    labels = [f"{item.sequence_type} · {item.description or '（无描述）'}（{len(item)}层）" for item in ordered]
+    choice = st.selectbox("预览序列", range(len(ordered)), format_func=lambda i: labels[i], key="dicom_preview_series")
+    selected = ordered[choice]
+    index = 0
+    if len(selected) > 1:
+        index = st.slider("层面", 1, len(selected), len(selected) // 2 + 1, key="dicom_preview_slice") - 1
+    try:
+        st.image(selected.preview(index, PREVIEW_SIZE), caption=f"{labels[choice]} 第{index + 1}层", width=PREVIEW_SIZE)
+    except Exception as e:
+        st.caption(f"该层无法预览：{e}")
+
+
+def display_dicom_series(digests):
+    """
+    显示已上传DICOM文件的序列索引、缺失的序列类型和分层预览
+
+    Args:
+        digests: DICOM文件的内容摘要列表
+
+    Returns:
+        dict: {SeriesInstanceUID: DicomSeries}，未安装pydicom时为空
+    """
+    if not digests:
+        return {}
+    if not DICOM_SUPPORTED:
+        st.warning("未安装pydicom，无法解析DICOM文件（pip install pydicom）")
+        return {}
+
+    series, skipped = load_series_index(tuple(sorted(set(digests))))
+    if skipped:
+        st.caption(f"{skipped} 个文件不是有效的DICOM文件，已忽略")
+    if not series:
+        return {}
+
+    st.dataframe([item.summary() for item in series.values()], use_container_width=True, hide_index=True)
+    missing = missing_sequences(series)
+    if missing:
+        st.warning(f"尚未识别到以下序列：{'、'.join(missing)}")
+    else:
+        st.success(f"已包含全部所需序列：{'、'.join(SEQUENCE_TYPES)}")
+    _series_preview(series)
+    return series
+
+
+def _quantify_job(job, paths):
+    # 延迟导入：numpy只在实际测量时加载
+    from mri_quant import run_quantification
+    job.progress = f"正在测量3D T1序列（{len(paths)}层）..."
+    # 未缓存时返回进程池的Future，任务队列不占用工作线程等待测量
+    return run_quantification(paths)
+
+
+def display_mri_quantification(series):
+    """
+    对3D T1序列在后台进行定量测量（MRPI、脑桥/中脑面积比、小脑中脚宽度、壳核体积估计）并显示结果
+
+    同一检查的结果按内容缓存，页面重跑和再次上传相同文件时不会重新计算。
+
+    Args:
+        series: display_dicom_series返回的序列索引
+
+    Returns:
+        dict: 测量结果（含预填的msa_features/psp_features/mrpi_index），无3D T1序列或测量未完成时为None
+    """
+    from mri_quant import study_key, cached_result
+
+    t1 = find_series(series, "3D T1") if series else None
+    if t1 is None:
+        return None
+    paths = tuple(sorted(instance.path for instance in t1.instances))
+    key = study_key(paths)
+    results = st.session_state.setdefault('page5_mri_quant', {})
+    result = results.get(key) or cached_result(paths)
+    if result is None:
+        if st.session_state.get('mri_quant_study') != key or 'mri_quant_job_id' not in st.session_state:
+            st.session_state.mri_quant_study = key
+            start_job('mri_quant_job_id', "mri_quant", _quantify_job, paths)
+        finished_job = take_finished_job('mri_quant_job_id')
+        if finished_job is None:
+            display_job_progress('mri_quant_job_id', "正在后台测量3D T1序列...")
+            return None
+        if finished_job.status == FAILED:
+            result = {"success": False, "error": str(finished_job.error)}
+        else:
+            result = finished_job.result
+    results[key] = result
+
+    if not result.get("success"):
+        st.warning(f"3D T1自动测量未完成：{result.get('error')}")
+        return None
+    st.write("**3D T1自动测量（估计值，需医生核对）**")
+    st.dataframe([
+        {"指标": "脑桥正中矢状面面积 (mm²)", "测量值": result["pons_area_mm2"]},
+        {"指标": "中脑正中矢状面面积 (mm²)", "测量值": result["midbrain_area_mm2"]},
+        {"指标": "中脑/脑桥面积比", "测量值": result["midbrain_pons_ratio"]},
+        {"指标": "小脑中脚宽度 (mm)", "测量值": result["mcp_width_mm"]},
+        {"指标": "小脑上脚宽度 (mm)", "测量值": result["scp_width_mm"]},
+        {"指标": "MRPI指数", "测量值": result["mrpi_index"]},
+        {"指标": "脑桥体积估计 (ml)", "测量值": result["pons_volume_ml"]},
+        {"指标": "壳核体积估计 (ml)", "测量值": result["putamen_volume_ml"]},
+    ], use_container_width=True, hide_index=True)
+    for warning in result.get("warnings", []):
+        st.caption(f"⚠️ {warning}")
+    st.caption(f"测量序列：{result.get('series_description') or result.get('series_uid')}，"
+               f"{result.get('slices')}层，用时{result.get('seconds')}秒；下方影像特征已按测量结果预填")
+    return result
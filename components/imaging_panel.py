@@ -0,0 +1,43 @@
+# components/imaging_panel.py
+import streamlit as st
+
+from blob_store import get_blob_store
+
+# 显示时等待后台缩略图生成的最长时间（秒），通常上传后几十毫秒内即已生成
+THUMBNAIL_WAIT_SECONDS = 2.0
+
+
+def store_uploaded_file(uploaded_file, thumbnail=True):
+    """
+    将上传的文件存入内容寻址存储，同一次上传在多次重跑间只读取和哈希一次
+
+    Args:
+        uploaded_file: st.file_uploader返回的UploadedFile
+        thumbnail: 是否在后台生成缩略图
+
+    Returns:
+        str: 内容摘要（会话中只保存摘要）
+    """
+    uploads = st.session_state.setdefault('_blob_uploads', {})
+    upload_key = getattr(uploaded_file, 'file_id', None) or f"{uploaded_file.name}:{uploaded_file.size}"
+    digest = uploads.get(upload_key)
+    if digest is None or not get_blob_store().exists(digest):
+        digest = get_blob_store().put(uploaded_file.getvalue(), thumbnail=thumbnail)
+        uploads[upload_key] = digest
+    return digest
+
+
+def display_blob_image(digest, caption=None, **image_kwargs):
+    """
+    显示已存储影像的缩略图（不解码原图）
+
+    Args:
+        digest: 内容摘要
+        caption: 图片说明
+        image_kwargs: 传给st.image的其他参数（如width、use_column_width）
+    """
+    thumbnail = get_blob_store().thumbnail(digest, timeout=THUMBNAIL_WAIT_SECONDS)
+    if thumbnail is None:
+        st.caption(f"{caption or '影像文件'}（暂无预览）")
+        return
+    st.image(thumbnail, caption=caption, **image_kwargs)
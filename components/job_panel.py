@@ -0,0 +1,77 @@
+# components/job_panel.py
+import streamlit as st
+
+from job_queue import get_job_queue, job_fingerprint
+from components.render_utils import fragment, FRAGMENTS_SUPPORTED
+
+# 后台任务进行中时的轮询间隔（秒）
+JOB_POLL_SECONDS = 1.0
+
+
+def start_job(session_key, kind, func, *inputs):
+    """
+    提交后台评估任务，任务ID保存在st.session_state[session_key]
+
+    Args:
+        session_key: 保存任务ID的会话状态键
+        kind: 任务类型
+        func: 任务函数func(job, *inputs)
+        *inputs: 任务输入，同时用于计算去重指纹
+    """
+    fingerprint = job_fingerprint(kind, *inputs)
+    st.session_state[session_key] = get_job_queue().submit(kind, func, *inputs, fingerprint=fingerprint)
+
+
+def take_finished_job(session_key):
+    """
+    任务已结束时从会话状态移除任务ID并返回任务
+
+    Returns:
+        Job: 已结束的任务，未提交、进行中或已过期时为None
+    """
+    job_id = st.session_state.get(session_key)
+    if job_id is None:
+        return None
+    job = get_job_queue().get(job_id)
+    if job is None or job.finished:
+        st.session_state.pop(session_key, None)
+    if job is None or not job.finished:
+        return None
+    return job
+
+
+def _render_job_progress(session_key, message):
+    job = get_job_queue().get(st.session_state.get(session_key))
+    if job is None:
+        return None
+    if job.progress:
+        st.info(f"{message}\n\n{job.progress}")
+    else:
+        st.info(f"{message}（已用时 {job.elapsed:.0f} 秒）")
+    return job
+
+
+@fragment(run_every=JOB_POLL_SECONDS)
+def _job_progress_fragment(session_key, message):
+    # 只重跑本片段轮询进度，任务结束后整页重跑以读取结果
+    job = _render_job_progress(session_key, message)
+    if job is None or job.finished:
+        st.rerun()
+
+
+def display_job_progress(session_key, message):
+    """
+    显示进行中的后台任务（流式任务显示已生成的文本）；
+    支持fragment时自动轮询，否则提供手动刷新按钮
+
+    Args:
+        session_key: 保存任务ID的会话状态键
+        message: 任务进行中的提示文字
+    """
+    if session_key not in st.session_state:
+        return
+    if FRAGMENTS_SUPPORTED:
+        _job_progress_fragment(session_key, message)
+    else:
+        _render_job_progress(session_key, message)
+        st.button("刷新评估状态", key=f"{session_key}_refresh")
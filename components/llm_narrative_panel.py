@@ -0,0 +1,17 @@
+# components/llm_narrative_panel.py
+import streamlit as st
+from rules_first import get_llm_narrative, is_narrative_pending
+
+def display_llm_narrative(result):
+    """规则优先模式下显示AI补充叙述（不影响规则给出的诊断结论）"""
+    if not result or not result.get('narrative_job'):
+        return
+    
+    with st.expander("AI补充叙述"):
+        narrative = get_llm_narrative(result)
+        if narrative:
+            st.markdown(narrative)
+        elif is_narrative_pending(result):
+            st.info("AI叙述生成中，请稍后刷新页面查看。")
+        else:
+            st.info("暂无AI叙述。")
@@ -0,0 +1,97 @@
+# components/patient_store_panel.py
+import sqlite3
+
+import streamlit as st
+
+from patient_store import get_patient_store, PATIENT_STATE_KEYS
+from components.diagnosis_state import reset_diagnosis_machine
+
+# 步骤1表单中带key的控件，加载患者后需清除以显示数据库中的值
+_STEP1_WIDGET_KEYS = ["birth_date_input"]
+
+
+def save_current_patient(show_message=False):
+    """
+    将当前会话中的患者数据保存到患者数据库（尚未录入姓名时不保存）
+
+    Args:
+        show_message: 是否显示保存成功提示
+
+    Returns:
+        int: 患者ID，未保存时为None
+    """
+    if not st.session_state.get('patient_info', {}).get('name'):
+        return None
+    try:
+        patient_id = get_patient_store().save_patient_state(
+            st.session_state, st.session_state.get('patient_db_id')
+        )
+    except sqlite3.Error as e:
+        st.warning(f"患者记录保存失败: {e}")
+        return None
+    st.session_state.patient_db_id = patient_id
+    if show_message:
+        st.success(f"患者记录已保存（编号 {patient_id}）")
+    return patient_id
+
+
+def load_patient_into_session(patient_id):
+    """从患者数据库加载患者全部步骤数据到会话状态"""
+    state = get_patient_store().load_patient_state(patient_id)
+    for key in PATIENT_STATE_KEYS:
+        if key not in state:
+            st.session_state.pop(key, None)
+    for key in list(st.session_state.keys()):
+        if key.endswith('_checkbox') or key in _STEP1_WIDGET_KEYS:
+            del st.session_state[key]
+    for key, value in state.items():
+        st.session_state[key] = value
+    st.session_state.patient_db_id = patient_id
+    reset_diagnosis_machine()
+
+
+def display_patient_loader():
+    """显示按姓名/编号/诊断标签查找并加载已有患者的面板"""
+    with st.expander("加载已有患者", expanded=False):
+        col1, col2, col3 = st.columns([2, 1, 2])
+        with col1:
+            name = st.text_input("姓名", key="patient_search_name", placeholder="输入姓名（前缀匹配）")
+        with col2:
+            patient_id = st.number_input("患者编号", min_value=0, step=1, key="patient_search_id",
+                                         help="0表示不按编号查找")
+        with col3:
+            diagnosis_tag = st.selectbox("诊断标签", [
+                "全部", "原发性帕金森综合征", "疑似帕金森综合征", "非原发性帕金森综合征",
+                "继发性帕金森综合征", "叠加性帕金森综合征"
+            ], key="patient_search_tag")
+
+        try:
+            patients = get_patient_store().find_patients(
+                name=name.strip() or None,
+                patient_id=int(patient_id) or None,
+                diagnosis_tag=None if diagnosis_tag == "全部" else diagnosis_tag,
+                limit=20
+            )
+        except sqlite3.Error as e:
+            st.warning(f"患者数据库不可用: {e}")
+            return
+
+        if not patients:
+            st.info("未找到匹配的患者")
+            return
+
+        options = {
+            f"{p['patient_id']} - {p['name']}（{p['gender'] or '未知'}，{p['diagnosis_tag'] or '疑似帕金森综合征'}）": p['patient_id']
+            for p in patients
+        }
+        selected = st.selectbox("选择患者", list(options.keys()), key="patient_search_result")
+        if st.button("加载患者", key="load_patient_button"):
+            load_patient_into_session(options[selected])
+            st.rerun()
+
+
+def display_patient_save_button():
+    """在侧边栏显示保存当前患者的按钮"""
+    if st.sidebar.button("保存患者记录", key="sidebar_save_patient"):
+        if save_current_patient() is not None:
+            st.sidebar.success(f"已保存（编号 {st.session_state.patient_db_id}）")
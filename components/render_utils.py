@@ -0,0 +1,57 @@
+# components/render_utils.py
+import functools
+import os
+import time
+from collections import deque
+
+import streamlit as st
+
+from metrics import PAGE_RERUN_SECONDS
+
+# 每个页面保留的重跑耗时记录数
+RERUN_HISTORY_SIZE = 50
+
+
+def _no_fragment(func=None, **kwargs):
+    # 旧版Streamlit没有fragment时退化为普通函数（整页重跑）
+    if func is None:
+        return lambda f: f
+    return func
+
+
+# st.fragment（1.37+）或st.experimental_fragment（1.33-1.36），更早版本退化为普通函数
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or _no_fragment
+FRAGMENTS_SUPPORTED = fragment is not _no_fragment
+
+
+def rerun_app_if(changed):
+    """片段内的输入改变了其他区域依赖的状态时，触发整页重跑以刷新摘要面板和侧边栏"""
+    if changed and FRAGMENTS_SUPPORTED:
+        st.rerun()
+
+
+def timed_rerun(page_name):
+    """
+    记录页面每次整页重跑的耗时（st.session_state.rerun_timings及page_rerun_seconds指标），
+    设置环境变量PD_SHOW_RERUN_TIME=1时在侧边栏显示最近一次耗时与中位数
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                PAGE_RERUN_SECONDS.observe(elapsed_ms / 1000, page=page_name)
+                timings = st.session_state.setdefault('rerun_timings', {})
+                history = timings.setdefault(page_name, deque(maxlen=RERUN_HISTORY_SIZE))
+                history.append(elapsed_ms)
+                if os.getenv('PD_SHOW_RERUN_TIME'):
+                    ordered = sorted(history)
+                    st.sidebar.caption(
+                        f"⏱ {page_name} 本次重跑 {elapsed_ms:.1f} ms，"
+                        f"最近{len(ordered)}次中位数 {ordered[len(ordered) // 2]:.1f} ms"
+                    )
+        return wrapper
+    return decorator
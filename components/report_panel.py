@@ -0,0 +1,70 @@
+# components/report_panel.py
+import streamlit as st
+
+from blob_store import get_blob_store
+from job_queue import FAILED
+from components.imaging_panel import store_uploaded_file
+from components.job_panel import start_job, take_finished_job, display_job_progress
+
+
+def _extract_job(job, digest):
+    # 延迟导入：pypdf/pytesseract只在实际提取时加载
+    from report_extract import run_extraction
+    job.progress = "正在后台识别报告文字..."
+    # 未缓存时返回进程池的Future，任务队列不占用工作线程等待提取
+    return run_extraction(get_blob_store().path(digest), digest)
+
+
+def prefill_report_result(uploaded_file, result_key):
+    """
+    在后台提取上传报告的文字，完成后预填到对应的“检查结果”文本框
+
+    须在文本框（key=result_key）创建之前调用；每份报告只预填一次，且不覆盖已输入的内容。
+
+    Args:
+        uploaded_file: st.file_uploader返回的报告文件（可为None）
+        result_key: 检查结果文本框的key（如"bladder_result"）
+
+    Returns:
+        str: 报告的内容摘要，未上传时为None
+    """
+    if uploaded_file is None:
+        st.session_state.pop(f"{result_key}_extract_error", None)
+        return None
+    from report_extract import cached_report_text
+
+    digest = store_uploaded_file(uploaded_file, thumbnail=not uploaded_file.name.lower().endswith('.pdf'))
+    prefilled = st.session_state.setdefault('_report_prefilled', {})
+    if prefilled.get(result_key) == digest:
+        return digest
+
+    job_key = f"{result_key}_extract_job_id"
+    result = cached_report_text(digest)
+    if result is None:
+        if st.session_state.get(f"{result_key}_extract_digest") != digest or job_key not in st.session_state:
+            st.session_state[f"{result_key}_extract_digest"] = digest
+            start_job(job_key, "report_text", _extract_job, digest)
+        finished_job = take_finished_job(job_key)
+        if finished_job is None:
+            display_job_progress(job_key, "正在后台识别报告文字...")
+            return digest
+        if finished_job.status == FAILED:
+            result = {"success": False, "error": str(finished_job.error)}
+        else:
+            result = finished_job.result
+
+    prefilled[result_key] = digest
+    if not result.get("success"):
+        st.session_state[f"{result_key}_extract_error"] = result.get("error")
+        return digest
+    st.session_state.pop(f"{result_key}_extract_error", None)
+    if not st.session_state.get(result_key):
+        st.session_state[result_key] = result["summary"]
+    return digest
+
+
+def display_extract_status(result_key):
+    """显示报告文字提取失败的原因（提取成功时不显示）"""
+    error = st.session_state.get(f"{result_key}_extract_error")
+    if error:
+        st.caption(f"未能自动识别报告文字：{error}")
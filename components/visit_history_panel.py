@@ -0,0 +1,55 @@
+# components/visit_history_panel.py
+import sqlite3
+
+import streamlit as st
+
+from visit_engine import save_visit, load_timeline, timeline_frame
+from components.patient_store_panel import save_current_patient
+
+STEP_LABELS = {
+    "history": "病史",
+    "updrs": "UPDRS",
+    "exclusion": "绝对排除标准",
+    "blood": "血检",
+    "step4": "步骤4汇总",
+    "step5": "步骤5",
+    "diagnosis_tag": "诊断标签",
+}
+
+
+def display_visit_history():
+    """显示保存本次随访按钮与随访时间序列"""
+    st.subheader("随访记录")
+
+    if st.button("保存本次随访", use_container_width=True):
+        patient_id = save_current_patient()
+        if patient_id is not None:
+            try:
+                visit = save_visit(patient_id, st.session_state)
+            except sqlite3.Error as e:
+                st.warning(f"随访保存失败: {e}")
+            else:
+                recomputed = "、".join(STEP_LABELS[step] for step in visit["recomputed"]) or "无（全部复用）"
+                st.success(f"已保存第 {visit['visit_no']} 次随访，重新评估的步骤：{recomputed}")
+
+    patient_id = st.session_state.get('patient_db_id')
+    if patient_id is None:
+        st.info("保存患者记录后可查看随访历史")
+        return
+
+    try:
+        visits, recomputed_count = load_timeline(patient_id)
+    except sqlite3.Error as e:
+        st.warning(f"随访记录读取失败: {e}")
+        return
+
+    if not visits:
+        st.info("暂无随访记录")
+        return
+
+    timeline = timeline_frame(visits)
+    st.dataframe(timeline, use_container_width=True, hide_index=True)
+    if timeline["UPDRS总分"].notna().sum() > 1:
+        st.line_chart(timeline.set_index("随访")[["UPDRS总分", "强直评分"]])
+    if recomputed_count:
+        st.caption(f"规则版本已更新，重新评估了 {recomputed_count} 个步骤")
@@ -1,18 +1,73 @@
 # deepseek_client.py
-import requests
+import asyncio
 import json
 import os
+import re
+import threading
+import time
+from llm_cache import get_default_cache, get_default_single_flight, make_cache_key
+from resilience import get_default_resilient_caller, is_retryable, backoff_delay
+from metrics import (
+    DEEPSEEK_REQUEST_SECONDS, DEEPSEEK_TOKENS, DEEPSEEK_JSON_PARSE_FAILURES, record_assessment
+)
+from result_schema import decode_json, parse_llm_result, conforms
+
+# 单次DeepSeek请求的超时（秒）
+REQUEST_TIMEOUT = 30
 
 class DeepSeekClient:
-    def __init__(self, api_key=None, base_url="https://api.deepseek.com/v1"):
+    def __init__(self, api_key=None, base_url="https://api.deepseek.com/v1",
+                 pool_size=None, max_per_host=None, keep_alive=None, cache=None, single_flight=None,
+                 resilience=None):
         self.api_key = api_key or os.getenv('DEEPSEEK_API_KEY')
         self.base_url = base_url
         self.headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.api_key}'
         }
+        self._pool_config = {
+            "pool_maxsize": pool_size,
+            "max_per_host": max_per_host,
+            "keep_alive": keep_alive
+        }
+        self._http_pool = None
+        # 内容寻址的响应缓存，相同输入的重复评估无需再次付费调用
+        self.cache = cache if cache is not None else get_default_cache()
+        # 请求合并：多个会话并发提交相同输入（如默认模板）时只发起一次在途请求
+        self.single_flight = single_flight if single_flight is not None else get_default_single_flight()
+        # 弹性层：429/5xx退避重试、慢请求对冲、熔断（熔断时评估函数立即使用回退结果）
+        self.resilience = resilience if resilience is not None else get_default_resilient_caller()
+    
+    @property
+    def http_pool(self):
+        """进程内共享的keep-alive连接池，避免每次调用重新进行TCP+TLS握手（首次请求时才导入requests并创建）"""
+        if self._http_pool is None:
+            from http_pool import get_shared_pool
+            self._http_pool = get_shared_pool(**self._pool_config)
+        return self._http_pool
+    
+    def get_pool_stats(self):
+        """获取连接池统计信息（复用率、等待次数、打开的socket数等）"""
+        return self.http_pool.get_stats()
+    
+    def get_cache_stats(self):
+        """获取响应缓存统计信息（命中、未命中、淘汰等）"""
+        return self.cache.get_stats()
+    
+    def get_coalesce_stats(self):
+        """获取请求合并统计信息（实际请求数、被合并的调用数等）"""
+        return self.single_flight.get_stats()
+    
+    def flight_wait_timeout(self):
+        """等待相同请求的在途调用的上限：leader含重试与退避的最长耗时，避免等待者超时后重复付费调用"""
+        return self.resilience.max_call_seconds(REQUEST_TIMEOUT)
+    
+    def get_resilience_stats(self):
+        """获取弹性层统计信息（重试、对冲次数和熔断器状态）"""
+        return self.resilience.get_stats()
     
-    def call_deepseek(self, system_prompt, user_prompt, model="deepseek-chat", temperature=0.1):
+    def call_deepseek(self, system_prompt, user_prompt, model="deepseek-chat", temperature=0.1, use_cache=True,
+                      schema=None):
         """
         调用DeepSeek API
         
@@ -21,60 +76,507 @@ class DeepSeekClient:
             user_prompt: 用户提示词
             model: 模型名称
             temperature: 温度参数
+            use_cache: 是否使用响应缓存
+            schema: 结果结构（result_schema.ResultSchema），给出时内容不符合结构的响应不写入缓存
             
         Returns:
             dict: 包含API响应和解析后的数据
         """
+        cache_key = make_cache_key(model, temperature, system_prompt, user_prompt)
+        if use_cache and self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                cached["cached"] = True
+                return cached
+        
+        def fetch():
+            result = self.resilience.call(
+                lambda on_sent: self._call_api(system_prompt, user_prompt, model, temperature, on_sent)
+            )
+            # 只缓存成功且符合结构的响应，失败时下次仍会重试
+            if use_cache and self.cache is not None and result["success"] \
+                    and (schema is None or conforms(result, schema)):
+                self.cache.set(cache_key, result)
+            return result
+        
+        # 相同提示词的并发调用等待同一次在途请求并共享其结果（等待上限覆盖leader的全部重试）
+        result, coalesced = self.single_flight.do(cache_key, fetch, wait_timeout=self.flight_wait_timeout())
+        if coalesced:
+            result["coalesced"] = True
+        return result
+    
+    def _call_api(self, system_prompt, user_prompt, model, temperature, on_sent=None):
+        """实际发起一次DeepSeek API请求（记录往返耗时）"""
+        start = time.perf_counter()
+        result = self._request_chat(system_prompt, user_prompt, model, temperature, on_sent)
+        observe_request("sync", start, result)
+        return result
+    
+    def _request_chat(self, system_prompt, user_prompt, model, temperature, on_sent=None):
         try:
-            payload = {
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "temperature": temperature,
-                "response_format": {"type": "json_object"}
-            }
+            payload = build_chat_payload(system_prompt, user_prompt, model, temperature)
             
-            response = requests.post(
+            response = self.http_pool.post(
                 f"{self.base_url}/chat/completions",
                 headers=self.headers,
                 json=payload,
-                timeout=30
+                timeout=REQUEST_TIMEOUT,
+                on_sent=on_sent
             )
             
             if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
+                return parse_chat_completion(response.json())
+            else:
+                return {
+                    "success": False,
+                    "error": f"API调用失败: {response.status_code}",
+                    "details": response.text,
+                    "status_code": response.status_code,
+                    "retry_after": response.headers.get("Retry-After")
+                }
                 
-                # 尝试解析JSON响应
-                try:
-                    parsed_content = json.loads(content)
-                    return {
-                        "success": True,
-                        "raw_response": result,
-                        "parsed_content": parsed_content,
-                        "content": content
-                    }
-                except json.JSONDecodeError:
-                    return {
-                        "success": True,
-                        "raw_response": result,
-                        "parsed_content": {"response": content},
-                        "content": content
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"请求异常: {str(e)}",
+                "connect_error": is_connect_error(e)
+            }
+
+    def stream_deepseek(self, system_prompt, user_prompt, field="assessment", fallback=None,
+                        model="deepseek-chat", temperature=0.1, use_cache=True, assessor=None, schema=None):
+        """
+        以SSE流式方式调用DeepSeek API，边接收边输出指定的叙述字段
+        
+        Args:
+            system_prompt: 系统提示词
+            user_prompt: 用户提示词
+            field: 需要流式输出的JSON字符串字段（如assessment、reasoning）
+            fallback: API失败时生成回退结果的无参函数
+            model: 模型名称
+            temperature: 温度参数
+            use_cache: 是否使用响应缓存
+            assessor: 评估名称（updrs/exclusion/blood），用于记录AI/回退来源指标
+            schema: 结果结构（result_schema.ResultSchema），输出不符合且修复失败时使用回退结果
+            
+        Returns:
+            StreamingCompletion: 可迭代的流式结果，迭代结束后通过final_result获取完整评估
+        """
+        return StreamingCompletion(self, system_prompt, user_prompt, field, fallback,
+                                   model, temperature, use_cache, assessor, schema)
+
+def build_chat_payload(system_prompt, user_prompt, model, temperature, stream=False):
+    """构建chat/completions请求体"""
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": temperature,
+        "response_format": {"type": "json_object"}
+    }
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+def observe_request(mode, start, result):
+    """记录一次DeepSeek请求的往返耗时，outcome为success或HTTP状态码/error"""
+    if result["success"]:
+        outcome = "success"
+    else:
+        outcome = str(result.get("status_code") or "error")
+    DEEPSEEK_REQUEST_SECONDS.observe(time.perf_counter() - start, mode=mode, outcome=outcome)
+
+def is_connect_error(exc):
+    """连接未建立（DNS解析失败、拒绝连接、连接超时）的requests异常，此时请求未到达服务端，可安全重试"""
+    try:
+        from requests.exceptions import ConnectTimeout, ConnectionError as RequestsConnectionError
+        from urllib3.exceptions import NewConnectionError
+    except ImportError:
+        return False
+    if isinstance(exc, ConnectTimeout):
+        return True
+    if isinstance(exc, RequestsConnectionError) and exc.args:
+        # requests将urllib3的MaxRetryError包装在args[0]中，其reason为实际的连接异常
+        reason = getattr(exc.args[0], 'reason', exc.args[0])
+        return isinstance(reason, NewConnectionError)
+    return False
+
+def parse_chat_completion(result):
+    """将chat/completions响应转换为统一的结果字典"""
+    content = result['choices'][0]['message']['content']
+    
+    usage = result.get('usage') or {}
+    for kind in ("prompt", "completion"):
+        if usage.get(f"{kind}_tokens"):
+            DEEPSEEK_TOKENS.inc(usage[f"{kind}_tokens"], kind=kind)
+    
+    # 尝试解析JSON响应（必要时本地修复代码块围栏、尾随逗号），结构校验由各评估按其schema进行
+    try:
+        parsed_content, _ = decode_json(content)
+    except ValueError:
+        DEEPSEEK_JSON_PARSE_FAILURES.inc()
+        parsed_content = {"response": content}
+    
+    return {
+        "success": True,
+        "raw_response": result,
+        "parsed_content": parsed_content,
+        "content": content
+    }
+
+class JSONFieldStreamParser:
+    """
+    增量解析尚未接收完整的JSON文本，提取指定字符串字段中已到达的部分
+    """
+    
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+    
+    def __init__(self, field):
+        self.field_pattern = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self.buffer = ""
+        self.position = None
+        self.done = False
+    
+    def feed(self, chunk):
+        """
+        追加一段新收到的文本
+        
+        Returns:
+            str: 本次新解码出的字段文本（可能为空字符串）
+        """
+        self.buffer += chunk
+        if self.done:
+            return ""
+        
+        if self.position is None:
+            match = self.field_pattern.search(self.buffer)
+            if match is None:
+                return ""
+            self.position = match.end()
+        
+        output = []
+        buffer = self.buffer
+        i = self.position
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != '\\':
+                output.append(char)
+                i += 1
+                continue
+            # 转义序列不完整时等待后续数据
+            if i + 1 >= len(buffer):
+                break
+            escape = buffer[i + 1]
+            if escape == 'u':
+                if i + 6 > len(buffer):
+                    break
+                output.append(chr(int(buffer[i + 2:i + 6], 16)))
+                i += 6
+            else:
+                output.append(self._ESCAPES.get(escape, escape))
+                i += 2
+        
+        self.position = i
+        return "".join(output)
+
+class StreamingCompletion:
+    """
+    流式评估结果：迭代时逐段产出叙述字段文本，迭代结束后final_result为完整评估字典
+    """
+    
+    def __init__(self, client, system_prompt, user_prompt, field, fallback,
+                 model, temperature, use_cache, assessor=None, schema=None):
+        self.client = client
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        self.field = field
+        self.fallback = fallback
+        self.model = model
+        self.temperature = temperature
+        self.use_cache = use_cache
+        self.assessor = assessor
+        self.schema = schema
+        # 与call_deepseek返回格式一致的原始结果
+        self.result = None
+        # 解析后的评估内容（失败时为回退结果）
+        self.final_result = None
+    
+    def __iter__(self):
+        client = self.client
+        if self.use_cache and client.cache is not None:
+            cached = client.cache.get(make_cache_key(self.model, self.temperature,
+                                                     self.system_prompt, self.user_prompt))
+            if cached is not None:
+                cached["cached"] = True
+                self.result = cached
+        
+        emitted = False
+        if self.result is None:
+            for text in self._fetch():
+                emitted = True
+                yield text
+        
+        # 缓存命中、合并等待和流式接收的结果同样按结构校验，不符合且修复失败时使用回退结果
+        parsed = None
+        if self.result["success"]:
+            parsed = self.result["parsed_content"]
+            if self.schema is not None:
+                parsed = parse_llm_result(self.result, self.schema, client)
+        if self.assessor is not None:
+            record_assessment(self.assessor, "ai" if parsed is not None else "fallback")
+        if parsed is not None:
+            self.final_result = parsed
+        elif self.fallback is not None:
+            self.final_result = self.fallback()
+        # 未流式输出过的结果（缓存、合并等待或回退）一次性输出其叙述字段
+        if not emitted and self.final_result is not None:
+            narrative = self.final_result.get(self.field, "")
+            if narrative:
+                yield narrative
+    
+    def _fetch(self):
+        """发起（或等待相同提示词的在途）请求，逐段产出叙述字段文本，结束后self.result为完整结果"""
+        client = self.client
+        parser = JSONFieldStreamParser(self.field)
+        # 相同提示词的并发流式调用只发起一次请求，等待者一次性获得完整结果
+        flight_key = make_cache_key(self.model, self.temperature, self.system_prompt, self.user_prompt)
+        call, is_leader = client.single_flight.join(flight_key)
+        shared = None if is_leader else client.single_flight.wait(call, client.flight_wait_timeout())
+        if shared is not None:
+            shared["coalesced"] = True
+            self.result = shared
+            return
+        
+        allowed = client.resilience.breaker.allow()
+        try:
+            if allowed:
+                yield from self._stream_api(parser)
+            else:
+                # 熔断打开时不发起请求，直接使用回退结果
+                self.result = client.resilience.circuit_open_result()
+        finally:
+            if allowed:
+                client.resilience.breaker.record_result(self.result)
+            if is_leader:
+                client.single_flight.finish(flight_key, call, self.result)
+    
+    def _stream_api(self, parser):
+        """发起一次SSE流式请求，逐段产出叙述字段文本，结束后self.result为完整结果"""
+        client = self.client
+        start = time.perf_counter()
+        try:
+            payload = build_chat_payload(self.system_prompt, self.user_prompt,
+                                         self.model, self.temperature, stream=True)
+            response = client.http_pool.post(
+                f"{client.base_url}/chat/completions",
+                headers=client.headers,
+                json=payload,
+                timeout=REQUEST_TIMEOUT,
+                stream=True
+            )
+        
+            # 流式响应须显式关闭，否则中途出错或调用方提前停止读取时连接不会归还连接池
+            with response:
+                if response.status_code != 200:
+                    self.result = {
+                        "success": False,
+                        "error": f"API调用失败: {response.status_code}",
+                        "details": response.text,
+                        "status_code": response.status_code
                     }
+                else:
+                    content_parts = []
+                    usage = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        if chunk.get("usage"):
+                            usage = chunk["usage"]
+                        if not chunk.get("choices"):
+                            continue
+                        delta = chunk["choices"][0].get("delta", {}).get("content") or ""
+                        if not delta:
+                            continue
+                        content_parts.append(delta)
+                        text = parser.feed(delta)
+                        if text:
+                            yield text
+            
+                    content = "".join(content_parts)
+                    raw_response = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+                    if usage is not None:
+                        raw_response["usage"] = usage
+                    self.result = parse_chat_completion(raw_response)
+                    # 只缓存符合结构的输出，不合格的输出下次仍重新请求
+                    if self.use_cache and client.cache is not None \
+                            and (self.schema is None or conforms(self.result, self.schema)):
+                        client.cache.set(make_cache_key(self.model, self.temperature,
+                                                        self.system_prompt, self.user_prompt), self.result)
+        except Exception as e:
+            self.result = {
+                "success": False,
+                "error": f"请求异常: {str(e)}"
+            }
+        observe_request("stream", start, self.result)
+
+class AsyncDeepSeekClient:
+    """
+    asyncio原生的DeepSeek客户端，多个评估可在同一事件循环内并发执行
+    
+    安装了httpx时使用httpx.AsyncClient的异步连接池；否则退化为在线程池中
+    调用同步客户端，仍可并发但每个请求占用一个线程。
+    """
+    
+    def __init__(self, api_key=None, base_url="https://api.deepseek.com/v1",
+                 max_connections=10, timeout=30, cache=None, resilience=None):
+        self.api_key = api_key or os.getenv('DEEPSEEK_API_KEY')
+        self.base_url = base_url
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.api_key}'
+        }
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.cache = cache if cache is not None else get_default_cache()
+        # 与同步客户端共用熔断器，DeepSeek故障时并发评估同样立即回退
+        self.resilience = resilience if resilience is not None else get_default_resilient_caller()
+        self._http = None
+        self._sync_client = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    def _get_http(self):
+        # httpx.AsyncClient绑定创建时的事件循环，因此在首次调用时才创建
+        if self._http is None:
+            try:
+                import httpx
+            except ImportError:
+                return None
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._http
+    
+    async def aclose(self):
+        """关闭底层异步连接池"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+    
+    async def call_deepseek(self, system_prompt, user_prompt, model="deepseek-chat", temperature=0.1, use_cache=True,
+                            schema=None):
+        """
+        异步调用DeepSeek API，返回格式与DeepSeekClient.call_deepseek一致
+        
+        Args:
+            system_prompt: 系统提示词
+            user_prompt: 用户提示词
+            model: 模型名称
+            temperature: 温度参数
+            use_cache: 是否使用响应缓存
+            schema: 结果结构，给出时内容不符合结构的响应不写入缓存
+            
+        Returns:
+            dict: 包含API响应和解析后的数据
+        """
+        cache_key = None
+        if use_cache and self.cache is not None:
+            cache_key = make_cache_key(model, temperature, system_prompt, user_prompt)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                cached["cached"] = True
+                return cached
+        
+        caller = self.resilience
+        if not caller.breaker.allow():
+            return caller.circuit_open_result()
+        for attempt in range(caller.max_retries + 1):
+            result = await self._call_api(system_prompt, user_prompt, model, temperature)
+            if result["success"] or not is_retryable(result) or attempt == caller.max_retries:
+                break
+            await asyncio.sleep(backoff_delay(attempt, caller.base_delay, caller.max_delay,
+                                              result.get("retry_after")))
+        caller.breaker.record_result(result)
+        
+        if cache_key is not None and result["success"] and (schema is None or conforms(result, schema)):
+            self.cache.set(cache_key, result)
+        
+        return result
+    
+    async def _call_api(self, system_prompt, user_prompt, model, temperature):
+        start = time.perf_counter()
+        result = await self._request_chat(system_prompt, user_prompt, model, temperature)
+        observe_request("async", start, result)
+        return result
+    
+    async def _request_chat(self, system_prompt, user_prompt, model, temperature):
+        http = self._get_http()
+        if http is None:
+            if self._sync_client is None:
+                self._sync_client = DeepSeekClient(api_key=self.api_key, base_url=self.base_url, cache=self.cache)
+            return await asyncio.to_thread(self._sync_client._request_chat, system_prompt, user_prompt, model, temperature)
+        
+        try:
+            payload = build_chat_payload(system_prompt, user_prompt, model, temperature)
+            response = await http.post(
+                f"{self.base_url}/chat/completions",
+                headers=self.headers,
+                json=payload
+            )
+            
+            if response.status_code == 200:
+                return parse_chat_completion(response.json())
             else:
                 return {
                     "success": False,
                     "error": f"API调用失败: {response.status_code}",
-                    "details": response.text
+                    "details": response.text,
+                    "status_code": response.status_code,
+                    "retry_after": response.headers.get("Retry-After")
                 }
                 
         except Exception as e:
+            import httpx
             return {
                 "success": False,
-                "error": f"请求异常: {str(e)}"
+                "error": f"请求异常: {str(e)}",
+                # 连接未建立时请求未到达服务端，可安全重试；读取超时不重试
+                "connect_error": isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
             }
 
-# 创建全局客户端实例
-deepseek_client = DeepSeekClient()
\ No newline at end of file
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_deepseek_client():
+    """获取进程级共享的DeepSeek客户端（首次使用时创建，避免导入本模块即初始化缓存和弹性层）"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = DeepSeekClient()
+        return _default_client
+
+
+def __getattr__(name):
+    # 兼容旧写法 from deepseek_client import deepseek_client
+    if name == "deepseek_client":
+        return get_deepseek_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,309 @@
+# diagnosis_machine.py
+"""
+诊断状态机：由类型化事件驱动，按步骤间依赖关系做脏标记，只重算受影响的节点。
+
+状态（诊断标签）：疑似 → 非原发性 / 继发性 / 原发性 / 叠加性；
+撤回证据（如将CT改回"无异常发现"）时可回到疑似。
+
+节点依赖：
+    history ─────────────────────────────┐
+    updrs ───────────────────────────────┤
+    exclusion ───────────────────────────┼─→ tag
+    blood ──┬─→ step4 ───────────────────┤
+    imaging ┘                            │
+    step5 ───────────────────────────────┘
+"""
+from sop_rules import (
+    SECONDARY_HISTORY_KEYS, EXCLUSION_SIGN_KEYS,
+    has_secondary_imaging, derive_step4_result, derive_diagnosis_tag
+)
+
+SUSPECTED = '疑似帕金森综合征'
+NON_PRIMARY = '非原发性帕金森综合征'
+SECONDARY = '继发性帕金森综合征'
+PRIMARY = '原发性帕金森综合征'
+ATYPICAL = '叠加性帕金森综合征'
+DIAGNOSIS_TAGS = [PRIMARY, SUSPECTED, NON_PRIMARY, SECONDARY, ATYPICAL]
+
+# 节点 -> 依赖节点，按拓扑顺序排列
+NODE_DEPENDENCIES = {
+    "history": (),
+    "updrs": (),
+    "exclusion": (),
+    "blood": (),
+    "imaging": (),
+    "step4": ("blood", "imaging"),
+    "step5": (),
+    "tag": ("history", "updrs", "exclusion", "step4", "step5"),
+}
+
+# 记录的状态转移条数上限
+MAX_TRANSITIONS = 50
+
+
+def _downstream_nodes():
+    downstream = {node: set() for node in NODE_DEPENDENCIES}
+    for node, deps in NODE_DEPENDENCIES.items():
+        for dep in deps:
+            downstream[dep].add(node)
+    return downstream
+
+
+_DOWNSTREAM = _downstream_nodes()
+
+
+class DiagnosisEvent:
+    """诊断事件基类：node为事件直接影响的节点，apply将事件写入状态机输入并返回输入是否变化"""
+    node = None
+
+    def apply(self, inputs):
+        raise NotImplementedError
+
+    def _set(self, inputs, key, value):
+        if inputs.get(key) == value:
+            return False
+        inputs[key] = value
+        return True
+
+
+class PatientInfoUpdated(DiagnosisEvent):
+    """步骤1（或步骤3同步回）的病史与体格检查勾选"""
+    node = "history"
+
+    def __init__(self, patient_info):
+        patient_info = patient_info or {}
+        self.flags = {key: bool(patient_info.get(key, False))
+                      for key in SECONDARY_HISTORY_KEYS + EXCLUSION_SIGN_KEYS}
+
+    def apply(self, inputs):
+        return self._set(inputs, "history_flags", self.flags)
+
+
+class UPDRSAssessed(DiagnosisEvent):
+    """步骤2 UPDRS评估完成"""
+    node = "updrs"
+
+    def __init__(self, assessment):
+        self.has_parkinson = assessment['has_parkinson'] if assessment else None
+
+    def apply(self, inputs):
+        return self._set(inputs, "has_parkinson", self.has_parkinson)
+
+
+class ExclusionAssessed(DiagnosisEvent):
+    """步骤3绝对排除标准评估完成"""
+    node = "exclusion"
+
+    def __init__(self, assessment):
+        self.is_primary_parkinson = assessment.get('is_primary_parkinson', False) if assessment else None
+
+    def apply(self, inputs):
+        return self._set(inputs, "is_primary_parkinson", self.is_primary_parkinson)
+
+
+class BloodConditionsConfirmed(DiagnosisEvent):
+    """步骤4血检病因确认（医生校正后的病因列表，未分析时为空列表）"""
+    node = "blood"
+
+    def __init__(self, selected_conditions):
+        self.selected_conditions = list(selected_conditions or [])
+
+    def apply(self, inputs):
+        return self._set(inputs, "selected_conditions", self.selected_conditions)
+
+
+class CTFindingsChanged(DiagnosisEvent):
+    """步骤4颅脑CT发现变化"""
+    node = "imaging"
+
+    def __init__(self, findings):
+        self.findings = list(findings or [])
+
+    def apply(self, inputs):
+        return self._set(inputs, "ct_findings", self.findings)
+
+
+class MRIFindingsChanged(DiagnosisEvent):
+    """步骤4头颅MRI发现变化"""
+    node = "imaging"
+
+    def __init__(self, findings):
+        self.findings = list(findings or [])
+
+    def apply(self, inputs):
+        return self._set(inputs, "mri_findings", self.findings)
+
+
+class Step5Diagnosed(DiagnosisEvent):
+    """步骤5原发性/叠加性辨别完成（None表示撤销）"""
+    node = "step5"
+
+    def __init__(self, diagnosis):
+        self.diagnosis = diagnosis
+
+    def apply(self, inputs):
+        return self._set(inputs, "step5_result", self.diagnosis)
+
+
+def events_from_state(state):
+    """由完整会话状态生成全部事件（新会话或加载已有患者时使用）"""
+    ct_data = state.get('ct_data') or {}
+    mri_data = state.get('mri_data') or {}
+    selected_conditions = state.get('selected_conditions') if state.get('ai_analysis_result') is not None else []
+    return [
+        PatientInfoUpdated(state.get('patient_info')),
+        UPDRSAssessed(state.get('parkinson_assessment')),
+        ExclusionAssessed(state.get('exclusion_assessment')),
+        BloodConditionsConfirmed(selected_conditions),
+        CTFindingsChanged(ct_data.get('findings')),
+        MRIFindingsChanged(mri_data.get('findings')),
+        Step5Diagnosed(state.get('page5_diagnosis_result')),
+    ]
+
+
+def _compute_history(inputs, results):
+    flags = inputs["history_flags"]
+    return {
+        "secondary_history": any(flags.get(key, False) for key in SECONDARY_HISTORY_KEYS),
+        "exclusion_signs": any(flags.get(key, False) for key in EXCLUSION_SIGN_KEYS),
+    }
+
+
+def _compute_blood(inputs, results):
+    selected_conditions = inputs["selected_conditions"]
+    if not selected_conditions:
+        return None
+    return SUSPECTED if "无" in selected_conditions else SECONDARY
+
+
+def _compute_imaging(inputs, results):
+    ct_findings = inputs["ct_findings"]
+    mri_findings = inputs["mri_findings"]
+    return {
+        "secondary": has_secondary_imaging(ct_findings, mri_findings),
+        "completed": bool(ct_findings) and bool(mri_findings),
+    }
+
+
+def _compute_step4(inputs, results):
+    # 与随访记录、批量诊断共用同一判定：血检、CT、MRI三项均完成后才给出结论
+    return derive_step4_result(inputs["selected_conditions"], inputs["ct_findings"], inputs["mri_findings"])
+
+
+def _compute_tag(inputs, results):
+    history = results["history"]
+    return derive_diagnosis_tag(
+        secondary_history=history["secondary_history"],
+        exclusion_signs=history["exclusion_signs"],
+        has_parkinson=results["updrs"],
+        is_primary_parkinson=results["exclusion"],
+        step4_result=results["step4"],
+        step5_result=results["step5"]
+    )
+
+
+_NODE_COMPUTE = {
+    "history": _compute_history,
+    "updrs": lambda inputs, results: inputs["has_parkinson"],
+    "exclusion": lambda inputs, results: inputs["is_primary_parkinson"],
+    "blood": _compute_blood,
+    "imaging": _compute_imaging,
+    "step4": _compute_step4,
+    "step5": lambda inputs, results: inputs["step5_result"],
+    "tag": _compute_tag,
+}
+
+
+class DiagnosisStateMachine:
+    """
+    诊断状态机
+
+    事件只把其直接节点及下游节点标记为脏，evaluate时按拓扑顺序只重算脏节点；
+    节点结果未变化时（node_versions不递增）下游节点不会重算。
+    """
+
+    def __init__(self):
+        self.inputs = {
+            "history_flags": {},
+            "has_parkinson": None,
+            "is_primary_parkinson": None,
+            "selected_conditions": [],
+            "ct_findings": [],
+            "mri_findings": [],
+            "step5_result": None,
+        }
+        self.results = {}
+        self.dirty = set(NODE_DEPENDENCIES)
+        self.node_versions = {node: 0 for node in NODE_DEPENDENCIES}
+        self.recompute_counts = {node: 0 for node in NODE_DEPENDENCIES}
+        self.transitions = []
+        self._pending_events = []
+
+    @classmethod
+    def from_state(cls, state):
+        machine = cls()
+        for event in events_from_state(state):
+            machine.dispatch(event)
+        return machine
+
+    @property
+    def tag(self):
+        return self.evaluate()["tag"]
+
+    def dispatch(self, event):
+        """
+        处理一个事件
+
+        Returns:
+            bool: 输入是否变化（未变化时不标记任何节点）
+        """
+        if not event.apply(self.inputs):
+            return False
+        self._mark_dirty(event.node)
+        self._pending_events.append(type(event).__name__)
+        return True
+
+    def _mark_dirty(self, node):
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current in self.dirty:
+                continue
+            self.dirty.add(current)
+            stack.extend(_DOWNSTREAM[current])
+
+    def evaluate(self):
+        """
+        重算脏节点并返回当前状态
+
+        Returns:
+            dict: tag、history、updrs、exclusion、blood、imaging、step4、step5
+        """
+        if self.dirty:
+            previous_tag = self.results.get("tag")
+            changed = set()
+            for node, deps in NODE_DEPENDENCIES.items():
+                if node not in self.dirty:
+                    continue
+                self.dirty.discard(node)
+                # 依赖节点结果均未变化时无需重算
+                if deps and node in self.results and not any(dep in changed for dep in deps):
+                    continue
+                value = _NODE_COMPUTE[node](self.inputs, self.results)
+                self.recompute_counts[node] += 1
+                if node not in self.results or self.results[node] != value:
+                    self.results[node] = value
+                    self.node_versions[node] += 1
+                    changed.add(node)
+
+            tag = self.results["tag"]
+            if previous_tag is not None and tag != previous_tag:
+                self.transitions.append({
+                    "from": previous_tag,
+                    "to": tag,
+                    "events": list(self._pending_events),
+                })
+                del self.transitions[:-MAX_TRANSITIONS]
+            self._pending_events = []
+        return dict(self.results)
+
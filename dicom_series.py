@@ -0,0 +1,348 @@
+# dicom_series.py
+"""
+DICOM序列读取：上传时只解析文件头（不读取像素数据），按SeriesInstanceUID分组并识别序列类型
+（3D T1、T2 TSE、DWI、FLAIR、SWI、DTI）；像素数据在预览或测量时才按层解码，
+未压缩的小端传输语法直接内存映射文件中的像素数据，数百层的检查也不会一次性读入内存。
+
+pydicom为可选依赖，未安装时无法解析DICOM文件（DICOM_SUPPORTED为False）。
+"""
+import math
+import os
+
+try:
+    import pydicom
+except ImportError:
+    pydicom = None
+
+DICOM_SUPPORTED = pydicom is not None
+
+# 步骤5要求的MRI序列
+SEQUENCE_TYPES = ["3D T1", "T2 TSE", "DWI", "FLAIR", "SWI", "DTI"]
+OTHER_SEQUENCE = "其他"
+
+# 未压缩的小端传输语法（隐式/显式VR），像素数据可直接内存映射
+_MEMMAP_TRANSFER_SYNTAXES = {"1.2.840.10008.1.2", "1.2.840.10008.1.2.1"}
+
+# 解析文件头时超过此大小（字节）的元素只记录位置不读取，像素数据因此不会被读入
+_HEADER_DEFER_SIZE = 1024
+
+_PIXEL_DATA_TAG = 0x7FE00010
+
+# 序列类型识别关键词（匹配SeriesDescription/ProtocolName/SequenceName，不区分大小写）
+_DTI_KEYWORDS = ("dti", "tensor", "mddw")
+_DWI_KEYWORDS = ("dwi", "diff", "trace", "adc")
+_SWI_KEYWORDS = ("swi", "swan", "swip", "venobold", "susceptibility")
+_FLAIR_KEYWORDS = ("flair", "dark_fluid", "darkfluid", "tirm")
+_T1_3D_KEYWORDS = ("mprage", "mp-rage", "mp_rage", "bravo", "fspgr", "spgr", "3d_t1", "3dt1", "t1_3d", "t13d", "tfe")
+_T2_TSE_KEYWORDS = ("tse", "fse", "frfse", "turbo", "blade", "propeller")
+
+
+def is_dicom_bytes(data):
+    """按DICOM Part 10文件前导（第128字节起为"DICM"）判断是否为DICOM文件"""
+    return len(data) >= 132 and data[128:132] == b"DICM"
+
+
+def _first(value, default=None):
+    # 多值元素（如WindowCenter）取第一个值
+    if value is None or value == "":
+        return default
+    if isinstance(value, (list, tuple)) or type(value).__name__ == "MultiValue":
+        return value[0] if len(value) else default
+    return value
+
+
+def _as_float(value, default=None):
+    try:
+        return float(_first(value, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def classify_sequence(description, mr_acquisition_type="", inversion_time=None, b_value=None,
+                      volumes_per_position=1):
+    """
+    根据序列描述与采集参数识别序列类型
+
+    Args:
+        description: SeriesDescription、ProtocolName、SequenceName拼接的文本
+        mr_acquisition_type: MRAcquisitionType（2D/3D）
+        inversion_time: 反转时间（毫秒）
+        b_value: 最大弥散b值
+        volumes_per_position: 每个层面位置的图像数（弥散序列中约等于b值与梯度方向数之和）
+
+    Returns:
+        str: SEQUENCE_TYPES之一，无法识别时为"其他"
+    """
+    text = (description or "").lower()
+
+    def has(keywords):
+        return any(keyword in text for keyword in keywords)
+
+    diffusion = has(_DWI_KEYWORDS) or (b_value or 0) > 0
+    # 弥散张量成像至少6个梯度方向，普通DWI通常只有b0与一个b值（外加trace/ADC）
+    if has(_DTI_KEYWORDS) or (diffusion and volumes_per_position >= 6):
+        return "DTI"
+    if diffusion:
+        return "DWI"
+    if has(_SWI_KEYWORDS):
+        return "SWI"
+    if has(_FLAIR_KEYWORDS) or (inversion_time or 0) >= 1500:
+        return "FLAIR"
+    if has(_T1_3D_KEYWORDS) or ("t1" in text and (mr_acquisition_type or "").upper() == "3D"):
+        return "3D T1"
+    if "t2" in text and has(_T2_TSE_KEYWORDS):
+        return "T2 TSE"
+    return OTHER_SEQUENCE
+
+
+class DicomInstance:
+    """单个DICOM文件的头信息（不含像素数据）"""
+
+    def __init__(self, path, ds):
+        self.path = path
+        self.series_uid = str(ds.get("SeriesInstanceUID", "")) or "unknown"
+        self.study_uid = str(ds.get("StudyInstanceUID", ""))
+        self.series_number = int(_as_float(ds.get("SeriesNumber"), 0))
+        self.series_description = str(ds.get("SeriesDescription", "") or "")
+        self.protocol_name = str(ds.get("ProtocolName", "") or "")
+        self.sequence_name = str(ds.get("SequenceName", "") or "")
+        self.mr_acquisition_type = str(ds.get("MRAcquisitionType", "") or "")
+        self.inversion_time = _as_float(ds.get("InversionTime"))
+        self.b_value = _as_float(ds.get("DiffusionBValue"))
+        self.instance_number = int(_as_float(ds.get("InstanceNumber"), 0))
+        self.rows = int(ds.get("Rows", 0) or 0)
+        self.columns = int(ds.get("Columns", 0) or 0)
+        self.samples_per_pixel = int(ds.get("SamplesPerPixel", 1) or 1)
+        self.bits_allocated = int(ds.get("BitsAllocated", 16) or 16)
+        self.signed = int(ds.get("PixelRepresentation", 0) or 0) == 1
+        self.slope = _as_float(ds.get("RescaleSlope"), 1.0)
+        self.intercept = _as_float(ds.get("RescaleIntercept"), 0.0)
+        self.window_center = _as_float(ds.get("WindowCenter"))
+        self.window_width = _as_float(ds.get("WindowWidth"))
+        self.pixel_spacing = [_as_float(v, 1.0) for v in (ds.get("PixelSpacing") or [1.0, 1.0])][:2]
+        self.slice_thickness = _as_float(ds.get("SliceThickness"), 1.0)
+        orientation = ds.get("ImageOrientationPatient")
+        self.orientation = [float(v) for v in orientation] if orientation is not None and len(orientation) == 6 else None
+        self.slice_position = self._slice_position(ds)
+        self.pixel_offset = self._pixel_offset(ds)
+
+    @staticmethod
+    def _slice_position(ds):
+        # 层面位置 = ImagePositionPatient在层面法向量上的投影，缺失时使用SliceLocation
+        position = ds.get("ImagePositionPatient")
+        orientation = ds.get("ImageOrientationPatient")
+        if position is not None and orientation is not None and len(orientation) == 6:
+            row = [float(v) for v in orientation[:3]]
+            col = [float(v) for v in orientation[3:]]
+            normal = (row[1] * col[2] - row[2] * col[1],
+                      row[2] * col[0] - row[0] * col[2],
+                      row[0] * col[1] - row[1] * col[0])
+            return sum(n * float(p) for n, p in zip(normal, position))
+        return _as_float(ds.get("SliceLocation"))
+
+    def _pixel_offset(self, ds):
+        # 只有未压缩、小端、单通道且长度确定的像素数据才能直接内存映射
+        meta = getattr(ds, "file_meta", None)
+        syntax = str(meta.get("TransferSyntaxUID", "")) if meta is not None else ""
+        if syntax not in _MEMMAP_TRANSFER_SYNTAXES or self.samples_per_pixel != 1:
+            return None
+        if self.bits_allocated not in (8, 16, 32):
+            return None
+        try:
+            # pydicom 3.x的get_item默认会读取延迟的元素值，keep_deferred保持只读位置
+            raw = ds.get_item(_PIXEL_DATA_TAG, keep_deferred=True)
+        except TypeError:
+            raw = ds.get_item(_PIXEL_DATA_TAG)
+        offset = getattr(raw, "value_tell", None)
+        length = getattr(raw, "length", None)
+        expected = self.rows * self.columns * self.bits_allocated // 8
+        if offset is None or length is None or length < expected:
+            return None
+        return offset
+
+    @property
+    def description(self):
+        return " ".join(part for part in (self.series_description, self.protocol_name, self.sequence_name) if part)
+
+
+def read_instance(path):
+    """
+    只解析文件头（像素数据不读入内存）
+
+    Returns:
+        DicomInstance: 头信息，文件不是DICOM或无法解析时为None
+    """
+    if pydicom is None:
+        raise RuntimeError("未安装pydicom，无法解析DICOM文件")
+    try:
+        ds = pydicom.dcmread(path, defer_size=_HEADER_DEFER_SIZE)
+    except Exception:
+        return None
+    if "SOPClassUID" not in ds and "SeriesInstanceUID" not in ds:
+        return None
+    return DicomInstance(path, ds)
+
+
+class DicomSeries:
+    """一个DICOM序列：各层按层面位置排序，像素数据按层延迟解码"""
+
+    def __init__(self, series_uid, instances):
+        self.series_uid = series_uid
+        self.instances = sorted(
+            instances,
+            key=lambda inst: (inst.slice_position is None,
+                              inst.slice_position if inst.slice_position is not None else 0.0,
+                              inst.instance_number)
+        )
+        first = self.instances[0]
+        self.description = first.description
+        self.series_number = first.series_number
+        self.sequence_type = classify_sequence(
+            first.description, first.mr_acquisition_type, first.inversion_time,
+            max((inst.b_value or 0) for inst in self.instances),
+            len(self.instances) / max(1, len({inst.slice_position for inst in self.instances}))
+        )
+
+    def __len__(self):
+        return len(self.instances)
+
+    @property
+    def shape(self):
+        first = self.instances[0]
+        return (len(self.instances), first.rows, first.columns)
+
+    @property
+    def spacing(self):
+        """
+        Returns:
+            tuple: (层间距, 行间距, 列间距)，单位毫米
+        """
+        first = self.instances[0]
+        positions = [inst.slice_position for inst in self.instances if inst.slice_position is not None]
+        if len(positions) >= 2:
+            slice_spacing = abs(positions[-1] - positions[0]) / (len(positions) - 1) or first.slice_thickness
+        else:
+            slice_spacing = first.slice_thickness
+        return (slice_spacing, first.pixel_spacing[0], first.pixel_spacing[1])
+
+    def raw_slice(self, index):
+        """
+        第index层的原始像素（未压缩时为只读内存映射，否则由pydicom解码）
+
+        Returns:
+            numpy.ndarray: 形状为(rows, columns)
+        """
+        import numpy as np
+        instance = self.instances[index]
+        if instance.pixel_offset is not None:
+            dtype = np.dtype(f"{'i' if instance.signed else 'u'}{instance.bits_allocated // 8}").newbyteorder('<')
+            return np.memmap(instance.path, dtype=dtype, mode='r', offset=instance.pixel_offset,
+                             shape=(instance.rows, instance.columns))
+        pixels = pydicom.dcmread(instance.path).pixel_array
+        # 多通道数据预览时取第一个通道
+        return pixels[..., 0] if pixels.ndim == 3 else pixels
+
+    def slice_array(self, index, step=1):
+        """
+        第index层换算后的像素值（float32，已应用RescaleSlope/Intercept）
+
+        Args:
+            step: 行列方向的采样步长，大于1时只读取被采样的像素
+        """
+        import numpy as np
+        instance = self.instances[index]
+        pixels = np.asarray(self.raw_slice(index)[::step, ::step], dtype=np.float32)
+        if instance.slope != 1.0 or instance.intercept != 0.0:
+            pixels = pixels * instance.slope + instance.intercept
+        return pixels
+
+    def preview(self, index=None, size=256):
+        """
+        窗宽窗位调整并降采样后的预览图
+
+        Args:
+            index: 层号，默认中间层
+            size: 预览图最长边的上限（像素）
+
+        Returns:
+            numpy.ndarray: uint8灰度图
+        """
+        import numpy as np
+        if index is None:
+            index = len(self.instances) // 2
+        instance = self.instances[index]
+        step = max(1, math.ceil(max(instance.rows, instance.columns) / size))
+        pixels = self.slice_array(index, step)
+        if instance.window_center is not None and instance.window_width:
+            low = instance.window_center - instance.window_width / 2
+            high = instance.window_center + instance.window_width / 2
+        else:
+            low, high = np.percentile(pixels, (1, 99)) if pixels.size else (0.0, 1.0)
+        if high <= low:
+            high = low + 1
+        return (np.clip((pixels - low) / (high - low), 0, 1) * 255).astype(np.uint8)
+
+    def volume(self):
+        """
+        按层读取并堆叠为三维体数据（层, 行, 列），float32
+
+        Returns:
+            numpy.ndarray: 体数据
+        """
+        import numpy as np
+        depth, rows, columns = self.shape
+        volume = np.empty((depth, rows, columns), dtype=np.float32)
+        for index in range(depth):
+            volume[index] = self.slice_array(index)
+        return volume
+
+    def summary(self):
+        """序列概要（用于页面表格）"""
+        depth, rows, columns = self.shape
+        return {
+            "序列号": self.series_number,
+            "序列描述": self.description or "（无描述）",
+            "类型": self.sequence_type,
+            "层数": depth,
+            "矩阵": f"{rows}×{columns}",
+            "可内存映射": all(inst.pixel_offset is not None for inst in self.instances),
+        }
+
+
+def build_series_index(paths):
+    """
+    解析一组文件的头信息并按序列分组
+
+    Args:
+        paths: DICOM文件路径列表
+
+    Returns:
+        tuple: ({SeriesInstanceUID: DicomSeries}, 无法解析的文件路径列表)
+    """
+    grouped = {}
+    skipped = []
+    for path in paths:
+        instance = read_instance(path) if os.path.exists(path) else None
+        if instance is None:
+            skipped.append(path)
+            continue
+        grouped.setdefault(instance.series_uid, []).append(instance)
+    series = {uid: DicomSeries(uid, instances) for uid, instances in grouped.items()}
+    return series, skipped
+
+
+def missing_sequences(series):
+    """返回SEQUENCE_TYPES中尚未上传的序列类型"""
+    found = {item.sequence_type for item in series.values()}
+    return [sequence_type for sequence_type in SEQUENCE_TYPES if sequence_type not in found]
+
+
+def find_series(series, sequence_type):
+    """
+    返回指定类型中层数最多的序列
+
+    Returns:
+        DicomSeries: 未找到时为None
+    """
+    candidates = [item for item in series.values() if item.sequence_type == sequence_type]
+    return max(candidates, key=len) if candidates else None
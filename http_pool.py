@@ -0,0 +1,251 @@
+# http_pool.py
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 当前线程正在发起的请求的on_sent回调（由SharedHTTPPool.post设置）
+_request_hooks = threading.local()
+# 保护连接的归属标记，避免中止已归还连接池、正被其他请求复用的连接
+_owner_lock = threading.Lock()
+
+
+def _abort_connection(conn, owner):
+    """关闭仍属于owner请求的连接的socket，使阻塞在读取响应上的线程立即出错返回"""
+    with _owner_lock:
+        if getattr(conn, '_pd_owner', None) is not owner:
+            return False
+        sock = getattr(conn, 'sock', None)
+        if sock is None:
+            return False
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            return False
+        return True
+
+
+def _counting_pool_class(base_class, on_new_connection):
+    """创建一个在新建连接时回调计数、取出连接时通知请求已发出的连接池类"""
+
+    class CountingConnectionPool(base_class):
+        def _new_conn(self):
+            on_new_connection()
+            return super()._new_conn()
+
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout)
+            on_sent = getattr(_request_hooks, 'on_sent', None)
+            if on_sent is not None:
+                # 已通过单主机并发限制并取得连接，请求即将写出
+                owner = object()
+                with _owner_lock:
+                    conn._pd_owner = owner
+                on_sent(lambda: _abort_connection(conn, owner))
+            return conn
+
+        def _put_conn(self, conn):
+            if conn is not None:
+                with _owner_lock:
+                    conn._pd_owner = None
+            return super()._put_conn(conn)
+
+    return CountingConnectionPool
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """带单主机并发限制和复用统计的HTTPAdapter"""
+
+    def __init__(self, pool_connections=4, pool_maxsize=10, max_per_host=10,
+                 keep_alive=True, keepalive_idle=60, pool_block=True, max_retries=0):
+        self.max_per_host = max_per_host
+        self.keep_alive = keep_alive
+        self.keepalive_idle = keepalive_idle
+
+        self._stats_lock = threading.Lock()
+        self._host_limits = {}
+        self._requests = 0
+        self._new_connections = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._in_flight = 0
+
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                         max_retries=max_retries, pool_block=pool_block)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        # 开启TCP keep-alive，避免空闲连接被中间设备静默断开
+        if self.keep_alive:
+            socket_options = list(pool_kwargs.pop('socket_options', []) or [])
+            socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive_idle))
+            if hasattr(socket, 'TCP_KEEPINTVL'):
+                socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10))
+            pool_kwargs['socket_options'] = HTTPConnection.default_socket_options + socket_options
+
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool_class(HTTPConnectionPool, self._on_new_connection),
+            'https': _counting_pool_class(HTTPSConnectionPool, self._on_new_connection),
+        }
+
+    def _on_new_connection(self):
+        with self._stats_lock:
+            self._new_connections += 1
+
+    def _host_semaphore(self, url):
+        host = urlparse(url).netloc
+        with self._stats_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def send(self, request, **kwargs):
+        if not self.keep_alive:
+            request.headers['Connection'] = 'close'
+
+        semaphore = self._host_semaphore(request.url)
+
+        # 达到单主机并发上限时计为一次等待
+        if not semaphore.acquire(blocking=False):
+            start = time.perf_counter()
+            semaphore.acquire()
+            with self._stats_lock:
+                self._waits += 1
+                self._wait_seconds += time.perf_counter() - start
+
+        with self._stats_lock:
+            self._requests += 1
+            self._in_flight += 1
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+            semaphore.release()
+
+    def _count_idle_sockets(self):
+        """统计连接池中空闲且仍保持连接的socket数量"""
+        idle = 0
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            queue = getattr(pool, 'pool', None)
+            if queue is None:
+                continue
+            for conn in list(queue.queue):
+                if conn is not None and getattr(conn, 'sock', None) is not None:
+                    idle += 1
+        return idle
+
+    def get_stats(self):
+        """返回连接池统计信息"""
+        with self._stats_lock:
+            requests_count = self._requests
+            new_connections = self._new_connections
+            waits = self._waits
+            wait_seconds = self._wait_seconds
+            in_flight = self._in_flight
+
+        reused = max(requests_count - new_connections, 0)
+        idle_sockets = self._count_idle_sockets()
+
+        return {
+            "requests": requests_count,
+            "new_connections": new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": reused / requests_count if requests_count else 0.0,
+            "waits": waits,
+            "total_wait_seconds": wait_seconds,
+            "in_flight": in_flight,
+            "idle_sockets": idle_sockets,
+            "open_sockets": idle_sockets + in_flight,
+            "pool_maxsize": self._pool_maxsize,
+            "max_per_host": self.max_per_host,
+            "keep_alive": self.keep_alive,
+        }
+
+
+class SharedHTTPPool:
+    """进程内共享的HTTP连接池，所有Streamlit会话复用同一组keep-alive连接"""
+
+    def __init__(self, pool_connections=4, pool_maxsize=10, max_per_host=10,
+                 keep_alive=True, keepalive_idle=60):
+        self.adapter = InstrumentedHTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_per_host=max_per_host,
+            keep_alive=keep_alive,
+            keepalive_idle=keepalive_idle,
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def post(self, url, on_sent=None, **kwargs):
+        """
+        发起POST请求
+
+        Args:
+            url: 请求地址
+            on_sent: 取得连接、请求即将写出时的回调on_sent(abort)，abort()可中止该请求（用于对冲请求）
+        """
+        _request_hooks.on_sent = on_sent
+        try:
+            return self.session.post(url, **kwargs)
+        finally:
+            _request_hooks.on_sent = None
+
+    def get_stats(self):
+        return self.adapter.get_stats()
+
+    def close(self):
+        self.session.close()
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def default_pool_config():
+    """从环境变量读取连接池配置"""
+    return {
+        'pool_connections': int(os.getenv('DEEPSEEK_POOL_CONNECTIONS', 4)),
+        'pool_maxsize': int(os.getenv('DEEPSEEK_POOL_MAXSIZE', 10)),
+        'max_per_host': int(os.getenv('DEEPSEEK_POOL_PER_HOST', 10)),
+        'keep_alive': os.getenv('DEEPSEEK_KEEP_ALIVE', '1') not in ('0', 'false', 'False'),
+        'keepalive_idle': int(os.getenv('DEEPSEEK_KEEPALIVE_IDLE', 60)),
+    }
+
+
+def get_shared_pool(**config):
+    """
+    获取（或创建）进程级共享连接池，相同配置返回同一实例
+
+    Args:
+        config: 覆盖默认配置的连接池参数
+
+    Returns:
+        SharedHTTPPool: 共享连接池
+    """
+    merged = default_pool_config()
+    merged.update({k: v for k, v in config.items() if v is not None})
+    key = tuple(sorted(merged.items()))
+
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is None:
+            pool = SharedHTTPPool(**merged)
+            _shared_pools[key] = pool
+        return pool
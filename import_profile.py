@@ -0,0 +1,155 @@
+# import_profile.py
+"""
+冷启动导入耗时检查：在独立子进程中用 python -X importtime 导入各应用模块和页面脚本，
+统计累计导入耗时，并检查启动路径上的模块没有在导入时加载pandas、numpy、requests等重型依赖
+（这些依赖应在首次使用时按需导入，客户端、分析器通过get_*()在首次使用时创建）。
+
+页面脚本按Streamlit运行时的方式执行模块顶层（不调用main），streamlit本身视为已导入，只统计页面新增的导入；
+检查页面需要安装streamlit。
+
+用法：
+    python import_profile.py [--budget-ms 250] [--top 10] [--module 其他模块 ...]
+
+任一模块超出耗时预算、导入了重型依赖或导入失败时以退出码1结束，可直接用于CI检查启动回退。
+tests/test_import_time.py 在pytest中对同一组模块和页面执行相同的检查。
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# 启动路径上的模块：页面导入这些模块时不应加载重型依赖
+STARTUP_MODULES = [
+    "deepseek_client", "updrs_dia", "aec_dia", "ai_blood_analysis", "assessment_runner",
+    "rules_first", "result_schema", "prompt_builder", "metrics", "llm_cache", "resilience",
+    "patient_store", "job_queue", "visit_engine", "diagnosis_machine", "sop_rules",
+]
+
+# 启动路径上的页面脚本（相对于本文件所在目录）
+STARTUP_PAGES = [
+    os.path.join("pages", "步骤2：识别PDS.py"),
+    os.path.join("pages", "步骤4：识别原发性与继发性PDS.py"),
+    os.path.join("pages", "管理：运行指标.py"),
+]
+
+# 页面脚本的加载代码：先导入streamlit（运行时已加载），输出分隔标记后再执行页面模块顶层
+_PAGE_MARKER = "-- page import start --"
+_PAGE_LOADER = (
+    "import sys, importlib.util, streamlit\n"
+    "sys.stderr.write({marker!r} + '\\n')\n"
+    "spec = importlib.util.spec_from_file_location('page', {path!r})\n"
+    "spec.loader.exec_module(importlib.util.module_from_spec(spec))\n"
+)
+
+# 只允许按需导入的重型依赖（含其子模块）
+HEAVY_MODULES = ("pandas", "numpy", "requests", "urllib3", "httpx", "pyarrow")
+
+
+def profile_import(module):
+    """
+    在新的解释器中导入模块（或执行页面脚本的模块顶层）并解析 -X importtime 输出
+
+    Args:
+        module: 模块名，或以.py结尾的页面脚本路径
+
+    Returns:
+        dict: {"module", "ok", "error", "cumulative_ms", "entries": [(模块, 自身ms, 累计ms), ...]}
+    """
+    is_page = module.endswith(".py")
+    code = _PAGE_LOADER.format(marker=_PAGE_MARKER, path=module) if is_page else f"import {module}"
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, env=env
+    )
+    entries = []
+    page_total = 0.0
+    started = not is_page
+    for line in proc.stderr.splitlines():
+        if line == _PAGE_MARKER:
+            started = True
+            continue
+        if not started or not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+        # 页面没有自身的导入记录，累计耗时为其直接导入（不缩进的行）之和
+        if name.startswith(" ") and not name.startswith("   "):
+            page_total += int(cumulative_us) / 1000
+
+    if is_page:
+        cumulative = page_total
+    else:
+        cumulative = next((cum for name, _, cum in entries if name == module), 0.0)
+    error = None
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"退出码{proc.returncode}"
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": error,
+        "cumulative_ms": cumulative,
+        "entries": entries,
+    }
+
+
+def heavy_imports(entries):
+    """返回导入过程中加载的重型依赖（顶层包名）"""
+    found = set()
+    for name, _, _ in entries:
+        top = name.split(".")[0]
+        if top in HEAVY_MODULES:
+            found.add(top)
+    return sorted(found)
+
+
+def check_modules(modules, budget_ms):
+    """
+    逐个检查模块的导入耗时与重型依赖
+
+    Returns:
+        tuple: (各模块报告列表, 失败说明列表)
+    """
+    reports = []
+    failures = []
+    for module in modules:
+        report = profile_import(module)
+        report["heavy"] = heavy_imports(report["entries"])
+        reports.append(report)
+        if not report["ok"]:
+            failures.append(f"{module}: 导入失败（{report['error']}）")
+            continue
+        if report["heavy"]:
+            failures.append(f"{module}: 导入时加载了重型依赖 {', '.join(report['heavy'])}")
+        if report["cumulative_ms"] > budget_ms:
+            failures.append(f"{module}: 导入耗时 {report['cumulative_ms']:.1f} ms 超出预算 {budget_ms:.0f} ms")
+    return reports, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="应用模块冷启动导入耗时检查")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("PD_IMPORT_BUDGET_MS", 250)),
+                        help="单个模块累计导入耗时预算（毫秒）")
+    parser.add_argument("--top", type=int, default=5, help="每个模块显示自身耗时最高的导入数")
+    parser.add_argument("--module", action="append", default=[], help="额外检查的模块（或.py页面脚本）")
+    args = parser.parse_args(argv)
+
+    reports, failures = check_modules(STARTUP_MODULES + STARTUP_PAGES + args.module, args.budget_ms)
+    for report in reports:
+        status = "OK" if report["ok"] and not report["heavy"] else "FAIL"
+        print(f"[{status}] {report['module']}: {report['cumulative_ms']:.1f} ms")
+        slowest = sorted(report["entries"], key=lambda entry: entry[1], reverse=True)[:args.top]
+        for name, self_ms, cumulative_ms in slowest:
+            print(f"    {name:<40} 自身 {self_ms:7.1f} ms  累计 {cumulative_ms:7.1f} ms")
+
+    if failures:
+        print("\n启动检查未通过：")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print(f"\n全部 {len(reports)} 个模块通过（预算 {args.budget_ms:.0f} ms，未加载重型依赖）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# job_queue.py
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from patient_store import encode_state_value
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """一个后台评估任务，progress为流式任务已生成的文本"""
+
+    def __init__(self, job_id, kind, fingerprint):
+        self.job_id = job_id
+        self.kind = kind
+        self.fingerprint = fingerprint
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.progress = ""
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.shared = 0
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+def job_fingerprint(kind, *values):
+    """
+    由任务类型和输入内容计算任务指纹，输入相同的任务指纹相同
+
+    Args:
+        kind: 任务类型（如"updrs"、"blood"）
+        *values: 任务输入（DataFrame、dict等）
+
+    Returns:
+        str: SHA-256十六进制指纹
+    """
+    payload = json.dumps([kind] + [encode_state_value(value) for value in values],
+                         ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def stream_job(stream_func):
+    """
+    将流式评估包装为任务函数：生成的文本逐段写入job.progress，结束后返回final_result
+
+    Args:
+        stream_func: 返回可迭代且带final_result属性的流式评估对象的函数
+    """
+    def run(job, *args, **kwargs):
+        stream = stream_func(*args, **kwargs)
+        for text in stream:
+            job.progress += text
+        return stream.final_result
+    return run
+
+
+class JobQueue:
+    """
+    进程级后台任务队列：评估在工作线程中执行，Streamlit脚本线程只保存任务ID并轮询状态。
+
+    指纹相同且尚未结束的任务共享同一次执行（如重复点击按钮）；已结束的任务不再复用，
+    避免不同会话共享同一个可变的结果对象。
+    已完成的任务在retention_seconds内保留，供后续轮询读取结果。
+    任务函数返回Future时（如提交到进程池的计算）工作线程立即释放，Future完成时任务结束。
+    """
+
+    def __init__(self, max_workers=4, retention_seconds=1800):
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pd-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._by_fingerprint = {}
+        self._submitted = 0
+        self._deduplicated = 0
+
+    def submit(self, kind, func, *args, fingerprint=None, **kwargs):
+        """
+        提交任务
+
+        Args:
+            kind: 任务类型
+            func: 任务函数，第一个参数为Job（用于写入progress），其余为args/kwargs；
+                  返回Future时以Future的结果作为任务结果
+            fingerprint: 任务指纹，为None时不去重
+
+        Returns:
+            str: 任务ID（去重时为进行中的已有任务的ID）
+        """
+        with self._lock:
+            self._prune()
+            if fingerprint is not None:
+                existing = self._jobs.get(self._by_fingerprint.get(fingerprint))
+                if existing is not None and not existing.finished:
+                    existing.shared += 1
+                    self._deduplicated += 1
+                    return existing.job_id
+
+            job = Job(uuid.uuid4().hex, kind, fingerprint)
+            self._jobs[job.job_id] = job
+            if fingerprint is not None:
+                self._by_fingerprint[fingerprint] = job.job_id
+            self._submitted += 1
+
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job.job_id
+
+    def _run(self, job, func, args, kwargs):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            result = func(job, *args, **kwargs)
+        except Exception as e:
+            self._finish(job, error=e)
+            return
+        if isinstance(result, Future):
+            # 不占用工作线程等待进程池，由Future完成回调结束任务
+            result.add_done_callback(self._finish_future(job))
+        else:
+            self._finish(job, result=result)
+
+    def _finish_future(self, job):
+        def done(future):
+            try:
+                self._finish(job, result=future.result())
+            except Exception as e:
+                self._finish(job, error=e)
+        return done
+
+    @staticmethod
+    def _finish(job, result=None, error=None):
+        if error is None:
+            job.result = result
+            job.status = DONE
+        else:
+            job.error = str(error)
+            job.status = FAILED
+        job.finished_at = time.time()
+
+    def _prune(self):
+        # 调用方已持有锁
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._by_fingerprint.get(job.fingerprint) == job_id:
+                del self._by_fingerprint[job.fingerprint]
+
+    def get(self, job_id):
+        """
+        获取任务
+
+        Returns:
+            Job: 任务对象，不存在或已过期时为None
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_stats(self):
+        """获取队列统计（各状态任务数、提交数、去重数）"""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return {
+                **counts,
+                "submitted": self._submitted,
+                "deduplicated": self._deduplicated,
+            }
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """获取进程级共享的任务队列（工作线程数来自环境变量PD_JOB_WORKERS）"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(
+                max_workers=int(os.getenv('PD_JOB_WORKERS', 4)),
+                retention_seconds=int(os.getenv('PD_JOB_RETENTION', 1800))
+            )
+        return _job_queue
@@ -0,0 +1,179 @@
+# lab_reference.py
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from lab_utils import create_default_lab_data
+
+# 与继发性帕金森综合征相关的血检条件
+# (条件, 检测名称, 判定方式, 异常项目描述)
+# 判定方式：positive —— 结果为"阳性"；low —— 低于参考下限；high —— 高于参考上限；out_of_range —— 超出参考区间
+LAB_CONDITION_RULES = [
+    ("syphilis", ["梅毒抗体"], "positive", "梅毒抗体阳性"),
+    ("hiv", ["HIV抗体"], "positive", "HIV抗体阳性"),
+    ("electrolyte", ["钠(Na)"], "low", "低钠血症"),
+    ("thyroid", ["游离T3(FT3)"], "high", "甲状腺功能亢进(FT3升高)"),
+    ("parathyroid", ["甲状旁腺激素(PTH)"], "out_of_range", "甲状旁腺功能异常"),
+    ("liver", ["谷丙转氨酶(ALT)", "谷草转氨酶(AST)", "总胆红素(TBIL)"], "high", "肝功能异常"),
+]
+
+# LIS导出的参考值常带单位（如"135-145 mmol/L"、"0~40U/L"、"<40 U/L"），数值后允许跟一段非数字开头的单位
+_UNIT = r'(?:\s*[^\s\d.\-~～—–<>≤≥].*?)?'
+_RANGE_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*[-~～—–]\s*(-?\d+(?:\.\d+)?)' + _UNIT + r'\s*$')
+_UPPER_PATTERN = re.compile(r'^\s*(?:<|≤|<=)\s*(-?\d+(?:\.\d+)?)' + _UNIT + r'\s*$')
+_LOWER_PATTERN = re.compile(r'^\s*(?:>|≥|>=)\s*(-?\d+(?:\.\d+)?)' + _UNIT + r'\s*$')
+
+_FLAG_BY_RULE = {
+    "positive": "is_positive",
+    "low": "is_low",
+    "high": "is_high",
+    "out_of_range": "is_out_of_range",
+}
+
+
+@lru_cache(maxsize=1024)
+def parse_reference_range(text):
+    """
+    解析参考值字符串
+
+    Args:
+        text: 如"135-145"、"135-145 mmol/L"、"<5"、">3"、"阴性"
+
+    Returns:
+        tuple: (下限, 上限, 定性期望值)，数值缺失的一侧为NaN，数值型参考值的定性期望值为None
+    """
+    text = str(text).strip()
+    match = _RANGE_PATTERN.match(text)
+    if match:
+        return float(match.group(1)), float(match.group(2)), None
+    match = _UPPER_PATTERN.match(text)
+    if match:
+        return np.nan, float(match.group(1)), None
+    match = _LOWER_PATTERN.match(text)
+    if match:
+        return float(match.group(1)), np.nan, None
+    return np.nan, np.nan, (text or None)
+
+
+def _has_bounds(text):
+    # 参考值能否解析出数值上下限（至少一侧）
+    if not isinstance(text, str):
+        return False
+    low, high, _ = parse_reference_range(text)
+    return not (np.isnan(low) and np.isnan(high))
+
+
+@lru_cache(maxsize=1)
+def default_reference_values():
+    """默认血检模板中的参考值（上传数据缺少参考值时使用）"""
+    template = create_default_lab_data()
+    return dict(zip(template['名称'], template['参考值']))
+
+
+@lru_cache(maxsize=64)
+def compile_reference_table(reference_texts):
+    """
+    将一组参考值字符串编译为区间表
+
+    Args:
+        reference_texts: 参考值字符串元组（去重后）
+
+    Returns:
+        DataFrame: 以参考值字符串为索引，包含low/high/expected列
+    """
+    parsed = [parse_reference_range(text) for text in reference_texts]
+    return pd.DataFrame(parsed, index=pd.Index(reference_texts, name='参考值'),
+                        columns=['low', 'high', 'expected'])
+
+
+def evaluate_lab_data(lab_data, patient_column=None):
+    """
+    向量化评估血检数据（单名患者或多名患者堆叠）
+
+    Args:
+        lab_data: 包含名称、结果、参考值列的DataFrame
+        patient_column: 多名患者堆叠时的患者ID列名
+
+    Returns:
+        DataFrame: 每个检测项目一行，包含数值结果、参考区间及is_low/is_high/is_positive/is_out_of_range/is_abnormal标记
+    """
+    names = lab_data['名称'].astype(str)
+    raw_results = lab_data['结果']
+    result_text = raw_results.where(raw_results.notna(), '').astype(str).str.strip()
+
+    # 参考值缺失时回退到默认模板中的参考值
+    if '参考值' in lab_data.columns:
+        references = lab_data['参考值'].where(lab_data['参考值'].notna(), '').astype(str)
+    else:
+        references = pd.Series('', index=lab_data.index)
+    missing = references.str.strip() == ''
+    if missing.any():
+        references = references.mask(missing, names.map(default_reference_values()).fillna(''))
+
+    table = compile_reference_table(tuple(pd.unique(references)))
+
+    # 数值型项目的参考值无法解析出界限时同样回退到模板参考值，避免异常结果因NaN比较而被判为正常
+    unparsed = references.map(table['low'].isna() & table['high'].isna())
+    if unparsed.any():
+        template = names.map(default_reference_values())
+        fallback = unparsed & template.map(_has_bounds).astype(bool)
+        if fallback.any():
+            references = references.mask(fallback, template)
+            table = compile_reference_table(tuple(pd.unique(references)))
+
+    low = references.map(table['low']).astype(float)
+    high = references.map(table['high']).astype(float)
+    expected = references.map(table['expected'])
+
+    values = pd.to_numeric(result_text.mask(result_text == ''), errors='coerce')
+
+    flags = pd.DataFrame({
+        '名称': names,
+        '结果': result_text,
+        'value': values,
+        'low': low,
+        'high': high,
+    }, index=lab_data.index)
+    if patient_column is not None:
+        flags.insert(0, patient_column, lab_data[patient_column])
+
+    # NaN参与比较时结果为False，与原先"无法解析则忽略"的行为一致
+    flags['is_low'] = (values < low).to_numpy()
+    flags['is_high'] = (values > high).to_numpy()
+    flags['is_out_of_range'] = flags['is_low'] | flags['is_high']
+    flags['is_positive'] = (result_text == '阳性').to_numpy()
+    qualitative_mismatch = expected.notna() & (result_text != '') & (result_text != expected)
+    flags['is_abnormal'] = flags['is_out_of_range'] | qualitative_mismatch.to_numpy()
+    return flags
+
+
+def derive_lab_conditions(lab_data, patient_column=None):
+    """
+    根据参考区间推导与继发性帕金森综合征相关的血检条件
+
+    Args:
+        lab_data: 血检数据DataFrame（或evaluate_lab_data的输出）
+        patient_column: 多名患者堆叠时的患者ID列名
+
+    Returns:
+        DataFrame: 每名患者一行，每个条件一列（布尔值）；单名患者时索引为0
+    """
+    flags = lab_data if 'is_abnormal' in lab_data.columns else evaluate_lab_data(lab_data, patient_column)
+    if patient_column is None:
+        keys = pd.Series(0, index=flags.index)
+    else:
+        keys = flags[patient_column]
+    patients = pd.unique(keys)
+
+    conditions = {}
+    for condition, item_names, rule, _ in LAB_CONDITION_RULES:
+        matched = flags['名称'].isin(item_names) & flags[_FLAG_BY_RULE[rule]]
+        conditions[condition] = matched.groupby(keys).any().reindex(patients, fill_value=False)
+    return pd.DataFrame(conditions, index=pd.Index(patients))
+
+
+def abnormal_items_from_conditions(conditions):
+    """将单名患者的条件（Series或dict）转换为异常项目描述列表"""
+    return [label for condition, _, _, label in LAB_CONDITION_RULES if conditions[condition]]
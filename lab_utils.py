@@ -0,0 +1,68 @@
+# lab_utils.py
+
+def create_default_lab_data():
+    """创建默认的血检数据表格"""
+    # 按需导入pandas，页面导入本模块时不加载
+    import pandas as pd
+    default_data = {
+        '项目': ['传染病筛查', '传染病筛查', '肝功能', '肝功能', '肝功能', '肾功能', '肾功能', 
+                '电解质', '电解质', '电解质', '电解质', '甲状腺功能', '甲状腺功能', '甲状腺功能', '甲状旁腺功能'],
+        '名称': ['梅毒抗体', 'HIV抗体', '谷丙转氨酶(ALT)', '谷草转氨酶(AST)', '总胆红素(TBIL)', 
+                '肌酐(Cr)', '尿素氮(BUN)', '钠(Na)', '钾(K)', '氯(Cl)', '钙(Ca)', 
+                '游离T3(FT3)', '游离T4(FT4)', '促甲状腺激素(TSH)', '甲状旁腺激素(PTH)'],
+        '结果': ['', '', '', '', '', '', '', '', '', '', '', '', '', '', ''],
+        '单位': ['阴性/阳性', '阴性/阳性', 'U/L', 'U/L', 'umol/L', 'umol/L', 'mmol/L', 
+                'mmol/L', 'mmol/L', 'mmol/L', 'mmol/L', 'pmol/L', 'pmol/L', 'mIU/L', 'pg/mL'],
+        '参考值': ['阴性', '阴性', '0-40', '0-40', '3.4-20.5', '44-133', '2.5-7.1', 
+                 '135-145', '3.5-5.5', '96-106', '2.1-2.7', '3.5-6.5', '11.5-22.7', '0.3-5.0', '15-65']
+    }
+    return pd.DataFrame(default_data)
+
+# 血检CSV的必需列
+REQUIRED_LAB_COLUMNS = ['项目', '名称', '结果', '单位', '参考值']
+
+# 检测名称中必须出现的关键词
+REQUIRED_LAB_ITEMS = ['梅毒', 'HIV', '肝功能', '肾功能', '电解质', '甲状腺功能', '甲状旁腺']
+
+def validate_uploaded_csv(df):
+    """验证上传的CSV文件格式"""
+    required_columns = REQUIRED_LAB_COLUMNS
+    
+    # 检查是否包含所有必需列
+    if not all(col in df.columns for col in required_columns):
+        return False, f"CSV文件必须包含以下列: {', '.join(required_columns)}"
+    
+    # 检查关键检测项目是否存在（肝功能、电解质等为项目分类，梅毒、HIV等出现在检测名称中）
+    existing_names = (df['项目'].astype(str) + ' ' + df['名称'].astype(str)).values
+    
+    missing_items = []
+    for item in REQUIRED_LAB_ITEMS:
+        # 检查项目或名称中是否包含关键词
+        if not any(item in name for name in existing_names):
+            missing_items.append(item)
+    
+    if missing_items:
+        return False, f"缺少以下关键检测项目: {', '.join(missing_items)}"
+    
+    return True, "文件格式正确"
+
+def missing_items_by_patient(df, patient_column):
+    """
+    按validate_uploaded_csv的关键项目规则，向量化检查多名患者堆叠的血检数据
+
+    Args:
+        df: 多名患者堆叠的血检数据
+        patient_column: 患者ID列名
+
+    Returns:
+        Series: 患者ID -> 缺少的关键检测项目列表（按患者首次出现的顺序）
+    """
+    import pandas as pd
+    names = df['项目'].astype(str) + ' ' + df['名称'].astype(str)
+    keys = df[patient_column]
+    present = pd.DataFrame({
+        item: names.str.contains(item, regex=False).groupby(keys, sort=False).any()
+        for item in REQUIRED_LAB_ITEMS
+    })
+    missing = [[item for item, found in zip(REQUIRED_LAB_ITEMS, row) if not found] for row in present.to_numpy()]
+    return pd.Series(missing, index=present.index, dtype=object)
@@ -0,0 +1,190 @@
+# lis_ingest.py
+"""
+检验信息系统（LIS）长格式导出文件的流式导入：按块读取多名患者的血检结果，
+逐名患者校验关键检测项目（与步骤4上传校验相同的规则）并用规则进行血检分析，内存占用只与块大小有关。
+
+输入为CSV，每行一个检测结果，除患者ID列外需包含步骤4的列：
+
+    患者ID, 项目, 名称, 结果, 单位, 参考值
+
+同一患者的行须在文件中连续（LIS按标本/患者导出时通常如此）；
+已处理过的患者在文件后部再次出现时，这些行计入out_of_order_rows并被忽略。
+
+用法：
+    python lis_ingest.py lis_export.csv --output lis_results.jsonl [--patient-column 患者ID] [--encoding gbk]
+
+输出JSONL每行一名患者：{"patient_id", "lab_rows", "blood", "errors"}，同时作为断点：
+重新运行时跳过已写入的患者。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+from ai_blood_analysis import BloodTestAnalyzer
+from batch_diagnosis import load_completed_ids
+from lab_utils import REQUIRED_LAB_COLUMNS, missing_items_by_patient
+
+# 每块读取的行数
+DEFAULT_CHUNK_ROWS = 200_000
+
+
+def read_lis_chunks(path, patient_column, chunk_rows=DEFAULT_CHUNK_ROWS, sep=',', encoding='utf-8'):
+    """
+    按块读取LIS导出文件，只读取需要的列且全部按字符串读取（不做类型推断）
+
+    Returns:
+        TextFileReader: 逐块产生DataFrame的迭代器
+    """
+    columns = [patient_column] + REQUIRED_LAB_COLUMNS
+    header = pd.read_csv(path, nrows=0, sep=sep, encoding=encoding).columns
+    missing = [column for column in columns if column not in header]
+    if missing:
+        raise ValueError(f"LIS导出文件缺少以下列: {', '.join(missing)}")
+    return pd.read_csv(path, sep=sep, encoding=encoding, usecols=columns,
+                       dtype={column: str for column in columns}, keep_default_na=False,
+                       chunksize=chunk_rows)
+
+
+def iter_patient_blocks(chunks, patient_column):
+    """
+    将读取块重新切分为只包含完整患者的数据块：每块末尾的患者可能延续到下一块，留待与下一块合并
+
+    Args:
+        chunks: DataFrame迭代器
+        patient_column: 患者ID列名
+
+    Yields:
+        DataFrame: 其中每名患者的行均已完整
+    """
+    carry = None
+    for chunk in chunks:
+        if carry is not None and len(carry):
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        keys = chunk[patient_column].to_numpy()
+        other_rows = (keys != keys[-1]).nonzero()[0]
+        tail_start = other_rows[-1] + 1 if len(other_rows) else 0
+        carry = chunk.iloc[tail_start:]
+        if tail_start:
+            yield chunk.iloc[:tail_start]
+    if carry is not None and len(carry):
+        yield carry
+
+
+def analyze_block(block, patient_column, analyzer):
+    """
+    校验并分析一个数据块中的全部患者
+
+    Args:
+        block: 只包含完整患者的数据块
+        patient_column: 患者ID列名
+        analyzer: BloodTestAnalyzer
+
+    Returns:
+        list: 每名患者的结果（按在文件中出现的顺序）
+    """
+    keys = block[patient_column]
+    row_counts = keys.value_counts(sort=False)
+    missing = missing_items_by_patient(block, patient_column)
+    valid_ids = missing.index[missing.map(len) == 0]
+    blood = analyzer.analyze_many(block[keys.isin(valid_ids)], patient_column) if len(valid_ids) else {}
+
+    results = []
+    for patient_id, missing_items in missing.items():
+        errors = [f"lab: 缺少以下关键检测项目: {', '.join(missing_items)}"] if missing_items else []
+        results.append({
+            "patient_id": patient_id,
+            "lab_rows": int(row_counts[patient_id]),
+            "blood": blood.get(patient_id),
+            "errors": errors,
+        })
+    return results
+
+
+def run_ingest(input_path, output_path, patient_column='患者ID', chunk_rows=DEFAULT_CHUNK_ROWS,
+               sep=',', encoding='utf-8'):
+    """
+    流式导入LIS导出文件并逐名患者分析
+
+    Args:
+        input_path: LIS导出的长格式CSV
+        output_path: JSONL输出路径（同时作为断点文件）
+        patient_column: 患者ID列名
+        chunk_rows: 每块读取的行数
+        sep: 分隔符
+        encoding: 文件编码
+
+    Returns:
+        dict: 运行统计
+    """
+    completed = load_completed_ids(output_path)
+    analyzer = BloodTestAnalyzer()
+    chunks = read_lis_chunks(input_path, patient_column, chunk_rows, sep=sep, encoding=encoding)
+
+    stats = {"rows": 0, "processed": 0, "invalid": 0, "out_of_order_rows": 0}
+    seen = set(completed)
+    skipped = set()
+    start = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        for block in iter_patient_blocks(chunks, patient_column):
+            stats["rows"] += len(block)
+            keys = block[patient_column]
+            block_ids = pd.unique(keys)
+            repeated = [patient_id for patient_id in block_ids if patient_id in seen]
+            if repeated:
+                # 断点中已完成的患者整块跳过；其余为文件中不连续的患者
+                repeated_rows = keys.isin(repeated)
+                resumed = keys.isin(completed)
+                skipped.update(set(repeated) & completed)
+                stats["out_of_order_rows"] += int((repeated_rows & ~resumed).sum())
+                block = block[~repeated_rows]
+            seen.update(block_ids)
+            if not len(block):
+                continue
+
+            for result in analyze_block(block, patient_column, analyzer):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                stats["processed"] += 1
+                if result["errors"]:
+                    stats["invalid"] += 1
+            # 每块落盘后才算完成，保证中断后可从断点继续
+            out.flush()
+            os.fsync(out.fileno())
+
+            elapsed = time.perf_counter() - start
+            print(f"已读取 {stats['rows']} 行，已处理 {stats['processed']} 名患者"
+                  f"（{stats['rows'] / elapsed * 60:,.0f} 行/分钟）", file=sys.stderr)
+
+    stats["skipped"] = len(skipped)
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LIS长格式血检导出文件的流式导入与分析")
+    parser.add_argument("input", help="LIS导出的CSV文件")
+    parser.add_argument("--output", default="lis_results.jsonl", help="JSONL输出路径（同时作为断点）")
+    parser.add_argument("--patient-column", default="患者ID", help="患者ID列名")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="每块读取的行数")
+    parser.add_argument("--sep", default=",", help="分隔符")
+    parser.add_argument("--encoding", default="utf-8", help="文件编码（如gbk）")
+    args = parser.parse_args(argv)
+
+    try:
+        stats = run_ingest(args.input, args.output, patient_column=args.patient_column,
+                           chunk_rows=args.chunk_rows, sep=args.sep, encoding=args.encoding)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print(f"完成：读取 {stats['rows']} 行，处理 {stats['processed']} 名，跳过 {stats['skipped']} 名，"
+          f"未通过校验 {stats['invalid']} 名，不连续的行 {stats['out_of_order_rows']} 行，"
+          f"用时 {stats['elapsed']:.1f} 秒", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
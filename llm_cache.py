@@ -0,0 +1,255 @@
+# llm_cache.py
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(model, temperature, system_prompt, user_prompt):
+    """根据(模型, 温度, 系统提示词, 用户提示词)计算内容寻址的缓存键"""
+    payload = json.dumps(
+        [model, float(temperature), system_prompt, user_prompt],
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    LLM响应缓存：内存LRU层（带TTL）+ 可选的SQLite磁盘层（重启后仍有效）
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "writes": 0,
+        }
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, expires_at REAL, value TEXT)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        """
+        查询缓存
+
+        Returns:
+            dict或None: 命中时返回缓存结果的副本
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return copy.deepcopy(value)
+                del self._memory[key]
+                self._stats["expirations"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, value FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    expires_at, raw_value = row
+                    if expires_at > now:
+                        value = json.loads(raw_value)
+                        self._put_memory(key, expires_at, value)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return copy.deepcopy(value)
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._stats["expirations"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        """写入缓存（内存层与磁盘层）"""
+        expires_at = time.time() + self.ttl_seconds
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._put_memory(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                    (key, expires_at, json.dumps(value, ensure_ascii=False))
+                )
+                self._db.commit()
+            self._stats["writes"] += 1
+
+    def _put_memory(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        """清空所有缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def get_stats(self):
+        """返回命中/未命中/淘汰等统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["disk_enabled"] = self._db is not None
+        return stats
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight:
+    """
+    请求合并（single-flight）：同一键的并发调用中只有第一个（leader）实际执行，
+    其余调用等待其完成并共享结果的副本
+    """
+
+    def __init__(self, wait_timeout=60):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"leaders": 0, "coalesced": 0, "wait_timeouts": 0}
+
+    def join(self, key):
+        """
+        加入键对应的调用
+
+        Returns:
+            tuple: (call, is_leader)，leader执行完成后必须调用finish
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self._stats["leaders"] += 1
+                return call, True
+            return call, False
+
+    def finish(self, key, call, result):
+        """leader完成调用，唤醒所有等待者"""
+        # 保存副本，leader的调用方修改返回值不影响等待者
+        call.result = copy.deepcopy(result)
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def wait(self, call, timeout=None):
+        """
+        等待leader的结果
+
+        Args:
+            call: join返回的调用
+            timeout: 等待上限（秒），为None时使用wait_timeout；应不短于leader含重试的最长耗时
+
+        Returns:
+            结果副本，leader异常退出或等待超时时为None（调用方应自行执行，计为一次实际执行）
+        """
+        if not call.done.wait(self.wait_timeout if timeout is None else timeout):
+            with self._lock:
+                self._stats["wait_timeouts"] += 1
+                self._stats["leaders"] += 1
+            return None
+        if call.result is None:
+            with self._lock:
+                self._stats["leaders"] += 1
+            return None
+        # 只有实际拿到leader结果的等待者才计为被合并的调用
+        with self._lock:
+            self._stats["coalesced"] += 1
+        return copy.deepcopy(call.result)
+
+    def do(self, key, func, wait_timeout=None):
+        """
+        执行func，同一键的并发调用共享一次执行
+
+        Args:
+            key: 请求键
+            func: 实际执行的函数
+            wait_timeout: 等待在途调用的上限（秒），为None时使用wait_timeout
+
+        Returns:
+            tuple: (结果, 是否为合并得到的结果)
+        """
+        call, is_leader = self.join(key)
+        if not is_leader:
+            result = self.wait(call, wait_timeout)
+            if result is not None:
+                return result, True
+            return func(), False
+        result = None
+        try:
+            result = func()
+        finally:
+            self.finish(key, call, result)
+        return result, False
+
+    def get_stats(self):
+        """获取合并统计（实际执行数、被合并的调用数、进行中的键数）"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        total = stats["leaders"] + stats["coalesced"]
+        stats["coalesce_ratio"] = stats["coalesced"] / total if total else 0.0
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+_default_single_flight = SingleFlight()
+
+
+def get_default_cache():
+    """获取进程级共享的默认响应缓存（配置来自环境变量）"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(
+                max_entries=int(os.getenv('DEEPSEEK_CACHE_SIZE', 256)),
+                ttl_seconds=int(os.getenv('DEEPSEEK_CACHE_TTL', 3600)),
+                db_path=os.getenv('DEEPSEEK_CACHE_DB') or None
+            )
+        return _default_cache
+
+
+def get_default_single_flight():
+    """获取进程级共享的请求合并器，所有会话的相同请求共享一次在途调用"""
+    return _default_single_flight
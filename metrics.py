@@ -0,0 +1,240 @@
+# metrics.py
+"""
+进程内轻量指标注册表：计数器与直方图，可导出为Prometheus文本格式或JSON。
+
+指标在模块级定义，各模块直接导入使用，例如：
+    DEEPSEEK_REQUEST_SECONDS.observe(1.2, mode="sync", outcome="success")
+    with ASSESSMENT_SECONDS.time(assessor="updrs"):
+        ...
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认直方图分桶（秒），覆盖毫秒级页面重跑到数十秒的DeepSeek请求
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_key, extra=()):
+    items = list(label_key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in items) + "}"
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """只增计数器，按标签组合分别计数"""
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def snapshot(self):
+        """
+        Returns:
+            list: [{"labels": {...}, "value": 数值}, ...]
+        """
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in sorted(self._values.items())]
+
+    def prometheus_lines(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_number(value)}" for key, value in items]
+
+
+class Histogram:
+    """固定分桶直方图，按标签组合分别记录分桶计数、总和与次数"""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录with块的执行耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """
+        Returns:
+            list: [{"labels", "buckets": {上界: 非累计次数}, "sum", "count", "mean"}, ...]
+        """
+        with self._lock:
+            items = [(key, dict(series, counts=list(series["counts"])))
+                     for key, series in sorted(self._series.items())]
+        return [{
+            "labels": dict(key),
+            "buckets": {_format_number(bound): count for bound, count in zip(self.buckets, series["counts"])},
+            "sum": series["sum"],
+            "count": series["count"],
+            "mean": series["sum"] / series["count"] if series["count"] else 0.0,
+        } for key, series in items]
+
+    def prometheus_lines(self):
+        with self._lock:
+            items = [(key, list(series["counts"]), series["sum"], series["count"])
+                     for key, series in sorted(self._series.items())]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标只创建一次"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric_class, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, help_text, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def to_prometheus(self):
+        """导出为Prometheus文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: {指标名: {"type", "help", "series": [...]}}
+        """
+        return {
+            metric.name: {"type": metric.kind, "help": metric.help_text, "series": metric.snapshot()}
+            for metric in self.metrics()
+        }
+
+    def dump_json(self, path=None):
+        """
+        将当前指标写入本地JSON文件
+
+        Args:
+            path: 文件路径，为None时使用环境变量PD_METRICS_DUMP（默认data/metrics.json）
+
+        Returns:
+            str: 写入的文件路径
+        """
+        path = path or os.getenv('PD_METRICS_DUMP', os.path.join('data', 'metrics.json'))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"generated_at": time.time(), "metrics": self.to_dict()}, f, ensure_ascii=False, indent=2)
+        return path
+
+
+# 进程级共享的指标注册表
+registry = MetricsRegistry()
+
+DEEPSEEK_REQUEST_SECONDS = registry.histogram(
+    "deepseek_request_seconds", "DeepSeek请求往返耗时（秒），按mode（sync/async/stream）和outcome区分")
+DEEPSEEK_TOKENS = registry.counter(
+    "deepseek_tokens_total", "DeepSeek消耗的token数（来自响应usage），按kind（prompt/completion）区分")
+DEEPSEEK_JSON_PARSE_FAILURES = registry.counter(
+    "deepseek_json_parse_failures_total", "DeepSeek响应内容无法解析为JSON的次数")
+ASSESSMENTS = registry.counter(
+    "assessments_total", "评估次数，按assessor（updrs/exclusion/blood）和source（ai/fallback/rules_first/rules）区分")
+ASSESSMENT_SECONDS = registry.histogram(
+    "assessment_seconds", "评估函数总耗时（秒），按assessor区分")
+PAGE_RERUN_SECONDS = registry.histogram(
+    "page_rerun_seconds", "Streamlit页面整页重跑耗时（秒），按page区分")
+
+
+def record_assessment(assessor, source):
+    """记录一次评估的结果来源（AI、规则回退或规则优先）"""
+    ASSESSMENTS.inc(assessor=assessor, source=source)
+
+
+def timed_assessment(assessor):
+    """装饰评估函数（同步或异步），记录其总耗时到assessment_seconds"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with ASSESSMENT_SECONDS.time(assessor=assessor):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with ASSESSMENT_SECONDS.time(assessor=assessor):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
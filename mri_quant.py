@@ -0,0 +1,483 @@
+# mri_quant.py
+"""
+3D T1 MRI定量测量（仅CPU、仅NumPy）：在内存映射的体数据上估算
+
+    - 正中矢状面脑桥面积P、中脑面积M及中脑/脑桥面积比（蜂鸟征）
+    - 旁矢状面小脑中脚宽度MCP、小脑上脚宽度SCP
+    - MRPI = (P / M) × (MCP / SCP)
+    - 脑桥体积、双侧壳核体积近似值（相对头部体积）
+
+测量基于强度阈值（Otsu）与解剖位置的几何启发式，不做配准与图谱分割，
+结果只用于预填步骤5的MSA/PSP影像特征和MRPI指数，须由医生核对后确认。
+
+每个检查的结果按文件内容摘要缓存在data/mri_quant（环境变量PD_MRI_QUANT_DIR），
+测量在进程池中执行（环境变量PD_MRI_WORKERS，默认1），不占用Streamlit的重跑线程和任务队列的工作线程。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dicom_series import build_series_index, find_series
+from sop_rules import MRPI_THRESHOLD
+
+# 测量方法变化时递增，使旧的缓存结果失效
+PIPELINE_VERSION = 1
+
+# 中脑/脑桥面积比低于此值提示蜂鸟征（文献中PSP约0.12，PD及正常对照约0.21-0.24）
+MIDBRAIN_PONS_RATIO_THRESHOLD = 0.15
+# 小脑中脚宽度低于此值（毫米）提示小脑中脚萎缩（MSA）
+MCP_WIDTH_THRESHOLD_MM = 8.0
+# 壳核体积占头部体积的比例（‰）低于此值提示壳核萎缩；缺少本院正常对照时不预填（环境变量PD_PUTAMEN_PERMILLE_THRESHOLD）
+PUTAMEN_PERMILLE_THRESHOLD = float(os.getenv('PD_PUTAMEN_PERMILLE_THRESHOLD')) \
+    if os.getenv('PD_PUTAMEN_PERMILLE_THRESHOLD') else None
+
+# 解剖位置的几何参数（毫米）
+SEED_BELOW_CENTER_MM = 30       # 脑干种子点位于头部质心下方的距离（约为中脑/脑桥上部）
+BRAINSTEM_HALF_WIDTH_MM = 20    # 脑干区域前后方向半宽
+BRAINSTEM_BELOW_MM = 45         # 脑干区域在种子点下方的范围
+BRAINSTEM_ABOVE_MM = 30         # 脑干区域在种子点上方的范围
+NARROWEST_SEARCH_MM = (15, 10)  # 在种子点下方/上方此范围内寻找脑干最窄处（中脑）
+PONS_SEARCH_MM = 35             # 在最窄处下方此范围内寻找脑桥最宽处
+MIDBRAIN_HEIGHT_MM = 15         # 脑桥-中脑交界以上计入中脑的高度
+MCP_OFFSETS_MM = (14, 16, 18)   # 小脑中脚所在旁矢状面距中线的距离
+MCP_WINDOW_MM = 15              # 小脑中脚上下边界的搜索范围
+SCP_OFFSETS_MM = (4, 5, 6)      # 小脑上脚所在旁矢状面距中线的距离
+SCP_SEARCH_MM = 25              # 脑干后缘向后搜索小脑上脚的范围
+SCP_MAX_MM = 8                  # 超过此宽度视为未分离出小脑上脚
+PONS_HALF_WIDTH_MM = 12         # 脑桥体积计算的左右半宽
+PUTAMEN_OFFSET_MM = (25, -12, 18)     # 壳核中心相对中脑（左右、前后、上下）的位置
+PUTAMEN_HALF_SIZE_MM = (8, 15, 10)    # 壳核测量框半尺寸
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def otsu_threshold(values, bins=256):
+    """Otsu阈值：使两类之间方差最大的阈值"""
+    import numpy as np
+    hist, edges = np.histogram(values, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    weight0 = np.cumsum(hist)
+    weight1 = weight0[-1] - weight0
+    mass0 = np.cumsum(hist * centers)
+    mean0 = mass0 / np.maximum(weight0, 1)
+    mean1 = (mass0[-1] - mass0) / np.maximum(weight1, 1)
+    between = weight0 * weight1 * (mean0 - mean1) ** 2
+    return float(centers[int(np.argmax(between))])
+
+
+def to_lps(volume, spacing, orientation):
+    """
+    将(层, 行, 列)体数据重排为患者坐标LPS顺序(x向左, y向后, z向上)的视图（不复制数据）
+
+    Args:
+        volume: 体数据（可为内存映射）
+        spacing: (层间距, 行间距, 列间距)
+        orientation: ImageOrientationPatient（6个值）
+
+    Returns:
+        tuple: (LPS视图, (sx, sy, sz))
+    """
+    import numpy as np
+    if orientation is None:
+        raise ValueError("缺少ImageOrientationPatient，无法确定方位")
+    row_cosines = orientation[:3]
+    col_cosines = orientation[3:]
+    normal = np.cross(row_cosines, col_cosines)
+    # 层号沿法向量增加（序列按层面位置升序），行号沿列方向余弦，列号沿行方向余弦
+    directions = [normal, np.asarray(col_cosines), np.asarray(row_cosines)]
+    patient_axes = [int(np.argmax(np.abs(direction))) for direction in directions]
+    if sorted(patient_axes) != [0, 1, 2]:
+        raise ValueError("扫描方位倾斜过大，无法对齐到患者坐标轴")
+    order = [patient_axes.index(axis) for axis in range(3)]
+    view = volume.transpose(order)
+    for axis, volume_axis in enumerate(order):
+        if directions[volume_axis][axis] < 0:
+            view = np.flip(view, axis=axis)
+    return view, tuple(spacing[volume_axis] for volume_axis in order)
+
+
+def _flood_fill(mask, seed):
+    # 四邻域区域生长（NumPy迭代膨胀，二维切片上只需数百次迭代）
+    import numpy as np
+    region = np.zeros_like(mask)
+    region[seed] = mask[seed]
+    while True:
+        grown = region.copy()
+        grown[1:] |= region[:-1]
+        grown[:-1] |= region[1:]
+        grown[:, 1:] |= region[:, :-1]
+        grown[:, :-1] |= region[:, 1:]
+        grown &= mask
+        if np.array_equal(grown, region):
+            return region
+        region = grown
+
+
+def _run_length(line, index):
+    """line中包含index的连续True段的长度，以及该段是否触及line的边界"""
+    if not line[index]:
+        return 0, False
+    start = index
+    while start > 0 and line[start - 1]:
+        start -= 1
+    end = index
+    while end < len(line) - 1 and line[end + 1]:
+        end += 1
+    return end - start + 1, start == 0 or end == len(line) - 1
+
+
+def segment_brainstem(parenchyma, head, spacing):
+    """
+    在正中矢状面上分割脑干并划分脑桥、中脑
+
+    Args:
+        parenchyma: 脑实质掩膜（y, z）
+        head: 头部掩膜（y, z）
+        spacing: (sy, sz)
+
+    Returns:
+        dict: {"mask", "pons_rows", "midbrain_rows"}，无法分割时为None
+    """
+    import numpy as np
+    sy, sz = spacing
+    ys, zs = np.nonzero(head)
+    if len(ys) == 0:
+        return None
+    y0, y1 = ys.min(), ys.max()
+    band_lo, band_hi = int(y0 + 0.4 * (y1 - y0)), int(y0 + 0.6 * (y1 - y0))
+    center_z = int(round(zs.mean() - SEED_BELOW_CENTER_MM / sz))
+
+    # 在头部前后方向中部寻找最靠近中央的脑实质作为种子点
+    seed = None
+    for dz in range(0, int(10 / sz) + 1):
+        for z in (center_z - dz, center_z + dz):
+            if not 0 <= z < parenchyma.shape[1]:
+                continue
+            hits = np.nonzero(parenchyma[band_lo:band_hi + 1, z])[0]
+            if len(hits):
+                middle = (band_hi - band_lo) / 2
+                seed = (band_lo + int(hits[np.argmin(np.abs(hits - middle))]), z)
+                break
+        if seed is not None:
+            break
+    if seed is None:
+        return None
+
+    box = np.zeros_like(parenchyma)
+    half_width = int(BRAINSTEM_HALF_WIDTH_MM / sy)
+    box[max(0, seed[0] - half_width):seed[0] + half_width + 1,
+        max(0, seed[1] - int(BRAINSTEM_BELOW_MM / sz)):seed[1] + int(BRAINSTEM_ABOVE_MM / sz) + 1] = True
+    mask = _flood_fill(parenchyma & box, seed)
+
+    # 前后宽度沿上下方向的分布（3毫米滑动平均）
+    kernel = max(1, int(round(3 / sz)))
+    widths = np.convolve(mask.sum(axis=0).astype(float), np.ones(kernel) / kernel, mode='same')
+
+    # 中脑是脑桥与间脑之间最窄的一段；脑桥为其下方最宽处
+    lo = max(0, seed[1] - int(NARROWEST_SEARCH_MM[0] / sz))
+    hi = min(len(widths), seed[1] + int(NARROWEST_SEARCH_MM[1] / sz) + 1)
+    candidates = [z for z in range(lo, hi) if widths[z] > 0]
+    if not candidates:
+        return None
+    narrowest = min(candidates, key=lambda z: widths[z])
+    search_lo = max(0, narrowest - int(PONS_SEARCH_MM / sz))
+    peak = search_lo + int(np.argmax(widths[search_lo:narrowest + 1]))
+    if widths[peak] <= widths[narrowest]:
+        return None
+
+    # 脑桥上下界：自最宽处向上/向下，宽度已明显减小且不再继续减小处（脑桥-中脑、脑桥-延髓交界）
+    def boundary(step):
+        z = peak
+        while 0 <= z + step < len(widths) and widths[z + step] > 0:
+            if widths[z + step] >= widths[z] and widths[z] < 0.85 * widths[peak]:
+                break
+            if widths[z + step] < 0.6 * widths[peak]:
+                break
+            z += step
+        return z
+
+    bottom, top = boundary(-1), boundary(1)
+    midbrain_top = min(len(widths) - 1, top + int(round(MIDBRAIN_HEIGHT_MM / sz)))
+    midbrain_rows = [z for z in range(top + 1, midbrain_top + 1) if widths[z] > 0]
+    if not midbrain_rows:
+        return None
+    return {"mask": mask, "pons_rows": list(range(bottom, top + 1)), "midbrain_rows": midbrain_rows}
+
+
+def _median(values):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def measure_mcp(vol, parenchyma_threshold, xm, pons_y, pons_z, spacing):
+    """小脑中脚宽度：两侧旁矢状面上脑桥中心高度处脑实质的上下厚度（毫米）"""
+    import numpy as np
+    sx, _, sz = spacing
+    window = int(MCP_WINDOW_MM / sz)
+    widths = []
+    for offset in MCP_OFFSETS_MM:
+        for side in (-1, 1):
+            x = xm + side * int(round(offset / sx))
+            if not 0 <= x < vol.shape[0]:
+                continue
+            z_lo, z_hi = max(0, pons_z - window), min(vol.shape[2], pons_z + window + 1)
+            line = np.asarray(vol[x, pons_y, z_lo:z_hi]) > parenchyma_threshold
+            length, touches_edge = _run_length(line, pons_z - z_lo)
+            if length and not touches_edge:
+                widths.append(length * sz)
+    return _median(widths)
+
+
+def measure_scp(vol, parenchyma_threshold, xm, posterior_y, junction_z, spacing):
+    """小脑上脚宽度：两侧旁矢状面上脑桥-中脑交界高度处，第四脑室后方第一段脑实质的前后厚度（毫米）"""
+    import numpy as np
+    sx, sy, _ = spacing
+    widths = []
+    for offset in SCP_OFFSETS_MM:
+        for side in (-1, 1):
+            x = xm + side * int(round(offset / sx))
+            if not 0 <= x < vol.shape[0]:
+                continue
+            y_hi = min(vol.shape[1], posterior_y + int(SCP_SEARCH_MM / sy) + 1)
+            line = np.asarray(vol[x, posterior_y:y_hi, junction_z]) > parenchyma_threshold
+            index = 0
+            while index < len(line) and line[index]:     # 脑干后部
+                index += 1
+            while index < len(line) and not line[index]:  # 第四脑室
+                index += 1
+            if index >= len(line):
+                continue
+            length, touches_edge = _run_length(line, index)
+            if not touches_edge and length * sy <= SCP_MAX_MM:
+                widths.append(length * sy)
+    return _median(widths)
+
+
+def quantify_volume(vol, spacing):
+    """
+    在LPS顺序的T1体数据上测量
+
+    Args:
+        vol: (x, y, z)体数据（可为内存映射视图）
+        spacing: (sx, sy, sz)，毫米
+
+    Returns:
+        dict: 测量值与预填的影像特征
+    """
+    import numpy as np
+    sx, sy, sz = spacing
+    voxel_ml = sx * sy * sz / 1000
+    warnings = []
+
+    # 隔点采样估计强度阈值与头部体积，避免读取整个体数据
+    sample = np.asarray(vol[::2, ::2, ::2], dtype=np.float32)
+    head_threshold = otsu_threshold(sample)
+    tissue_threshold = otsu_threshold(sample[sample > head_threshold])
+    parenchyma_threshold = (head_threshold + tissue_threshold) / 2
+    head_sample = sample > head_threshold
+    head_ml = float(head_sample.sum()) * 8 * voxel_ml
+
+    # 正中矢状面：头部掩膜左右方向的质心
+    x_weights = head_sample.sum(axis=(1, 2))
+    xm = min(vol.shape[0] - 1, int(round(np.average(np.arange(len(x_weights)), weights=x_weights) * 2)))
+    mid = np.asarray(vol[xm], dtype=np.float32)
+    brainstem = segment_brainstem(mid > parenchyma_threshold, mid > head_threshold, (sy, sz))
+
+    result = {
+        "version": PIPELINE_VERSION,
+        "midsagittal_x": xm,
+        "head_volume_ml": round(head_ml, 1),
+        "pons_area_mm2": None,
+        "midbrain_area_mm2": None,
+        "midbrain_pons_ratio": None,
+        "mcp_width_mm": None,
+        "scp_width_mm": None,
+        "mrpi_index": None,
+        "pons_volume_ml": None,
+        "putamen_volume_ml": None,
+        "putamen_permille": None,
+        "msa_features": [],
+        "psp_features": [],
+        "warnings": warnings,
+    }
+    if brainstem is None:
+        warnings.append("未能在正中矢状面分割出脑干，未计算脑桥/中脑相关指标")
+        return result
+
+    mask = brainstem["mask"]
+    pons_rows, midbrain_rows = brainstem["pons_rows"], brainstem["midbrain_rows"]
+    pons_area = float(mask[:, pons_rows].sum()) * sy * sz
+    midbrain_area = float(mask[:, midbrain_rows].sum()) * sy * sz
+    result["pons_area_mm2"] = round(pons_area, 1)
+    result["midbrain_area_mm2"] = round(midbrain_area, 1)
+    ratio = midbrain_area / pons_area if pons_area else None
+    result["midbrain_pons_ratio"] = round(ratio, 3) if ratio is not None else None
+
+    pons_ys = np.nonzero(mask[:, pons_rows].any(axis=1))[0]
+    pons_y = int(round(pons_ys.mean()))
+    pons_z = pons_rows[len(pons_rows) // 2]
+    junction_z = pons_rows[-1]
+    posterior_y = int(np.nonzero(mask[:, junction_z])[0].max())
+
+    mcp = measure_mcp(vol, parenchyma_threshold, xm, pons_y, pons_z, spacing)
+    scp = measure_scp(vol, parenchyma_threshold, xm, posterior_y, junction_z, spacing)
+    result["mcp_width_mm"] = round(mcp, 2) if mcp is not None else None
+    result["scp_width_mm"] = round(scp, 2) if scp is not None else None
+    if mcp is None:
+        warnings.append("未能测得小脑中脚宽度")
+    if scp is None:
+        warnings.append("未能测得小脑上脚宽度")
+    if mcp and scp and midbrain_area:
+        result["mrpi_index"] = round((pons_area / midbrain_area) * (mcp / scp), 2)
+
+    # 脑桥体积：脑桥层面、脑桥前后范围内中线两侧的脑实质
+    half = int(PONS_HALF_WIDTH_MM / sx)
+    pons_block = np.asarray(vol[max(0, xm - half):xm + half + 1, pons_ys.min():pons_ys.max() + 1,
+                                pons_rows[0]:pons_rows[-1] + 1])
+    result["pons_volume_ml"] = round(float((pons_block > parenchyma_threshold).sum()) * voxel_ml, 2)
+
+    # 壳核体积：中脑前上外侧两个测量框中灰质强度的体素
+    midbrain_ys = np.nonzero(mask[:, midbrain_rows].any(axis=1))[0]
+    center_y = int(round(midbrain_ys.mean() + PUTAMEN_OFFSET_MM[1] / sy))
+    center_z = midbrain_rows[-1] + int(round(PUTAMEN_OFFSET_MM[2] / sz))
+    half_x, half_y, half_z = (int(PUTAMEN_HALF_SIZE_MM[0] / sx), int(PUTAMEN_HALF_SIZE_MM[1] / sy),
+                              int(PUTAMEN_HALF_SIZE_MM[2] / sz))
+    putamen_voxels = 0
+    for side in (-1, 1):
+        center_x = xm + side * int(round(PUTAMEN_OFFSET_MM[0] / sx))
+        block = np.asarray(vol[max(0, center_x - half_x):center_x + half_x + 1,
+                               max(0, center_y - half_y):center_y + half_y + 1,
+                               max(0, center_z - half_z):center_z + half_z + 1])
+        putamen_voxels += int(((block > parenchyma_threshold) & (block < tissue_threshold)).sum())
+    putamen_ml = putamen_voxels * voxel_ml
+    result["putamen_volume_ml"] = round(putamen_ml, 2)
+    result["putamen_permille"] = round(putamen_ml / head_ml * 1000, 3) if head_ml else None
+
+    # 预填的影像特征（脑桥十字征为T2像征象，T1测量无法判断）
+    if ratio is not None and ratio < MIDBRAIN_PONS_RATIO_THRESHOLD:
+        result["psp_features"].append("蜂鸟征")
+    if mcp is not None and mcp < MCP_WIDTH_THRESHOLD_MM:
+        result["msa_features"].append("小脑中脚异常")
+    if PUTAMEN_PERMILLE_THRESHOLD is not None and result["putamen_permille"] is not None \
+            and result["putamen_permille"] < PUTAMEN_PERMILLE_THRESHOLD:
+        result["msa_features"].append("壳核萎缩")
+    result["mrpi_abnormal"] = result["mrpi_index"] is not None and result["mrpi_index"] > MRPI_THRESHOLD
+    return result
+
+
+def study_key(paths):
+    """由T1检查各文件的内容摘要（文件存储中的文件名）计算缓存键"""
+    digests = sorted(os.path.basename(path) for path in paths)
+    payload = json.dumps([PIPELINE_VERSION] + digests)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _cache_dir():
+    return os.getenv('PD_MRI_QUANT_DIR', os.path.join('data', 'mri_quant'))
+
+
+def cached_result(paths):
+    """
+    读取已缓存的测量结果
+
+    Returns:
+        dict: 测量结果，未缓存时为None
+    """
+    path = os.path.join(_cache_dir(), study_key(paths) + ".json")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def quantify_study(paths):
+    """
+    测量一次检查中的3D T1序列（在进程池中执行，结果写入缓存）
+
+    体数据逐层写入缓存目录中的临时.npy文件后以内存映射方式读取，测量只访问用到的切片和区域；
+    测量结束即删除临时文件。
+
+    Args:
+        paths: 该检查所有DICOM文件的路径
+
+    Returns:
+        dict: 测量结果，未找到3D T1序列时为{"success": False, "error": ...}
+    """
+    import numpy as np
+    cached = cached_result(paths)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    series, _ = build_series_index(paths)
+    t1 = find_series(series, "3D T1")
+    if t1 is None:
+        return {"success": False, "error": "未找到3D T1序列"}
+    if len(t1) < 16:
+        return {"success": False, "error": f"3D T1序列只有{len(t1)}层，无法进行体积测量"}
+
+    key = study_key(paths)
+    directory = _cache_dir()
+    os.makedirs(directory, exist_ok=True)
+    # 体数据只在本次测量期间存在：测量结束（无论成功与否）即删除，缓存中只保留JSON结果
+    fd, volume_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".npy")
+    os.close(fd)
+    try:
+        volume = np.lib.format.open_memmap(volume_path, mode='w+', dtype=np.float32, shape=t1.shape)
+        for index in range(len(t1)):
+            volume[index] = t1.slice_array(index)
+        volume.flush()
+        del volume
+        volume = np.load(volume_path, mmap_mode='r')
+        try:
+            vol, spacing = to_lps(volume, t1.spacing, t1.instances[0].orientation)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        result = quantify_volume(vol, spacing)
+        # 释放内存映射后再删除文件
+        del vol, volume
+    finally:
+        os.remove(volume_path)
+    result.update({
+        "success": True,
+        "series_uid": t1.series_uid,
+        "series_description": t1.description,
+        "slices": len(t1),
+        "seconds": round(time.perf_counter() - start, 2),
+    })
+
+    path = os.path.join(directory, key + ".json")
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return result
+
+
+def get_quant_executor():
+    """获取进程级共享的测量进程池（首次使用时创建）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=int(os.getenv('PD_MRI_WORKERS', 1)))
+        return _executor
+
+
+def run_quantification(paths):
+    """
+    在进程池中测量检查（已缓存时直接返回结果，不启动进程）
+
+    Returns:
+        dict | Future: 已缓存的测量结果，或进程池中测量任务的Future（不阻塞调用线程）
+    """
+    cached = cached_result(paths)
+    if cached is not None:
+        return cached
+    return get_quant_executor().submit(quantify_study, list(paths))
@@ -3,6 +3,10 @@ import streamlit as st
 from datetime import datetime, date
 import math
 from components.patient_info_sidebar import display_patient_info_summary
+from components.render_utils import timed_rerun
+from components.patient_store_panel import display_patient_loader, save_current_patient
+from components.diagnosis_state import dispatch_diagnosis_event
+from diagnosis_machine import PatientInfoUpdated
 
 def calculate_age(birth_date):
     """根据出生日期计算当前年龄"""
@@ -41,6 +45,7 @@ def sync_exclusion_criteria():
         st.session_state.exclusion_criteria['vertical_gaze_palsy'] = patient_info.get('vertical_gaze_palsy', False)
         st.session_state.exclusion_criteria['ideomotor_apraxia'] = patient_info.get('apraxia', False)
 
+@timed_rerun("步骤1")
 def main():
     # 显示侧边栏
     from components.current_patient_sidebar import display_current_patient_sidebar
@@ -50,6 +55,9 @@ def main():
     # 在页面加载时同步数据
     sync_exclusion_criteria()
     
+    # 复诊患者可直接从患者数据库加载
+    display_patient_loader()
+    
     col1, col2 = st.columns([2, 1])
     
     with col1:
@@ -266,6 +274,11 @@ def main():
                         'ideomotor_apraxia': apraxia
                     })
                     
+                    dispatch_diagnosis_event(PatientInfoUpdated(st.session_state.patient_info))
+                    
+                    # 持久化到患者数据库
+                    save_current_patient()
+                    
                     st.success("患者信息保存成功！绝对排除标准数据已同步到步骤3页面。")
 
     with col2:
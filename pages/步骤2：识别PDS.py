@@ -1,10 +1,16 @@
 # pages/2_帕金森症候群诊断.py
 import streamlit as st
-import pandas as pd
-import numpy as np
-from updrs_dia import assess_updrs_parkinson
+from updrs_dia import stream_updrs_parkinson, STANDARD_UPDRS_ITEMS
 from components.patient_info_sidebar import display_patient_info_summary
+from components.render_utils import timed_rerun
+from components.llm_narrative_panel import display_llm_narrative
+from components.patient_store_panel import save_current_patient
+from components.diagnosis_state import dispatch_diagnosis_event
+from components.job_panel import start_job, take_finished_job, display_job_progress
+from diagnosis_machine import UPDRSAssessed
+from job_queue import stream_job, FAILED
 
+@timed_rerun("步骤2")
 def main():
     # 显示侧边栏
     from components.current_patient_sidebar import display_current_patient_sidebar
@@ -25,20 +31,14 @@ def main():
         st.subheader("1. UPDRS-III评分表格填充")
         uploaded_file = st.file_uploader("###### **选择UPDRS量表CSV文件或直接编辑评分表**", type="csv")
         
-        # 标准的UPDRS-III检测项目
-        standard_updrs_items = [
-            "3.1 言语表达", "3.2 面部表情", "3.3 强直（颈+四肢）","3.4 手指叩击（右）", "3.5 手指叩击（左）", 
-            "3.6 手掌握合（右）", "3.7 手掌握合（左）","3.8 前臂旋前-旋后（右）", "3.9 前臂旋前-旋后（左）", 
-            "3.10 脚趾叩击（右）","3.11 脚趾叩击（左）", "3.12 足跟点地（右）", "3.13 足跟点地（左）", 
-            "3.14 后拉试验", "3.15 静止性震颤（多部位）", "3.16 姿势性震颤（上肢）","3.17 运动灵活性（手指-足快速轮替）",
-            "3.18 步态&冻结观察",
-        ]
+        # 评分表为DataFrame，pandas按需导入（导入页面模块时不加载）
+        import pandas as pd
         
         # 初始化数据框
         if 'updrs_data' not in st.session_state:
             st.session_state.updrs_data = pd.DataFrame({
-                '检测项目': standard_updrs_items,
-                '评分': [0] * len(standard_updrs_items)
+                '检测项目': STANDARD_UPDRS_ITEMS,
+                '评分': [0] * len(STANDARD_UPDRS_ITEMS)
             })
         
         if uploaded_file is not None:
@@ -104,39 +104,53 @@ def main():
         st.subheader("")
         st.subheader("2. 帕金森综合症诊断")
         if st.button("点击按钮进行AI诊断", type="primary"):
-            with st.spinner("AI评估中..."):
-                # 调用DeepSeek进行UPDRS评估
-                parkinson_result = assess_updrs_parkinson(st.session_state.updrs_data)
-                
-                # 保存评估结果到session state
-                st.session_state.parkinson_assessment = parkinson_result
-                
-                # 显示评估结果
-                if parkinson_result['has_parkinson']:
-                    st.error("🟡 疑似帕金森综合症")
-                    st.info("可以继续进行绝对排除标准的鉴别诊断。")
-                else:
-                    st.success("🔵 非帕金森综合症")
-                    st.warning("建议移交至其他科室进行进一步评估。")
-                
-                # 显示详细评估
-                st.write("**详细评估:**")
-                st.info(parkinson_result['assessment'])
-                
-                # 显示关键指标 - 确保parkinson_result已经定义
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    status = "✅ 符合" if parkinson_result['core_standard_met'] else "❌ 不符合"
-                    st.markdown(f"<h6 style='text-align: center;'>核心标准(运动迟缓)</h6>", unsafe_allow_html=True)
-                    st.markdown(f"<h6 style='text-align: center;'>{status}</h6>", unsafe_allow_html=True)
-                with col2:
-                    status = "✅ 符合" if parkinson_result['rigidity_standard_met'] else "❌ 不符合"
-                    st.markdown(f"<h6 style='text-align: center;'>肌强直标准</h6>", unsafe_allow_html=True)
-                    st.markdown(f"<h6 style='text-align: center;'>{status}</h6>", unsafe_allow_html=True)
-                with col3:
-                    status = "✅ 符合" if parkinson_result['tremor_standard_met'] else "❌ 不符合"
-                    st.markdown(f"<h6 style='text-align: center;'>静止性震颤</h6>", unsafe_allow_html=True)
-                    st.markdown(f"<h6 style='text-align: center;'>{status}</h6>", unsafe_allow_html=True)
+            # 评估在后台任务队列中流式执行，脚本线程只保存任务ID；重复点击共享同一任务
+            start_job('updrs_job_id', "updrs", stream_job(stream_updrs_parkinson),
+                      st.session_state.updrs_data.copy())
+
+        finished_job = take_finished_job('updrs_job_id')
+        if finished_job is not None and finished_job.status == FAILED:
+            st.error(f"AI评估失败: {finished_job.error}")
+        elif finished_job is not None:
+            parkinson_result = finished_job.result
+            
+            # 保存评估结果到session state
+            st.session_state.parkinson_assessment = parkinson_result
+            dispatch_diagnosis_event(UPDRSAssessed(parkinson_result))
+            save_current_patient()
+            
+            # 显示评估结果
+            if parkinson_result['has_parkinson']:
+                st.error("🟡 疑似帕金森综合症")
+                st.info("可以继续进行绝对排除标准的鉴别诊断。")
+            else:
+                st.success("🔵 非帕金森综合症")
+                st.warning("建议移交至其他科室进行进一步评估。")
+            
+            # 显示详细评估
+            st.write("**详细评估:**")
+            st.info(parkinson_result['assessment'])
+            
+            # 显示关键指标 - 确保parkinson_result已经定义
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                status = "✅ 符合" if parkinson_result['core_standard_met'] else "❌ 不符合"
+                st.markdown(f"<h6 style='text-align: center;'>核心标准(运动迟缓)</h6>", unsafe_allow_html=True)
+                st.markdown(f"<h6 style='text-align: center;'>{status}</h6>", unsafe_allow_html=True)
+            with col2:
+                status = "✅ 符合" if parkinson_result['rigidity_standard_met'] else "❌ 不符合"
+                st.markdown(f"<h6 style='text-align: center;'>肌强直标准</h6>", unsafe_allow_html=True)
+                st.markdown(f"<h6 style='text-align: center;'>{status}</h6>", unsafe_allow_html=True)
+            with col3:
+                status = "✅ 符合" if parkinson_result['tremor_standard_met'] else "❌ 不符合"
+                st.markdown(f"<h6 style='text-align: center;'>静止性震颤</h6>", unsafe_allow_html=True)
+                st.markdown(f"<h6 style='text-align: center;'>{status}</h6>", unsafe_allow_html=True)
+
+        # 评估进行中：显示已生成的评估详情并轮询任务状态
+        display_job_progress('updrs_job_id', "AI评估中...")
+
+        # 规则优先模式下的AI补充叙述
+        display_llm_narrative(st.session_state.get('parkinson_assessment'))
 
         # 简单的UPDRS评分分析
         st.subheader("")
@@ -1,7 +1,12 @@
 # pages/3_绝对排除标准.py
 import streamlit as st
-from aec_dia import assess_absolute_exclusion_criteria
+from aec_dia import stream_absolute_exclusion_criteria
 from components.patient_info_sidebar import display_patient_info_summary
+from components.render_utils import timed_rerun
+from components.llm_narrative_panel import display_llm_narrative
+from components.patient_store_panel import save_current_patient
+from components.diagnosis_state import dispatch_diagnosis_event
+from diagnosis_machine import PatientInfoUpdated, ExclusionAssessed
 
 def sync_to_patient_info():
     """将排除标准数据同步回患者信息"""
@@ -19,6 +24,7 @@ def sync_to_patient_info():
             'apraxia': exclusion.get('ideomotor_apraxia', False)
         })
 
+@timed_rerun("步骤3")
 def main():
     # 显示侧边栏
     from components.current_patient_sidebar import display_current_patient_sidebar
@@ -152,6 +158,8 @@ def main():
                 # 同步数据到患者信息页面
                 sync_to_patient_info()
                 st.session_state.exclusion_criteria_updated = True
+                dispatch_diagnosis_event(PatientInfoUpdated(st.session_state.patient_info))
+                save_current_patient()
                 st.success("排除标准评估已保存！数据已同步到患者信息页面。")
         
         # 显示评估结果
@@ -160,31 +168,44 @@ def main():
         
         # 使用DeepSeek API进行评估
         if st.button("使用AI分析排除标准", type="primary"):
-            with st.spinner("AI正在分析绝对排除标准..."):
-                assessment_result = assess_absolute_exclusion_criteria(st.session_state.exclusion_criteria)
+            # 评估描述流式输出，首段文字到达即显示
+            assessment_box = st.empty()
+            assessment_box.info("AI正在分析绝对排除标准...")
+            assessment_stream = stream_absolute_exclusion_criteria(st.session_state.exclusion_criteria)
+            streamed_text = ""
+            for text in assessment_stream:
+                streamed_text += text
+                assessment_box.markdown(streamed_text)
+            
+            assessment_result = assessment_stream.final_result
+            
+            if assessment_result:
+                st.session_state.exclusion_assessment = assessment_result
+                dispatch_diagnosis_event(ExclusionAssessed(assessment_result))
+                save_current_patient()
                 
-                if assessment_result:
-                    st.session_state.exclusion_assessment = assessment_result
-                    
-                    # 显示评估结果
-                    st.markdown(assessment_result.get("assessment", ""))
-                    
-                    # 显示详细结果
-                    if assessment_result.get("is_primary_parkinson", False):
-                        st.error("🟡 疑似帕金森综合症")
-                        st.info("可以继续进行继发性病因的鉴别诊断。")
-                    else:
-                        st.success("🔵 非帕金森综合症")
-                        st.warning("建议移交至其他科室进行进一步评估。")
-                        
-                        # 显示阳性标准详情
-                        positive_details = assessment_result.get("positive_criteria_details", [])
-                        if positive_details:
-                            st.write("**发现的阳性排除标准:**")
-                            for detail in positive_details:
-                                st.write(f"• {detail}")
+                # 显示评估结果
+                assessment_box.markdown(assessment_result.get("assessment", ""))
+                
+                # 显示详细结果
+                if assessment_result.get("is_primary_parkinson", False):
+                    st.error("🟡 疑似帕金森综合症")
+                    st.info("可以继续进行继发性病因的鉴别诊断。")
                 else:
-                    st.error("AI分析失败，请稍后重试。")
+                    st.success("🔵 非帕金森综合症")
+                    st.warning("建议移交至其他科室进行进一步评估。")
+                    
+                    # 显示阳性标准详情
+                    positive_details = assessment_result.get("positive_criteria_details", [])
+                    if positive_details:
+                        st.write("**发现的阳性排除标准:**")
+                        for detail in positive_details:
+                            st.write(f"• {detail}")
+            else:
+                st.error("AI分析失败，请稍后重试。")
+        
+        # 规则优先模式下的AI补充叙述
+        display_llm_narrative(st.session_state.get('exclusion_assessment'))
 
     with col_right:
         display_patient_info_summary()
@@ -1,48 +1,20 @@
 # pages/4_原发型与继发型辨别.py
 import streamlit as st
-import pandas as pd
 import io
 from components.patient_info_sidebar import display_patient_info_summary
-from ai_blood_analysis import blood_analyzer
-
-def create_default_lab_data():
-    """创建默认的血检数据表格"""
-    default_data = {
-        '项目': ['传染病筛查', '传染病筛查', '肝功能', '肝功能', '肝功能', '肾功能', '肾功能', 
-                '电解质', '电解质', '电解质', '电解质', '甲状腺功能', '甲状腺功能', '甲状腺功能', '甲状旁腺功能'],
-        '名称': ['梅毒抗体', 'HIV抗体', '谷丙转氨酶(ALT)', '谷草转氨酶(AST)', '总胆红素(TBIL)', 
-                '肌酐(Cr)', '尿素氮(BUN)', '钠(Na)', '钾(K)', '氯(Cl)', '钙(Ca)', 
-                '游离T3(FT3)', '游离T4(FT4)', '促甲状腺激素(TSH)', '甲状旁腺激素(PTH)'],
-        '结果': ['', '', '', '', '', '', '', '', '', '', '', '', '', '', ''],
-        '单位': ['阴性/阳性', '阴性/阳性', 'U/L', 'U/L', 'umol/L', 'umol/L', 'mmol/L', 
-                'mmol/L', 'mmol/L', 'mmol/L', 'mmol/L', 'pmol/L', 'pmol/L', 'mIU/L', 'pg/mL'],
-        '参考值': ['阴性', '阴性', '0-40', '0-40', '3.4-20.5', '44-133', '2.5-7.1', 
-                 '135-145', '3.5-5.5', '96-106', '2.1-2.7', '3.5-6.5', '11.5-22.7', '0.3-5.0', '15-65']
-    }
-    return pd.DataFrame(default_data)
-
-def validate_uploaded_csv(df):
-    """验证上传的CSV文件格式"""
-    required_columns = ['项目', '名称', '结果', '单位', '参考值']
-    
-    # 检查是否包含所有必需列
-    if not all(col in df.columns for col in required_columns):
-        return False, f"CSV文件必须包含以下列: {', '.join(required_columns)}"
-    
-    # 检查关键检测项目是否存在
-    required_items = ['梅毒', 'HIV', '肝功能', '肾功能', '电解质', '甲状腺功能', '甲状旁腺']
-    existing_names = df['名称'].astype(str).values
-    
-    missing_items = []
-    for item in required_items:
-        # 检查名称中是否包含关键词
-        if not any(item in name for name in existing_names):
-            missing_items.append(item)
-    
-    if missing_items:
-        return False, f"缺少以下关键检测项目: {', '.join(missing_items)}"
-    
-    return True, "文件格式正确"
+from ai_blood_analysis import get_blood_analyzer
+from assessment_runner import run_assessments
+from lab_utils import create_default_lab_data
+from sop_rules import has_secondary_imaging
+from components.patient_store_panel import save_current_patient
+from components.diagnosis_state import get_diagnosis_state, dispatch_diagnosis_event
+from components.render_utils import fragment, rerun_app_if, timed_rerun
+from components.job_panel import start_job, take_finished_job, display_job_progress
+from components.imaging_panel import store_uploaded_file, display_blob_image
+from job_queue import stream_job, FAILED
+from diagnosis_machine import (
+    UPDRSAssessed, ExclusionAssessed, BloodConditionsConfirmed, CTFindingsChanged, MRIFindingsChanged
+)
 
 def get_final_diagnosis(selected_conditions):
     """根据选择的病因确定最终诊断"""
@@ -62,35 +34,121 @@ def get_diagnosis_type_from_conditions(selected_conditions):
     else:
         return "继发性帕金森综合征"
 
-def setup_deepseek_client():
-    """设置DeepSeek客户端"""
-    try:
-        from deepseek_client import deepseek_client
-        # 设置API密钥（在实际应用中应该从环境变量获取）
-        # deepseek_client.api_key = "your_api_key_here"
-        blood_analyzer.deepseek_client = deepseek_client
-        return True
-    except ImportError:
-        st.warning("DeepSeek客户端未找到，将使用基于规则的分析方法。")
-        return False
+def get_diagnosis_with_imaging():
+    """结合影像学检查结果获取当前诊断"""
+    # 如果CT或MRI有异常发现，为继发性帕金森综合征
+    if has_secondary_imaging(st.session_state.ct_data['findings'], st.session_state.mri_data['findings']):
+        return "继发性帕金森综合征"
+    # 如果没有异常发现，沿用推导出的诊断标签
+    return get_diagnosis_state()['tag']
 
-def update_diagnosis_based_on_imaging():
-    """根据影像学检查结果更新诊断标签"""
-    # 检查CT和MRI是否有异常发现
-    ct_has_abnormal = any(finding in st.session_state.ct_data['findings'] 
-                         for finding in ["正常压力性脑积水", "Fahr病"])
-    mri_has_abnormal = any(finding in st.session_state.mri_data['findings'] 
-                          for finding in ["脑炎", "正常压力性脑积水", "血管性帕金森综合征"])
+@fragment
+def render_ct_section():
+    """颅脑CT检查（片段：输入结论等操作只重跑本区域）"""
+    st.subheader("2. 颅脑CT检查")
     
-    # 如果CT或MRI有异常发现，更新为继发性帕金森综合征
-    if ct_has_abnormal or mri_has_abnormal:
-        st.session_state.patient_info['diagnosis_tag'] = '继发性帕金森综合征'
-        return "继发性帕金森综合征"
-    else:
-        # 如果没有异常发现，保持原诊断标签
-        current_tag = st.session_state.patient_info.get('diagnosis_tag', '疑似帕金森综合征')
-        return current_tag
+    ct_col1, ct_col2 = st.columns([1, 2])
+    
+    with ct_col1:
+        ct_image = st.file_uploader("上传颅脑CT图像", type=['jpg', 'jpeg', 'png'], 
+                                key="ct_uploader")
+        if ct_image is not None:
+            st.session_state.ct_data['image'] = store_uploaded_file(ct_image)
+        # 会话中只保存内容摘要，重跑时显示预生成的缩略图
+        if st.session_state.ct_data['image']:
+            display_blob_image(st.session_state.ct_data['image'], caption="颅脑CT图像", use_column_width=True)
+    
+    with ct_col2:
+        ct_conclusion = st.text_area("CT检查结论", 
+                                value=st.session_state.ct_data['conclusion'],
+                                placeholder="请输入CT检查的影像学结论...",
+                                height=100,
+                                key="ct_conclusion")
+        st.session_state.ct_data['conclusion'] = ct_conclusion
+        
+        # CT检查发现 - 使用单选按钮实现互斥关系
+        st.write("**影像学发现（单选）**")
+        
+        # 获取当前选中的CT发现
+        current_ct_findings = st.session_state.ct_data.get('findings', [])
+        current_ct_selection = "无异常发现"  # 默认值
+        
+        if "正常压力性脑积水" in current_ct_findings:
+            current_ct_selection = "正常压力性脑积水"
+        elif "Fahr病" in current_ct_findings:
+            current_ct_selection = "Fahr病"
+        elif "无异常发现" in current_ct_findings:
+            current_ct_selection = "无异常发现"
+        
+        # 在CT单选按钮后添加
+        ct_option = st.radio(
+            "选择CT发现:",
+            ["无异常发现", "正常压力性脑积水", "Fahr病"],
+            index=["无异常发现", "正常压力性脑积水", "Fahr病"].index(current_ct_selection),
+            key="ct_radio"
+        )
+
+        # 根据选择更新findings
+        st.session_state.ct_data['findings'] = [ct_option]
+        # 只使步骤4及其下游失效；发现变化时整页重跑以刷新摘要面板
+        rerun_app_if(dispatch_diagnosis_event(CTFindingsChanged([ct_option])))
+
+@fragment
+def render_mri_section():
+    """头颅MRI检查（片段：输入结论等操作只重跑本区域）"""
+    st.subheader("3. 头颅MRI检查")
+    
+    mri_col1, mri_col2 = st.columns([1, 2])
+    
+    with mri_col1:
+        mri_image = st.file_uploader("上传头颅MRI图像", type=['jpg', 'jpeg', 'png'], 
+                                key="mri_uploader")
+        if mri_image is not None:
+            st.session_state.mri_data['image'] = store_uploaded_file(mri_image)
+        if st.session_state.mri_data['image']:
+            display_blob_image(st.session_state.mri_data['image'], caption="头颅MRI图像", use_column_width=True)
+    
+    with mri_col2:
+        mri_conclusion = st.text_area("MRI检查结论", 
+                                    value=st.session_state.mri_data['conclusion'],
+                                    placeholder="请输入MRI检查的影像学结论...",
+                                    height=100,
+                                    key="mri_conclusion")
+        st.session_state.mri_data['conclusion'] = mri_conclusion
+        
+        # MRI检查发现 - 使用单选按钮实现互斥关系
+        st.write("**影像学发现（单选）**")
+        
+        # 获取当前选中的MRI发现
+        current_mri_findings = st.session_state.mri_data.get('findings', [])
+        current_mri_selection = "无异常发现"  # 默认值
+        
+        if "脑炎" in current_mri_findings:
+            current_mri_selection = "脑炎"
+        elif "正常压力性脑积水" in current_mri_findings:
+            current_mri_selection = "正常压力性脑积水"
+        elif "血管性帕金森综合征" in current_mri_findings:
+            current_mri_selection = "血管性帕金森综合征"
+        elif "无异常发现" in current_mri_findings:
+            current_mri_selection = "无异常发现"
+        
+        # 在MRI单选按钮后添加类似的代码
+        mri_option = st.radio(
+            "选择MRI发现:",
+            ["无异常发现", "脑炎", "正常压力性脑积水", "血管性帕金森综合征"],
+            index=["无异常发现", "脑炎", "正常压力性脑积水", "血管性帕金森综合征"].index(current_mri_selection),
+            key="mri_radio"
+        )
+
+        # 根据选择更新findings
+        st.session_state.mri_data['findings'] = [mri_option]
+        rerun_app_if(dispatch_diagnosis_event(MRIFindingsChanged([mri_option])))
 
+def _reassess_all_job(job, updrs_data, exclusion_data, lab_data):
+    """后台任务：并发重新评估UPDRS、绝对排除标准和血检数据"""
+    return run_assessments(updrs_data=updrs_data, exclusion_data=exclusion_data, lab_data=lab_data)
+
+@timed_rerun("步骤4")
 def main():
     # 显示侧边栏
     from components.current_patient_sidebar import display_current_patient_sidebar
@@ -115,9 +173,8 @@ def main():
     if 'selected_conditions' not in st.session_state:
         st.session_state.selected_conditions = []
     
-    # 设置DeepSeek客户端
-    if blood_analyzer.deepseek_client is None:
-        setup_deepseek_client()
+    # 共享的血检分析器（首次使用时创建并接入DeepSeek客户端）
+    blood_analyzer = get_blood_analyzer()
     
     col1, col2 = st.columns([2, 1])
     
@@ -145,7 +202,8 @@ def main():
         
         if uploaded_file is not None:
             try:
-                # 读取CSV文件
+                # 读取CSV文件（pandas按需导入）
+                import pandas as pd
                 df = pd.read_csv(uploaded_file)
                 st.session_state.lab_data = df
                 st.success("CSV文件上传成功！数据已加载到下方表格中。")
@@ -168,6 +226,9 @@ def main():
                 st.session_state.selected_conditions = []
                 st.session_state.ct_data = {'image': None, 'conclusion': '', 'findings': []}
                 st.session_state.mri_data = {'image': None, 'conclusion': '', 'findings': []}
+                dispatch_diagnosis_event(
+                    BloodConditionsConfirmed([]), CTFindingsChanged([]), MRIFindingsChanged([])
+                )
                 st.rerun()
         
         # 使用data_editor创建可编辑表格
@@ -208,11 +269,27 @@ def main():
             
             # 添加AI分析按钮
             if st.button("AI分析血检数据", type="primary", use_container_width=True):
-                with st.spinner("AI正在分析血检数据..."):
-                    analysis_result = blood_analyzer.analyze_blood_tests(edited_df)
-                    st.session_state.ai_analysis_result = analysis_result
-                    # 根据AI建议设置初始选择
-                    st.session_state.selected_conditions = analysis_result.get('suggested_conditions', [])
+                # 分析在后台任务队列中执行（分析推理流式写入任务进度），重复点击共享同一任务
+                if blood_analyzer.deepseek_client:
+                    start_job('blood_job_id', "blood", stream_job(blood_analyzer.stream_blood_tests),
+                              edited_df.copy())
+                else:
+                    start_job('blood_job_id', "blood",
+                              lambda job, lab_data: blood_analyzer.analyze_blood_tests(lab_data),
+                              edited_df.copy())
+        
+        # 后台分析完成后由下方结果区域统一显示
+        finished_job = take_finished_job('blood_job_id')
+        if finished_job is not None and finished_job.status == FAILED:
+            st.error(f"血检AI分析失败: {finished_job.error}")
+        elif finished_job is not None:
+            analysis_result = finished_job.result
+            st.session_state.ai_analysis_result = analysis_result
+            # 根据AI建议设置初始选择
+            st.session_state.selected_conditions = analysis_result.get('suggested_conditions', [])
+            dispatch_diagnosis_event(BloodConditionsConfirmed(st.session_state.selected_conditions))
+            save_current_patient()
+        display_job_progress('blood_job_id', "AI正在分析血检数据...")
         
         # 在page4的AI分析结果部分，添加诊断标签更新逻辑
         if st.session_state.ai_analysis_result:
@@ -246,156 +323,63 @@ def main():
             
             # 更新选择的条件
             st.session_state.selected_conditions = selected_conditions
+            dispatch_diagnosis_event(BloodConditionsConfirmed(selected_conditions))
             
             # 验证选择逻辑
             if "无" in selected_conditions and len(selected_conditions) > 1:
                 st.warning("选择'无'时不应同时选择其他病因，已自动取消其他选择。")
                 st.session_state.selected_conditions = ["无"]
+                dispatch_diagnosis_event(BloodConditionsConfirmed(["无"]))
                 st.rerun()
             
             # 显示最终诊断
             final_diagnosis = get_final_diagnosis(st.session_state.selected_conditions)
             
-            # 根据最终诊断更新诊断标签
             if "继发性" in final_diagnosis:
                 st.error(f"**最终诊断**: {final_diagnosis}")
-                # 更新诊断标签为继发性帕金森综合征
-                st.session_state.patient_info['diagnosis_tag'] = '继发性帕金森综合征'
             else:
                 st.success(f"**最终诊断**: {final_diagnosis}")
-                # 更新诊断标签为疑似帕金森综合征
-                st.session_state.patient_info['diagnosis_tag'] = '疑似帕金森综合征'
 
         # 2. 颅脑CT检查
-        st.subheader("2. 颅脑CT检查")
-        
-        ct_col1, ct_col2 = st.columns([1, 2])
-        
-        with ct_col1:
-            ct_image = st.file_uploader("上传颅脑CT图像", type=['jpg', 'jpeg', 'png'], 
-                                    key="ct_uploader")
-            if ct_image is not None:
-                st.session_state.ct_data['image'] = ct_image
-                st.image(ct_image, caption="颅脑CT图像", use_column_width=True)
-        
-        with ct_col2:
-            ct_conclusion = st.text_area("CT检查结论", 
-                                    value=st.session_state.ct_data['conclusion'],
-                                    placeholder="请输入CT检查的影像学结论...",
-                                    height=100,
-                                    key="ct_conclusion")
-            st.session_state.ct_data['conclusion'] = ct_conclusion
-            
-            # CT检查发现 - 使用单选按钮实现互斥关系
-            st.write("**影像学发现（单选）**")
-            
-            # 获取当前选中的CT发现
-            current_ct_findings = st.session_state.ct_data.get('findings', [])
-            current_ct_selection = "无异常发现"  # 默认值
-            
-            if "正常压力性脑积水" in current_ct_findings:
-                current_ct_selection = "正常压力性脑积水"
-            elif "Fahr病" in current_ct_findings:
-                current_ct_selection = "Fahr病"
-            elif "无异常发现" in current_ct_findings:
-                current_ct_selection = "无异常发现"
-            
-            # 在CT单选按钮后添加
-            ct_option = st.radio(
-                "选择CT发现:",
-                ["无异常发现", "正常压力性脑积水", "Fahr病"],
-                index=["无异常发现", "正常压力性脑积水", "Fahr病"].index(current_ct_selection),
-                key="ct_radio"
-            )
-
-            # 根据选择更新findings
-            if ct_option == "无异常发现":
-                st.session_state.ct_data['findings'] = ["无异常发现"]
-            elif ct_option == "正常压力性脑积水":
-                st.session_state.ct_data['findings'] = ["正常压力性脑积水"]
-            elif ct_option == "Fahr病":
-                st.session_state.ct_data['findings'] = ["Fahr病"]
-
-            # 立即更新诊断标签
-            if ct_option != "无异常发现":
-                st.session_state.patient_info['diagnosis_tag'] = '继发性帕金森综合征'
-            else:
-                # 只有当其他检查也没有发现继发性因素时才更新为疑似
-                from components.current_patient_sidebar import get_page4_final_result_for_sidebar
-                page4_result = get_page4_final_result_for_sidebar()
-                if page4_result == "疑似帕金森综合征":
-                    st.session_state.patient_info['diagnosis_tag'] = '疑似帕金森综合征'
+        render_ct_section()
         
         # 3. 头颅MRI检查
-        st.subheader("3. 头颅MRI检查")
-        
-        mri_col1, mri_col2 = st.columns([1, 2])
-        
-        with mri_col1:
-            mri_image = st.file_uploader("上传头颅MRI图像", type=['jpg', 'jpeg', 'png'], 
-                                    key="mri_uploader")
-            if mri_image is not None:
-                st.session_state.mri_data['image'] = mri_image
-                st.image(mri_image, caption="头颅MRI图像", use_column_width=True)
-        
-        with mri_col2:
-            mri_conclusion = st.text_area("MRI检查结论", 
-                                        value=st.session_state.mri_data['conclusion'],
-                                        placeholder="请输入MRI检查的影像学结论...",
-                                        height=100,
-                                        key="mri_conclusion")
-            st.session_state.mri_data['conclusion'] = mri_conclusion
-            
-            # MRI检查发现 - 使用单选按钮实现互斥关系
-            st.write("**影像学发现（单选）**")
-            
-            # 获取当前选中的MRI发现
-            current_mri_findings = st.session_state.mri_data.get('findings', [])
-            current_mri_selection = "无异常发现"  # 默认值
-            
-            if "脑炎" in current_mri_findings:
-                current_mri_selection = "脑炎"
-            elif "正常压力性脑积水" in current_mri_findings:
-                current_mri_selection = "正常压力性脑积水"
-            elif "血管性帕金森综合征" in current_mri_findings:
-                current_mri_selection = "血管性帕金森综合征"
-            elif "无异常发现" in current_mri_findings:
-                current_mri_selection = "无异常发现"
-            
-            # 在MRI单选按钮后添加类似的代码
-            mri_option = st.radio(
-                "选择MRI发现:",
-                ["无异常发现", "脑炎", "正常压力性脑积水", "血管性帕金森综合征"],
-                index=["无异常发现", "脑炎", "正常压力性脑积水", "血管性帕金森综合征"].index(current_mri_selection),
-                key="mri_radio"
-            )
-
-            # 根据选择更新findings
-            if mri_option == "无异常发现":
-                st.session_state.mri_data['findings'] = ["无异常发现"]
-            elif mri_option == "脑炎":
-                st.session_state.mri_data['findings'] = ["脑炎"]
-            elif mri_option == "正常压力性脑积水":
-                st.session_state.mri_data['findings'] = ["正常压力性脑积水"]
-            elif mri_option == "血管性帕金森综合征":
-                st.session_state.mri_data['findings'] = ["血管性帕金森综合征"]
-
-            # 立即更新诊断标签
-            if mri_option != "无异常发现":
-                st.session_state.patient_info['diagnosis_tag'] = '继发性帕金森综合征'
-            else:
-                # 只有当其他检查也没有发现继发性因素时才更新为疑似
-                from components.current_patient_sidebar import get_page4_final_result_for_sidebar
-                page4_result = get_page4_final_result_for_sidebar()
-                if page4_result == "疑似帕金森综合征":
-                    st.session_state.patient_info['diagnosis_tag'] = '疑似帕金森综合征'
+        render_mri_section()
         
         # 综合诊断结果
         st.markdown("---")
         st.subheader("综合诊断结果")
         
-        # 根据影像学检查结果更新诊断
-        final_diagnosis = update_diagnosis_based_on_imaging()
+        # 并发重新评估步骤2-4，等待时间取决于最慢的一项而非三项之和；
+        # 评估在后台任务队列中执行，任务指纹包含三项输入，输入未变时重复点击共享同一任务
+        if st.button("重新评估全部（步骤2-4）", use_container_width=True):
+            start_job('reassess_job_id', "reassess_all", _reassess_all_job,
+                      st.session_state.get('updrs_data'),
+                      st.session_state.get('exclusion_criteria'),
+                      st.session_state.lab_data.copy())
+        
+        finished_job = take_finished_job('reassess_job_id')
+        if finished_job is not None and finished_job.status == FAILED:
+            st.error(f"重新评估失败: {finished_job.error}")
+        elif finished_job is not None:
+            all_results = finished_job.result
+            if 'updrs' in all_results:
+                st.session_state.parkinson_assessment = all_results['updrs']
+            if 'exclusion' in all_results:
+                st.session_state.exclusion_assessment = all_results['exclusion']
+            st.session_state.ai_analysis_result = all_results['blood']
+            st.session_state.selected_conditions = all_results['blood'].get('suggested_conditions', [])
+            dispatch_diagnosis_event(
+                UPDRSAssessed(st.session_state.get('parkinson_assessment')),
+                ExclusionAssessed(st.session_state.get('exclusion_assessment')),
+                BloodConditionsConfirmed(st.session_state.selected_conditions)
+            )
+            save_current_patient()
+            st.success(f"全部评估完成，用时 {all_results['elapsed']:.1f} 秒")
+        display_job_progress('reassess_job_id', "AI正在并发评估UPDRS、绝对排除标准和血检数据...")
+        
+        # 结合影像学检查结果的诊断
+        final_diagnosis = get_diagnosis_with_imaging()
         
         if final_diagnosis == "继发性帕金森综合征":
             st.error("🔴 **最终诊断: 继发性帕金森综合征**")
@@ -1,8 +1,15 @@
 # pages/5_原发型与叠加型辨别.py
 import streamlit as st
-import pandas as pd
-import io
 from components.patient_info_sidebar import display_patient_info_summary
+from components.render_utils import timed_rerun
+from sop_rules import MRPI_THRESHOLD, classify_primary_vs_atypical
+from components.patient_store_panel import save_current_patient
+from components.visit_history_panel import display_visit_history
+from components.imaging_panel import store_uploaded_file, display_blob_image
+from components.report_panel import prefill_report_result, display_extract_status
+from components.dicom_panel import display_dicom_series, display_mri_quantification
+from components.diagnosis_state import dispatch_diagnosis_event
+from diagnosis_machine import Step5Diagnosed
 
 def create_warning_signs_form():
     """创建警示征象评估表单"""
@@ -160,6 +167,8 @@ def create_additional_tests_section():
     """创建辅助检查部分"""
     st.subheader("3. 辅助检查")
     
+    st.caption("上传的报告会在后台自动识别文字并预填到检查结果中，请核对后修改")
+    
     # 膀胱残余尿检查
     st.write("**膀胱残余尿检查**")
     bladder_col1, bladder_col2 = st.columns([1, 2])
@@ -167,6 +176,8 @@ def create_additional_tests_section():
         bladder_file = st.file_uploader("上传膀胱残余尿检查报告", type=['jpg', 'jpeg', 'png', 'pdf'], key="bladder_uploader")
         if bladder_file is not None:
             st.success("文件上传成功")
+        bladder_blob = prefill_report_result(bladder_file, "bladder_result")
+        display_extract_status("bladder_result")
     with bladder_col2:
         bladder_result = st.text_area("检查结果", placeholder="请输入膀胱残余尿检查结果...", key="bladder_result")
     
@@ -177,6 +188,8 @@ def create_additional_tests_section():
         emg_file = st.file_uploader("上传肛门括约肌肌电图报告", type=['jpg', 'jpeg', 'png', 'pdf'], key="emg_uploader")
         if emg_file is not None:
             st.success("文件上传成功")
+        emg_blob = prefill_report_result(emg_file, "emg_result")
+        display_extract_status("emg_result")
     with emg_col2:
         emg_result = st.text_area("检查结果", placeholder="请输入肛门括约肌肌电图结果...", key="emg_result")
     
@@ -187,6 +200,8 @@ def create_additional_tests_section():
         smell_file = st.file_uploader("上传嗅觉检测报告", type=['jpg', 'jpeg', 'png', 'pdf'], key="smell_uploader")
         if smell_file is not None:
             st.success("文件上传成功")
+        smell_blob = prefill_report_result(smell_file, "smell_result")
+        display_extract_status("smell_result")
     with smell_col2:
         smell_result = st.text_area("检查结果", placeholder="请输入嗅觉检测结果...", key="smell_result")
     
@@ -197,14 +212,16 @@ def create_additional_tests_section():
         ultrasound_file = st.file_uploader("上传黑质超声报告", type=['jpg', 'jpeg', 'png', 'pdf'], key="ultrasound_uploader")
         if ultrasound_file is not None:
             st.success("文件上传成功")
+        ultrasound_blob = prefill_report_result(ultrasound_file, "ultrasound_result")
+        display_extract_status("ultrasound_result")
     with ultrasound_col2:
         ultrasound_result = st.text_area("检查结果", placeholder="请输入黑质超声结果...", key="ultrasound_result")
     
     return {
-        'bladder': {'file': bladder_file, 'result': bladder_result},
-        'emg': {'file': emg_file, 'result': emg_result},
-        'smell': {'file': smell_file, 'result': smell_result},
-        'ultrasound': {'file': ultrasound_file, 'result': ultrasound_result}
+        'bladder': {'file': bladder_file, 'blob': bladder_blob, 'result': bladder_result},
+        'emg': {'file': emg_file, 'blob': emg_blob, 'result': emg_result},
+        'smell': {'file': smell_file, 'blob': smell_blob, 'result': smell_result},
+        'ultrasound': {'file': ultrasound_file, 'blob': ultrasound_blob, 'result': ultrasound_result}
     }
 
 def create_imaging_section():
@@ -218,22 +235,34 @@ def create_imaging_section():
     with mri_col1:
         mri_files = st.file_uploader("上传MRI图像", type=['jpg', 'jpeg', 'png', 'dcm'], 
                                    accept_multiple_files=True, key="mri_uploader")
+        # DICOM文件只解析文件头建立序列索引，普通图像生成缩略图
+        mri_files = mri_files or []
+        is_dicom = [file.name.lower().endswith('.dcm') for file in mri_files]
+        mri_blobs = [store_uploaded_file(file, thumbnail=not dicom) for file, dicom in zip(mri_files, is_dicom)]
         if mri_files:
             st.success(f"已上传 {len(mri_files)} 个文件")
-            for file in mri_files[:3]:  # 显示前3个文件的预览
-                st.image(file, caption=file.name, width=150)
+            images = [(file, digest) for file, digest, dicom in zip(mri_files, mri_blobs, is_dicom) if not dicom]
+            for file, digest in images[:3]:  # 显示前3个图像文件的缩略图
+                display_blob_image(digest, caption=file.name, width=150)
+        mri_series = display_dicom_series([digest for digest, dicom in zip(mri_blobs, is_dicom) if dicom])
+        mri_quant = display_mri_quantification(mri_series)
     with mri_col2:
         mri_conclusion = st.text_area("MRI检查结论", 
                                     placeholder="请输入MRI影像学结论，特别注意以下特征：\n- 壳核、脑桥、小脑中脚和小脑萎缩\n- 壳核信号降低\n- 脑桥十字形高信号（十字征）\n- 中脑萎缩（蜂鸟征）\n- MRPI指数",
                                     height=150,
                                     key="mri_conclusion")
     
+    # 3D T1自动测量的结果作为以下特征的默认值（脑桥十字征为T2像征象，不做预填）
+    suggested_msa = mri_quant["msa_features"] if mri_quant else []
+    suggested_psp = mri_quant["psp_features"] if mri_quant else []
+    suggested_mrpi = float(mri_quant["mrpi_index"] or 0.0) if mri_quant else 0.0
+
     # MSA特异性影像学特征
     st.write("**MSA特异性影像学特征**")
     msa_features = []
     col1, col2, col3 = st.columns(3)
     with col1:
-        putamen_atrophy = st.checkbox("壳核萎缩")
+        putamen_atrophy = st.checkbox("壳核萎缩", value="壳核萎缩" in suggested_msa)
         if putamen_atrophy:
             msa_features.append("壳核萎缩")
     with col2:
@@ -241,7 +270,7 @@ def create_imaging_section():
         if pontine_cross:
             msa_features.append("脑桥十字征")
     with col3:
-        middle_cerebellar = st.checkbox("小脑中脚异常")
+        middle_cerebellar = st.checkbox("小脑中脚异常", value="小脑中脚异常" in suggested_msa)
         if middle_cerebellar:
             msa_features.append("小脑中脚异常")
     
@@ -250,16 +279,18 @@ def create_imaging_section():
     psp_features = []
     col1, col2 = st.columns(2)
     with col1:
-        hummingbird_sign = st.checkbox("蜂鸟征")
+        hummingbird_sign = st.checkbox("蜂鸟征", value="蜂鸟征" in suggested_psp)
         if hummingbird_sign:
             psp_features.append("蜂鸟征")
     with col2:
-        mrpi_index = st.number_input("MRPI指数", min_value=0.0, value=0.0, step=0.1)
-        if mrpi_index > 13.55:
+        mrpi_index = st.number_input("MRPI指数", min_value=0.0, value=suggested_mrpi, step=0.1)
+        if mrpi_index > MRPI_THRESHOLD:
             psp_features.append(f"MRPI指数异常({mrpi_index})")
     
     return {
-        'mri_files': mri_files,
+        'mri_blobs': mri_blobs,
+        'mri_series': mri_series,
+        'mri_quant': mri_quant,
         'mri_conclusion': mri_conclusion,
         'msa_features': msa_features,
         'psp_features': psp_features,
@@ -270,54 +301,30 @@ def perform_diagnosis(warning_signs, supportive_criteria, msa_features, psp_feat
     """执行诊断逻辑"""
     st.subheader("诊断结果")
     
-    num_warning_signs = len(warning_signs)
-    num_supportive_criteria = len(supportive_criteria)
+    result = classify_primary_vs_atypical(warning_signs, supportive_criteria, msa_features, psp_features, mrpi_index)
     
-    # 诊断逻辑
-    if num_warning_signs == 0:
+    if result["diagnosis"] == "原发性帕金森病":
         st.success("🟢 **原发性帕金森综合征**")
-        st.info("未发现警示征象，符合原发性帕金森病诊断")
-        return "原发性帕金森病"
-    
-    elif num_warning_signs == 1:
-        if num_supportive_criteria >= 1:
-            st.success("🟢 **原发性帕金森综合征**")
-            st.info("1条警示征象被1条支持条件抵消")
-            return "原发性帕金森病"
-        else:
-            st.error("🔴 **叠加性帕金森综合征**")
-            st.info("1条警示征象未被支持条件抵消")
-            return "帕金森叠加综合征"
-    
-    elif num_warning_signs == 2:
-        if num_supportive_criteria >= 2:
-            st.success("🟢 **原发性帕金森综合征**")
-            st.info("2条警示征象被2条支持条件抵消")
-            return "原发性帕金森病"
-        else:
-            st.error("🔴 **叠加性帕金森综合征**")
-            st.info("2条警示征象未被足够支持条件抵消")
-            return "帕金森叠加综合征"
-    
-    else:  # num_warning_signs >= 3
+    else:
         st.error("🔴 **叠加性帕金森综合征**")
-        st.info("3条或以上警示征象，诊断不能成立")
-        
-        # 进一步区分叠加综合征类型
-        if any(sign in [1, 3, 4, 5, 7, 9] for sign in warning_signs) or msa_features:
-            st.warning("⚠️ **高度怀疑多系统萎缩（MSA）**")
-            if msa_features:
-                st.write(f"**MSA影像学特征：** {', '.join(msa_features)}")
-        
-        if any(sign in [1, 3, 6] for sign in warning_signs) or psp_features:
-            st.warning("⚠️ **高度怀疑进行性核上性麻痹（PSP）**")
-            if psp_features:
-                st.write(f"**PSP影像学特征：** {', '.join(psp_features)}")
-            if mrpi_index > 13.55:
-                st.write(f"**MRPI指数：** {mrpi_index} (异常)")
-        
-        return "帕金森叠加综合征"
+    st.info(result["reason"])
+    
+    # 进一步区分叠加综合征类型
+    if result["suspect_msa"]:
+        st.warning("⚠️ **高度怀疑多系统萎缩（MSA）**")
+        if msa_features:
+            st.write(f"**MSA影像学特征：** {', '.join(msa_features)}")
+    
+    if result["suspect_psp"]:
+        st.warning("⚠️ **高度怀疑进行性核上性麻痹（PSP）**")
+        if psp_features:
+            st.write(f"**PSP影像学特征：** {', '.join(psp_features)}")
+        if result["mrpi_abnormal"]:
+            st.write(f"**MRPI指数：** {mrpi_index} (异常)")
+    
+    return result["diagnosis"]
 
+@timed_rerun("步骤5")
 def main():
     # 显示侧边栏
     from components.current_patient_sidebar import display_current_patient_sidebar
@@ -367,6 +374,12 @@ def main():
             
             # 4. 影像学检查
             imaging_data = create_imaging_section()
+            st.session_state.page5_imaging = {
+                'mri_blobs': imaging_data['mri_blobs'],
+                'msa_features': imaging_data['msa_features'],
+                'psp_features': imaging_data['psp_features'],
+                'mrpi_index': imaging_data['mrpi_index']
+            }
             
             # 诊断按钮
             if st.button("进行综合诊断", type="primary", use_container_width=True):
@@ -378,19 +391,22 @@ def main():
                     imaging_data['mrpi_index']
                 )
                 st.session_state.page5_diagnosis_result = diagnosis_result
-                
-                # 更新诊断标签
-                if diagnosis_result == "原发性帕金森病":
-                    st.session_state.patient_info['diagnosis_tag'] = '原发性帕金森综合征'
-                else:
-                    st.session_state.patient_info['diagnosis_tag'] = '叠加性帕金森综合征'
+                dispatch_diagnosis_event(Step5Diagnosed(diagnosis_result))
+                save_current_patient()
         
         else:
+            st.session_state.page5_imaging = {'msa_features': [], 'psp_features': [], 'mrpi_index': 0}
+            
             # 如果没有警示征象，可以直接诊断
             if st.button("进行诊断", type="primary", use_container_width=True):
                 diagnosis_result = perform_diagnosis([], supportive_criteria, [], [], 0)
                 st.session_state.page5_diagnosis_result = diagnosis_result
-                st.session_state.patient_info['diagnosis_tag'] = '原发性帕金森综合征'
+                dispatch_diagnosis_event(Step5Diagnosed(diagnosis_result))
+                save_current_patient()
+        
+        # 5. 随访记录（时间序列）
+        st.markdown("---")
+        display_visit_history()
     
     with col2:
         display_patient_info_summary()
@@ -0,0 +1,146 @@
+# pages/管理：运行指标.py
+import json
+import streamlit as st
+from metrics import registry
+from deepseek_client import get_deepseek_client
+from job_queue import get_job_queue
+from blob_store import get_blob_store
+from prompt_builder import get_prompt_size_report
+from rules_first import (
+    EXECUTION_MODES, NARRATIVE_MODES, get_execution_mode, get_narrative_mode, set_execution_mode,
+    get_discrepancy_report
+)
+from components.render_utils import timed_rerun
+
+
+def series_label(labels):
+    """将标签字典格式化为图表中的系列名"""
+    return ", ".join(f"{key}={value}" for key, value in labels.items()) or "全部"
+
+
+def display_counter(name, metric):
+    """以表格和柱状图显示一个计数器"""
+    import pandas as pd
+    rows = [{"标签": series_label(item["labels"]), "次数": item["value"]} for item in metric["series"]]
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    st.bar_chart(pd.DataFrame(rows).set_index("标签"))
+
+
+def display_histogram(name, metric):
+    """显示一个直方图：各系列次数、平均值，以及分桶分布"""
+    import pandas as pd
+    summary = [{
+        "标签": series_label(item["labels"]),
+        "次数": item["count"],
+        "平均(秒)": round(item["mean"], 4),
+        "总计(秒)": round(item["sum"], 3),
+    } for item in metric["series"]]
+    st.dataframe(pd.DataFrame(summary), use_container_width=True, hide_index=True)
+
+    buckets = pd.DataFrame({
+        series_label(item["labels"]): item["buckets"] for item in metric["series"]
+    })
+    # 分桶上界按数值排序，避免"10"排在"2.5"之前
+    buckets.index = buckets.index.astype(float)
+    buckets.index.name = "≤秒"
+    st.bar_chart(buckets)
+
+
+def display_rules_first():
+    """执行模式切换，以及规则优先模式下规则与LLM结论的比对报告"""
+    st.subheader("规则优先模式")
+    col1, col2 = st.columns(2)
+    with col1:
+        mode = st.radio("执行模式（本进程）", EXECUTION_MODES, index=EXECUTION_MODES.index(get_execution_mode()),
+                        horizontal=True, help="llm：由DeepSeek给出结论；rules_first：本地规则直接给出结论")
+    with col2:
+        narrative_mode = st.radio("LLM叙述生成方式", NARRATIVE_MODES,
+                                  index=NARRATIVE_MODES.index(get_narrative_mode()), horizontal=True,
+                                  help="规则优先模式下：off不调用；lazy首次查看时调用；background立即后台调用")
+    if mode != get_execution_mode() or narrative_mode != get_narrative_mode():
+        set_execution_mode(mode, narrative_mode)
+
+    report = get_discrepancy_report()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("已比对", report["compared"])
+    col2.metric("结论不一致", report["disagreed"])
+    col3.metric("不一致比例", f"{report['disagreed'] / report['compared']:.0%}" if report["compared"] else "-")
+    if report["cases"]:
+        import pandas as pd
+        st.dataframe(pd.DataFrame([{
+            "评估": case["assessor"],
+            "时间": pd.to_datetime(case["timestamp"], unit='s'),
+            "字段": difference["field"],
+            "规则结论": str(difference["rules"]),
+            "LLM结论": str(difference["llm"]),
+        } for case in reversed(report["cases"]) for difference in case["differences"]]),
+            use_container_width=True, hide_index=True)
+    elif report["compared"]:
+        st.success("规则与LLM结论全部一致")
+    else:
+        st.info("本进程尚未进行规则与LLM结论的比对")
+
+
+@timed_rerun("运行指标")
+def main():
+    st.header("运行指标")
+    st.markdown("本进程内DeepSeek请求、评估、页面重跑等指标（重启后清零）。")
+
+    snapshot = registry.to_dict()
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("导出Prometheus文本", registry.to_prometheus(),
+                           file_name="metrics.prom", mime="text/plain", use_container_width=True)
+    with col2:
+        st.download_button("下载JSON", json.dumps(snapshot, ensure_ascii=False, indent=2),
+                           file_name="metrics.json", mime="application/json", use_container_width=True)
+    with col3:
+        if st.button("保存JSON到本地", use_container_width=True):
+            st.success(f"已写入 {registry.dump_json()}")
+
+    for name, metric in snapshot.items():
+        st.subheader(name)
+        st.caption(metric["help"])
+        if not metric["series"]:
+            st.info("暂无数据")
+        elif metric["type"] == "counter":
+            display_counter(name, metric)
+        else:
+            display_histogram(name, metric)
+
+    # 各评估最近一次提示词的token估算（压缩前后的对比由prompt_compare.py离线计算）
+    st.subheader("提示词压缩")
+    prompt_report = get_prompt_size_report()
+    if prompt_report:
+        import pandas as pd
+        st.dataframe(pd.DataFrame([{
+            "评估": assessor,
+            "提示词(估算token)": sizes["total_tokens"],
+            "其中可缓存前缀": sizes["cacheable_prefix_tokens"],
+            "每次变化部分": sizes["dynamic_tokens"],
+        } for assessor, sizes in prompt_report.items()]), use_container_width=True, hide_index=True)
+        st.caption("压缩前后的对比：python prompt_compare.py")
+    else:
+        st.info("本进程尚未构建过评估提示词")
+
+    display_rules_first()
+
+    # 各组件自身维护的统计
+    st.subheader("组件状态")
+    deepseek_client = get_deepseek_client()
+    stats = {
+        "连接池": deepseek_client.get_pool_stats(),
+        "响应缓存": deepseek_client.get_cache_stats(),
+        "请求合并": deepseek_client.get_coalesce_stats(),
+        "弹性层": deepseek_client.get_resilience_stats(),
+        "后台任务队列": get_job_queue().get_stats(),
+        "影像文件存储": get_blob_store().get_stats(),
+    }
+    for title, value in stats.items():
+        with st.expander(title):
+            st.json(value)
+
+
+if __name__ == "__main__":
+    main()
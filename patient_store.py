@@ -0,0 +1,339 @@
+# patient_store.py
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# 需要持久化的会话状态键（覆盖步骤1-5）
+PATIENT_STATE_KEYS = [
+    'patient_info',              # 步骤1
+    'exclusion_criteria',        # 步骤1/3
+    'updrs_data',                # 步骤2
+    'parkinson_assessment',
+    'severity_assessment',
+    'exclusion_assessment',      # 步骤3
+    'lab_data',                  # 步骤4
+    'ai_analysis_result',
+    'selected_conditions',
+    'ct_data',
+    'mri_data',
+    'page5_warning_signs',       # 步骤5
+    'page5_supportive_criteria',
+    'page5_diagnosis_result',
+    'page5_imaging',
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    gender TEXT,
+    birth_date TEXT,
+    diagnosis_tag TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_patients_name ON patients(name);
+CREATE INDEX IF NOT EXISTS idx_patients_tag ON patients(diagnosis_tag, updated_at);
+
+CREATE TABLE IF NOT EXISTS patient_steps (
+    patient_id INTEGER NOT NULL REFERENCES patients(patient_id) ON DELETE CASCADE,
+    step_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (patient_id, step_key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS patient_visits (
+    patient_id INTEGER NOT NULL REFERENCES patients(patient_id) ON DELETE CASCADE,
+    visit_no INTEGER NOT NULL,
+    visited_at REAL NOT NULL,
+    inputs TEXT NOT NULL,
+    step_digests TEXT NOT NULL,
+    results TEXT NOT NULL,
+    PRIMARY KEY (patient_id, visit_no)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS step_results (
+    step TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (step, digest)
+) WITHOUT ROWID;
+"""
+
+
+def encode_state_value(value):
+    """将会话状态中的值编码为可JSON序列化的结构"""
+    # pandas尚未导入时会话中不可能有DataFrame，无需为类型判断而导入pandas
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(value, pd.DataFrame):
+        return {"__dataframe__": value.to_json(orient='split', force_ascii=False)}
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, dict):
+        return {str(k): encode_state_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_state_value(v) for v in value]
+    if hasattr(value, 'item') and not hasattr(value, 'read'):
+        # numpy标量
+        return value.item()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    # 上传文件等无法持久化的对象不写入数据库
+    return None
+
+
+def decode_state_value(value):
+    if isinstance(value, dict):
+        if "__dataframe__" in value:
+            from io import StringIO
+            import pandas as pd
+            return pd.read_json(StringIO(value["__dataframe__"]), orient='split', dtype=False)
+        if "__datetime__" in value:
+            return datetime.datetime.fromisoformat(value["__datetime__"])
+        if "__date__" in value:
+            return datetime.date.fromisoformat(value["__date__"])
+        return {k: decode_state_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_state_value(v) for v in value]
+    return value
+
+
+class PatientStore:
+    """
+    基于SQLite（WAL模式）的患者数据持久化存储，可在多个Streamlit会话/进程间共享
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite连接不能跨线程使用，每个线程各持有一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def save_patient_state(self, state, patient_id=None):
+        """
+        在一个事务内批量保存患者各步骤数据，内容未变化的步骤不会重写
+
+        Args:
+            state: 会话状态（或包含PATIENT_STATE_KEYS的字典）
+            patient_id: 已有患者ID，为None时新建患者
+
+        Returns:
+            int: 患者ID
+        """
+        patient_info = state.get('patient_info') or {}
+        now = time.time()
+        birth_date = patient_info.get('birth_date')
+
+        rows = []
+        for key in PATIENT_STATE_KEYS:
+            if key not in state:
+                continue
+            payload = json.dumps(encode_state_value(state[key]), ensure_ascii=False, sort_keys=True)
+            rows.append((key, payload, hashlib.sha1(payload.encode('utf-8')).hexdigest()))
+
+        conn = self._connection()
+        with conn:
+            if patient_id is None:
+                cursor = conn.execute(
+                    "INSERT INTO patients (name, gender, birth_date, diagnosis_tag, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (patient_info.get('name', ''), patient_info.get('gender', ''),
+                     str(birth_date) if birth_date else None,
+                     patient_info.get('diagnosis_tag'), now, now)
+                )
+                patient_id = cursor.lastrowid
+            else:
+                conn.execute(
+                    "UPDATE patients SET name = ?, gender = ?, birth_date = ?, diagnosis_tag = ?, updated_at = ? "
+                    "WHERE patient_id = ?",
+                    (patient_info.get('name', ''), patient_info.get('gender', ''),
+                     str(birth_date) if birth_date else None,
+                     patient_info.get('diagnosis_tag'), now, patient_id)
+                )
+
+            conn.executemany(
+                "INSERT INTO patient_steps (patient_id, step_key, payload, digest, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(patient_id, step_key) DO UPDATE SET "
+                "payload = excluded.payload, digest = excluded.digest, updated_at = excluded.updated_at "
+                "WHERE patient_steps.digest != excluded.digest",
+                [(patient_id, key, payload, digest, now) for key, payload, digest in rows]
+            )
+        return patient_id
+
+    def load_patient_state(self, patient_id):
+        """
+        读取患者的全部步骤数据（按主键索引一次查询）
+
+        Returns:
+            dict: 会话状态键 -> 值
+        """
+        rows = self._connection().execute(
+            "SELECT step_key, payload FROM patient_steps WHERE patient_id = ?", (patient_id,)
+        ).fetchall()
+        return {row['step_key']: decode_state_value(json.loads(row['payload'])) for row in rows}
+
+    def find_patients(self, name=None, patient_id=None, diagnosis_tag=None, limit=50):
+        """
+        按姓名前缀、患者ID或诊断标签查找患者
+
+        Returns:
+            list: 患者摘要字典列表（按最近更新时间排序）
+        """
+        clauses = []
+        params = []
+        if patient_id is not None:
+            clauses.append("patient_id = ?")
+            params.append(patient_id)
+        if name:
+            # 前缀范围查询可以使用name索引
+            clauses.append("name >= ? AND name < ?")
+            params.extend([name, name + '\U0010ffff'])
+        if diagnosis_tag:
+            clauses.append("diagnosis_tag = ?")
+            params.append(diagnosis_tag)
+
+        sql = "SELECT patient_id, name, gender, birth_date, diagnosis_tag, updated_at FROM patients"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(limit)
+
+        return [dict(row) for row in self._connection().execute(sql, params).fetchall()]
+
+    def add_visit(self, patient_id, inputs, step_digests, results, visited_at=None):
+        """
+        追加一次随访记录
+
+        Args:
+            patient_id: 患者ID
+            inputs: 本次随访的输入数据（UPDRS评分、警示征象、影像学特征等）
+            step_digests: 各步骤输入摘要
+            results: 各步骤结果
+
+        Returns:
+            int: 随访序号（从1开始）
+        """
+        conn = self._connection()
+        with conn:
+            row = conn.execute(
+                "SELECT COALESCE(MAX(visit_no), 0) + 1 FROM patient_visits WHERE patient_id = ?", (patient_id,)
+            ).fetchone()
+            visit_no = row[0]
+            conn.execute(
+                "INSERT INTO patient_visits (patient_id, visit_no, visited_at, inputs, step_digests, results) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (patient_id, visit_no, visited_at or time.time(),
+                 json.dumps(encode_state_value(inputs), ensure_ascii=False, sort_keys=True),
+                 json.dumps(step_digests, sort_keys=True),
+                 json.dumps(encode_state_value(results), ensure_ascii=False, sort_keys=True))
+            )
+        return visit_no
+
+    def update_visit_results(self, patient_id, visit_no, step_digests, results):
+        """更新某次随访的步骤摘要与结果（规则版本变化后的增量重算使用）"""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "UPDATE patient_visits SET step_digests = ?, results = ? WHERE patient_id = ? AND visit_no = ?",
+                (json.dumps(step_digests, sort_keys=True),
+                 json.dumps(encode_state_value(results), ensure_ascii=False, sort_keys=True),
+                 patient_id, visit_no)
+            )
+
+    def latest_visit_no(self, patient_id):
+        """读取患者最近一次随访的序号（无随访时为0），不解码随访内容"""
+        row = self._connection().execute(
+            "SELECT COALESCE(MAX(visit_no), 0) FROM patient_visits WHERE patient_id = ?", (patient_id,)
+        ).fetchone()
+        return row[0]
+
+    def list_visits(self, patient_id, include_inputs=True):
+        """
+        按时间顺序读取患者的全部随访记录（按主键索引一次查询）
+
+        Returns:
+            list: 随访字典列表，包含visit_no、visited_at、inputs、step_digests、results
+        """
+        columns = "visit_no, visited_at, step_digests, results" + (", inputs" if include_inputs else "")
+        rows = self._connection().execute(
+            f"SELECT {columns} FROM patient_visits WHERE patient_id = ? ORDER BY visit_no", (patient_id,)
+        ).fetchall()
+        visits = []
+        for row in rows:
+            visit = {
+                "visit_no": row['visit_no'],
+                "visited_at": row['visited_at'],
+                "step_digests": json.loads(row['step_digests']),
+                "results": decode_state_value(json.loads(row['results'])),
+            }
+            if include_inputs:
+                visit["inputs"] = decode_state_value(json.loads(row['inputs']))
+            visits.append(visit)
+        return visits
+
+    def get_step_results(self, step, digests):
+        """批量读取已缓存的步骤结果，返回 摘要 -> 结果"""
+        digests = list(digests)
+        if not digests:
+            return {}
+        placeholders = ", ".join("?" * len(digests))
+        rows = self._connection().execute(
+            f"SELECT digest, result FROM step_results WHERE step = ? AND digest IN ({placeholders})",
+            [step] + digests
+        ).fetchall()
+        return {row['digest']: decode_state_value(json.loads(row['result'])) for row in rows}
+
+    def put_step_results(self, rows):
+        """批量写入步骤结果缓存，rows为(步骤, 摘要, 结果)列表"""
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO step_results (step, digest, result) VALUES (?, ?, ?)",
+                [(step, digest, json.dumps(encode_state_value(result), ensure_ascii=False, sort_keys=True))
+                 for step, digest, result in rows]
+            )
+
+    def delete_patient(self, patient_id):
+        """删除患者及其全部步骤数据与随访记录"""
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM patient_visits WHERE patient_id = ?", (patient_id,))
+            conn.execute("DELETE FROM patient_steps WHERE patient_id = ?", (patient_id,))
+            conn.execute("DELETE FROM patients WHERE patient_id = ?", (patient_id,))
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_patient_store():
+    """获取进程级共享的患者存储（路径来自环境变量PD_PATIENT_DB）"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = PatientStore(os.getenv('PD_PATIENT_DB', os.path.join('data', 'patients.db')))
+        return _default_store
@@ -0,0 +1,115 @@
+# prompt_builder.py
+"""
+提示词构建辅助：静态规则文本放入系统提示词（各次调用完全相同的前缀，可命中DeepSeek上下文缓存），
+用户提示词只包含紧凑编码的患者数据；并按评估记录可缓存前缀与每次变化部分的token估算值。
+压缩前后的对比见一次性脚本prompt_compare.py（不在评估路径上构建压缩前的提示词）。
+"""
+import re
+import threading
+
+from metrics import registry
+
+PROMPT_TOKENS = registry.counter(
+    "prompt_tokens_estimated_total",
+    "提示词token估算值，按assessor和part（system可缓存前缀/user每次变化部分）区分")
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+_ITEM_CODE_PATTERN = re.compile(r'^\s*(\d+\.\d+)')
+
+_report_lock = threading.Lock()
+_latest_sizes = {}
+# 系统提示词为模块常量，只估算一次
+_system_tokens = {}
+
+
+def estimate_tokens(text):
+    """
+    估算文本的token数（DeepSeek经验值：1个中文字符约0.6 token，1个英文字符约0.3 token）
+
+    Returns:
+        int: 估算的token数
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    return int(round(cjk * 0.6 + (len(text) - cjk) * 0.3))
+
+
+def encode_scores(items, scores):
+    """
+    将量表评分紧凑编码为"编号=分数"，如"3.1=0，3.2=1"（无编号的项目保留全名）
+
+    Args:
+        items: 检测项目名称序列
+        scores: 对应评分序列
+    """
+    parts = []
+    for item, score in zip(items, scores):
+        match = _ITEM_CODE_PATTERN.match(str(item))
+        code = match.group(1) if match else str(item).strip()
+        parts.append(f"{code}={score}")
+    return "，".join(parts)
+
+
+def compact_lab_rows(lab_data):
+    """
+    血检数据的紧凑文本：去掉分类列与列宽填充，跳过结果为空的行，
+    定性项目（参考值为阴性）只保留结果
+
+    Args:
+        lab_data: 含名称、结果、单位、参考值列的DataFrame
+
+    Returns:
+        str: 每行一个项目，如"钠(Na)=128 mmol/L（135-145）"
+    """
+    import pandas as pd
+    lines = []
+    for name, result, unit, reference in zip(lab_data['名称'], lab_data['结果'],
+                                              lab_data['单位'], lab_data['参考值']):
+        if pd.isna(result) or str(result).strip() == '':
+            continue
+        result = str(result).strip()
+        reference = '' if pd.isna(reference) else str(reference).strip()
+        if reference in ('阴性', '阳性'):
+            lines.append(f"{name}={result}")
+            continue
+        unit = '' if pd.isna(unit) else str(unit).strip()
+        line = f"{name}={result}"
+        if unit:
+            line += f" {unit}"
+        if reference:
+            line += f"（{reference}）"
+        lines.append(line)
+    return "\n".join(lines) if lines else "（所有项目结果均未填写）"
+
+
+def record_prompt_size(assessor, system_prompt, user_prompt):
+    """
+    记录一次评估提示词的token估算值
+
+    Args:
+        assessor: 评估名称（updrs/exclusion/blood）
+        system_prompt: 系统提示词（各次调用相同，可命中上下文缓存）
+        user_prompt: 用户提示词（每次都需完整计费）
+    """
+    cacheable = _system_tokens.get(system_prompt)
+    if cacheable is None:
+        cacheable = _system_tokens.setdefault(system_prompt, estimate_tokens(system_prompt))
+    dynamic = estimate_tokens(user_prompt)
+    PROMPT_TOKENS.inc(cacheable, assessor=assessor, part="system")
+    PROMPT_TOKENS.inc(dynamic, assessor=assessor, part="user")
+    with _report_lock:
+        _latest_sizes[assessor] = {
+            "total_tokens": cacheable + dynamic,
+            "cacheable_prefix_tokens": cacheable,
+            "dynamic_tokens": dynamic,
+        }
+
+
+def get_prompt_size_report():
+    """
+    获取各评估最近一次提示词的token估算
+
+    Returns:
+        dict: {assessor: {"total_tokens", "cacheable_prefix_tokens", "dynamic_tokens"}}
+    """
+    with _report_lock:
+        return {assessor: dict(sizes) for assessor, sizes in _latest_sizes.items()}
@@ -0,0 +1,132 @@
+# prompt_compare.py
+"""
+提示词压缩效果的一次性对比：对同一份输入分别构建压缩前（每次重复发送规则文本、整张表格to_string）
+与压缩后（prompt_builder）的提示词，输出各评估的token估算值。
+
+压缩前的提示词只在此脚本中构建，评估路径上只记录压缩后的提示词大小。
+
+用法：
+    python prompt_compare.py [--lab-csv 血检数据.csv]
+
+未指定血检CSV时使用默认模板；UPDRS评分与绝对排除标准使用全0/全“否”的默认输入。
+"""
+import argparse
+import sys
+
+import pandas as pd
+
+from prompt_builder import estimate_tokens
+from updrs_dia import STANDARD_UPDRS_ITEMS, UPDRS_RULES, UPDRS_FORMAT_PROMPT, UPDRS_SYSTEM_PROMPT, build_updrs_prompt
+from aec_dia import (
+    EXCLUSION_CRITERIA, EXCLUSION_RULE, EXCLUSION_OUTPUT_TEMPLATE,
+    EXCLUSION_FORMAT_PROMPT, EXCLUSION_SYSTEM_PROMPT, build_exclusion_prompt
+)
+from ai_blood_analysis import BLOOD_SYSTEM_PROMPT, BloodTestAnalyzer
+from lab_utils import create_default_lab_data
+
+
+def build_updrs_prompt_legacy(updrs_data):
+    """压缩前的UPDRS用户提示词（每次重复发送规则文本）"""
+
+    # 将DataFrame转换为易读的文本格式
+    items_text = "".join(
+        f"- {item}: 评分={score}\n"
+        for item, score in zip(updrs_data['检测项目'], updrs_data['评分'])
+    )
+
+    return f"""请读取UPDRS III的检测项和对应评分。这些检测项是用来判断患者是否患有帕金森综合症的，判断步骤如下：
+
+{UPDRS_RULES}
+
+当前患者的UPDRS-III评分数据：
+{items_text}
+
+请你根据上述的判断步骤，仿照给定的格式输出详细的UPDRSIII标准核对结果。"""
+
+
+def build_exclusion_prompt_legacy(exclusion_data):
+    """压缩前的绝对排除标准用户提示词（每次重复发送判断说明和输出格式）"""
+
+    # 构建标准描述文本
+    criteria_text = ""
+    criteria_count = 0
+    for key, name, description in EXCLUSION_CRITERIA:
+        if key in exclusion_data:
+            criteria_count += 1
+            criteria_text += f"{criteria_count}. {name}: {'是' if exclusion_data[key] else '否'}\n"
+            criteria_text += f"   - 判断: {description}\n\n"
+
+    return f"""请读取绝对排除标准的判断项和对应结果。这些判断项是用来判断患者是否患有原发型帕金森综合症的，判断规则如下：{EXCLUSION_RULE}
+
+当前患者的绝对排除标准评估数据：
+{criteria_text}
+
+请你根据上述的判断规则，仿照如下格式输出详细的绝对排除标准核对结果：
+
+{EXCLUSION_OUTPUT_TEMPLATE.format(count=criteria_count)}"""
+
+
+def build_blood_prompt_legacy(lab_data):
+    """压缩前的血检用户提示词（整张表格to_string）"""
+    return f"""请分析以下血检数据：
+
+{lab_data.to_string()}
+
+请根据分析逻辑判断患者是否为继发性帕金森综合征，并返回指定的JSON格式结果。"""
+
+
+def compare_prompt_sizes(legacy_prompts, compact_prompts):
+    """
+    对比一组提示词压缩前后的token估算值
+
+    Args:
+        legacy_prompts: 压缩前的(系统提示词, 用户提示词)
+        compact_prompts: 压缩后的(系统提示词, 用户提示词)
+
+    Returns:
+        dict: {"legacy_tokens", "compact_tokens", "cacheable_prefix_tokens",
+               "legacy_dynamic_tokens", "dynamic_tokens", "saving_ratio"}
+    """
+    legacy = sum(estimate_tokens(text) for text in legacy_prompts)
+    compact = sum(estimate_tokens(text) for text in compact_prompts)
+    return {
+        "legacy_tokens": legacy,
+        "compact_tokens": compact,
+        "cacheable_prefix_tokens": estimate_tokens(compact_prompts[0]),
+        "legacy_dynamic_tokens": estimate_tokens(legacy_prompts[1]),
+        "dynamic_tokens": estimate_tokens(compact_prompts[1]),
+        "saving_ratio": 1 - compact / legacy if legacy else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="评估提示词压缩前后的token估算对比")
+    parser.add_argument("--lab-csv", help="血检CSV文件（默认使用空白模板）")
+    args = parser.parse_args(argv)
+
+    updrs_data = pd.DataFrame({'检测项目': STANDARD_UPDRS_ITEMS, '评分': [0] * len(STANDARD_UPDRS_ITEMS)})
+    exclusion_data = {key: False for key, _, _ in EXCLUSION_CRITERIA}
+    lab_data = pd.read_csv(args.lab_csv) if args.lab_csv else create_default_lab_data()
+
+    reports = {
+        "updrs": compare_prompt_sizes(
+            (UPDRS_FORMAT_PROMPT, build_updrs_prompt_legacy(updrs_data)),
+            (UPDRS_SYSTEM_PROMPT, build_updrs_prompt(updrs_data))),
+        "exclusion": compare_prompt_sizes(
+            (EXCLUSION_FORMAT_PROMPT, build_exclusion_prompt_legacy(exclusion_data)),
+            (EXCLUSION_SYSTEM_PROMPT, build_exclusion_prompt(exclusion_data))),
+        "blood": compare_prompt_sizes(
+            (BLOOD_SYSTEM_PROMPT, build_blood_prompt_legacy(lab_data)),
+            (BLOOD_SYSTEM_PROMPT, BloodTestAnalyzer()._build_user_prompt(lab_data))),
+    }
+
+    print(f"{'评估':<10}{'压缩前':>8}{'压缩后':>8}{'可缓存前缀':>10}{'压缩前变化部分':>14}{'压缩后变化部分':>14}{'减少':>8}")
+    for assessor, sizes in reports.items():
+        print(f"{assessor:<10}{sizes['legacy_tokens']:>8}{sizes['compact_tokens']:>8}"
+              f"{sizes['cacheable_prefix_tokens']:>10}{sizes['legacy_dynamic_tokens']:>14}"
+              f"{sizes['dynamic_tokens']:>14}{sizes['saving_ratio']:>8.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# report_extract.py
+"""
+辅助检查报告（膀胱残余尿、肛门括约肌肌电图、嗅觉检测、黑质超声）的本地文字提取：
+
+    - PDF：读取文本层（pypdf）；扫描件无文本层时对页面内嵌图像做OCR
+    - 图片：本地OCR（pytesseract + tesseract，语言由环境变量PD_OCR_LANG指定，默认chi_sim+eng）
+
+pypdf与pytesseract均为可选依赖，未安装时对应格式返回错误而不影响页面。
+提取在进程池中执行（环境变量PD_REPORT_WORKERS，默认2），不占用Streamlit的重跑线程和任务队列的工作线程；
+成功的结果按文件内容摘要缓存在data/report_text（环境变量PD_REPORT_TEXT_DIR）。
+"""
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from pypdf import PdfReader
+    PDF_TEXT_SUPPORTED = True
+except ImportError:
+    PdfReader = None
+    PDF_TEXT_SUPPORTED = False
+
+try:
+    import pytesseract
+    from PIL import Image, ImageOps
+    OCR_SUPPORTED = True
+except ImportError:
+    pytesseract = None
+    OCR_SUPPORTED = False
+
+# 提取方法变化时递增，使旧的缓存结果失效
+EXTRACTOR_VERSION = 1
+
+# 最多处理的PDF页数
+MAX_PAGES = int(os.getenv('PD_REPORT_MAX_PAGES', 5))
+
+# 预填到“检查结果”文本框的最大字数
+MAX_SUMMARY_CHARS = 800
+
+# 报告中结论部分的标题，找到时只预填结论部分
+CONCLUSION_HEADINGS = ("诊断意见", "检查结论", "诊断结论", "超声提示", "超声诊断", "检查意见",
+                       "印象", "结论", "提示", "意见")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def ocr_language():
+    return os.getenv('PD_OCR_LANG', 'chi_sim+eng')
+
+
+def is_pdf_bytes(data):
+    """判断文件内容是否为PDF（按文件头，不依赖扩展名）"""
+    return data[:5] == b"%PDF-"
+
+
+def clean_text(text):
+    """去除空行与多余空白；OCR常在汉字之间插入空格，一并去除"""
+    lines = []
+    for line in (text or "").splitlines():
+        line = re.sub(r"[ \t　]+", " ", line).strip()
+        line = re.sub(r"(?<=[一-鿿]) (?=[一-鿿])", "", line)
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def summarize_report(text, max_chars=MAX_SUMMARY_CHARS):
+    """
+    从报告全文中取出用于预填的部分：有结论标题时取结论及其后的内容，否则取全文开头
+
+    Args:
+        text: 清理后的报告全文
+        max_chars: 最大字数
+
+    Returns:
+        str: 预填文本
+    """
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        if line.lstrip("【[ ").startswith(CONCLUSION_HEADINGS):
+            text = "\n".join(lines[index:])
+            break
+    if len(text) > max_chars:
+        text = text[:max_chars].rstrip() + "…"
+    return text
+
+
+def _ocr(image):
+    # 手机拍摄的报告按EXIF方向摆正，灰度图识别更稳定
+    image = ImageOps.exif_transpose(image).convert('L')
+    return pytesseract.image_to_string(image, lang=ocr_language())
+
+
+def extract_pdf_text(path):
+    """
+    提取PDF前MAX_PAGES页的文本层，无文本层且支持OCR时识别页面内嵌图像
+
+    Returns:
+        tuple: (文本, 方法, 页数)
+    """
+    reader = PdfReader(path)
+    pages = reader.pages[:MAX_PAGES]
+    text = "\n".join(page.extract_text() or "" for page in pages)
+    if text.strip() or not OCR_SUPPORTED:
+        return text, "pdf_text", len(pages)
+    parts = []
+    for page in pages:
+        for embedded in page.images:
+            parts.append(_ocr(embedded.image))
+    return "\n".join(parts), "pdf_ocr", len(pages)
+
+
+def extract_image_text(path):
+    """
+    对报告图片做本地OCR
+
+    Returns:
+        tuple: (文本, 方法, 页数)
+    """
+    with Image.open(path) as image:
+        return _ocr(image), "ocr", 1
+
+
+def _cache_path(digest):
+    directory = os.getenv('PD_REPORT_TEXT_DIR', os.path.join('data', 'report_text'))
+    return os.path.join(directory, f"{digest}-v{EXTRACTOR_VERSION}-{ocr_language()}.json")
+
+
+def cached_report_text(digest):
+    """
+    读取已缓存的提取结果
+
+    Returns:
+        dict: 提取结果，未缓存时为None
+    """
+    path = _cache_path(digest)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def extract_report(path, digest):
+    """
+    提取一份报告的文字（在进程池中执行，成功的结果写入缓存）
+
+    Args:
+        path: 文件路径（文件存储中的原文件）
+        digest: 文件内容摘要（缓存键）
+
+    Returns:
+        dict: {"success": True, "text": 全文, "summary": 预填文本, "method": ..., ...}，
+              失败时为{"success": False, "error": ...}
+    """
+    cached = cached_report_text(digest)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        pdf = is_pdf_bytes(f.read(5))
+    if pdf and not PDF_TEXT_SUPPORTED:
+        return {"success": False, "error": "未安装pypdf，无法读取PDF报告（pip install pypdf）"}
+    if not pdf and not OCR_SUPPORTED:
+        return {"success": False, "error": "未安装pytesseract，无法识别图片报告（pip install pytesseract，并安装tesseract）"}
+
+    try:
+        text, method, pages = extract_pdf_text(path) if pdf else extract_image_text(path)
+    except Exception as e:
+        # 损坏的文件、tesseract未安装或缺少语言包等
+        return {"success": False, "error": f"{type(e).__name__}: {e}"}
+    text = clean_text(text)
+    if not text:
+        if pdf and not OCR_SUPPORTED:
+            return {"success": False, "error": "PDF没有文本层（扫描件），安装pytesseract后可识别"}
+        return {"success": False, "error": "未识别到文字"}
+
+    result = {
+        "success": True,
+        "version": EXTRACTOR_VERSION,
+        "method": method,
+        "pages": pages,
+        "text": text,
+        "summary": summarize_report(text),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    path = _cache_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return result
+
+
+def get_extract_executor():
+    """获取进程级共享的报告提取进程池（首次使用时创建）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=int(os.getenv('PD_REPORT_WORKERS', 2)))
+        return _executor
+
+
+def run_extraction(path, digest):
+    """
+    在进程池中提取报告文字（已缓存时直接返回结果，不启动进程）
+
+    Returns:
+        dict | Future: 已缓存的提取结果，或进程池中提取任务的Future（不阻塞调用线程）
+    """
+    cached = cached_report_text(digest)
+    if cached is not None:
+        return cached
+    return get_extract_executor().submit(extract_report, path, digest)
@@ -0,0 +1,335 @@
+# resilience.py
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，打开期间调用直接失败（调用方立即使用回退结果），
+    reset_timeout秒后进入半开状态放行一次试探请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._stats = {"opened": 0, "short_circuited": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        # 调用方已持有锁
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self):
+        """是否放行本次请求（打开状态或半开状态已有试探请求时返回False）"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._stats["short_circuited"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats["opened"] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def record_result(self, result):
+        """
+        按请求结果记录成功或失败；result为None（请求被中途放弃）或不可重试的4xx
+        （请求本身有误，服务端正常）时只释放半开试探名额，不计入连续失败
+        """
+        if result is None or is_client_error(result):
+            with self._lock:
+                self._trial_in_flight = False
+        elif result["success"]:
+            self.record_success()
+        else:
+            self.record_failure()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                **self._stats,
+            }
+
+
+class LatencyTracker:
+    """记录最近若干次成功请求的耗时，用于计算对冲请求的触发阈值（p95）"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """
+        Returns:
+            float: 第q分位耗时（秒），样本不足min_samples时为None
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def is_retryable(result):
+    """
+    429、5xx和连接未建立的异常（connect_error）可重试；读取超时不重试（服务端无响应时
+    重试只会让回退再等一个超时周期），其余失败（如401、400）也不重试
+    """
+    if result.get("success"):
+        return False
+    if result.get("connect_error"):
+        return True
+    status_code = result.get("status_code")
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+def is_client_error(result):
+    """不可重试的4xx响应（429除外）"""
+    status_code = result.get("status_code")
+    return not result.get("success") and status_code is not None and 400 <= status_code < 500 \
+        and status_code != 429
+
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=8.0, retry_after=None):
+    """
+    指数退避加完全抖动（full jitter），服务端给出Retry-After时以其为下限
+
+    Args:
+        attempt: 第几次重试（从0开始）
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    try:
+        if retry_after is not None:
+            delay = max(delay, min(max_delay, float(retry_after)))
+    except ValueError:
+        pass
+    return delay
+
+
+class ResilientCaller:
+    """
+    DeepSeek调用的弹性层：熔断 → 对冲请求 → 429/5xx指数退避重试
+
+    call(func)中的func(on_sent)为一次完整的请求，返回call_deepseek格式的结果字典；
+    请求实际发出时（取得连接后）应调用on_sent(abort)，abort()可中止该请求。
+    主请求在调用方线程中执行，对冲请求在大小为hedge_workers的线程池中执行，
+    线程池无空闲线程时不发出对冲请求。
+    """
+
+    def __init__(self, max_retries=2, base_delay=0.5, max_delay=8.0, retry_budget=45.0,
+                 hedge=True, failure_threshold=5, reset_timeout=30, hedge_workers=10):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="pd-hedge") if hedge else None
+        self._hedge_slots = threading.BoundedSemaphore(hedge_workers)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "hedge_skipped": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def max_call_seconds(self, request_timeout):
+        """
+        一次call的最长耗时上界：每次尝试的超时 × 尝试次数，加上重试退避的时间预算
+
+        Args:
+            request_timeout: 单次请求的超时（秒）
+        """
+        return request_timeout * (self.max_retries + 1) + self.retry_budget
+
+    def circuit_open_result(self):
+        return {
+            "success": False,
+            "error": "DeepSeek服务熔断中，已直接使用本地规则评估",
+            "circuit_open": True
+        }
+
+    def call(self, func):
+        """
+        Returns:
+            dict: 请求结果；熔断打开时立即返回circuit_open失败结果
+        """
+        if not self.breaker.allow():
+            return self.circuit_open_result()
+        self._count("calls")
+
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            result = self._attempt(func)
+            if result["success"]:
+                self.breaker.record_success()
+                return result
+            if not is_retryable(result) or attempt >= self.max_retries:
+                break
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay, result.get("retry_after"))
+            if time.monotonic() - start + delay > self.retry_budget:
+                break
+            time.sleep(delay)
+            attempt += 1
+            self._count("retries")
+
+        self.breaker.record_result(result)
+        return result
+
+    def _attempt(self, func):
+        hedge_after = self.latency.percentile(0.95) if self.hedge else None
+        start = time.monotonic()
+        if hedge_after is None:
+            result = func(_ignore_sent)
+        else:
+            result = self._hedged(func, hedge_after)
+        if result["success"]:
+            self.latency.record(time.monotonic() - start)
+        return result
+
+    def _hedged(self, func, hedge_after):
+        # 主请求在调用方线程中执行；从请求实际发出起超过p95耗时仍未返回时，
+        # 若对冲线程池有空闲线程则发出第二个相同请求；先成功的一方中止另一方
+        lock = threading.Lock()
+        state = {"finished": False, "abort": None, "timer": None, "hedge": None, "winner": None,
+                 "hedge_abort": None, "primary_won": False}
+
+        def on_hedge_sent(abort):
+            with lock:
+                state["hedge_abort"] = abort
+                cancelled = state["primary_won"]
+            if cancelled:
+                # 对冲请求发出前主请求已成功
+                abort()
+
+        def run_hedge():
+            try:
+                result = func(on_hedge_sent)
+            finally:
+                self._hedge_slots.release()
+            if result["success"]:
+                with lock:
+                    if not state["finished"] and state["winner"] is None:
+                        state["winner"] = result
+                        state["abort"]()
+            return result
+
+        def launch_hedge():
+            with lock:
+                if state["finished"]:
+                    return
+                if not self._hedge_slots.acquire(blocking=False):
+                    self._count("hedge_skipped")
+                    return
+                self._count("hedged")
+                state["hedge"] = self._executor.submit(run_hedge)
+
+        def on_sent(abort):
+            timer = threading.Timer(hedge_after, launch_hedge)
+            timer.daemon = True
+            with lock:
+                state["abort"] = abort
+                state["timer"] = timer
+            timer.start()
+
+        result = func(on_sent)
+        hedge_abort = None
+        with lock:
+            state["finished"] = True
+            if state["timer"] is not None:
+                state["timer"].cancel()
+            winner, hedge = state["winner"], state["hedge"]
+            if winner is None and result["success"] and hedge is not None:
+                state["primary_won"] = True
+                hedge_abort = state["hedge_abort"]
+        if hedge_abort is not None:
+            # 主请求先成功时中止仍在进行的对冲请求，释放连接和对冲线程
+            hedge_abort()
+        if winner is None and not result["success"] and hedge is not None:
+            # 主请求失败时等待已发出的对冲请求
+            hedged_result = hedge.result()
+            if hedged_result["success"]:
+                winner = hedged_result
+        if winner is not None:
+            self._count("hedge_wins")
+            return winner
+        return result
+
+    def get_stats(self):
+        """获取弹性层统计（调用、重试、对冲次数和熔断器状态）"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["p95_seconds"] = self.latency.percentile(0.95)
+        stats["breaker"] = self.breaker.get_stats()
+        return stats
+
+
+def _ignore_sent(abort):
+    # 不需要对冲的请求忽略发出通知
+    pass
+
+
+_default_caller = None
+_default_caller_lock = threading.Lock()
+
+
+def get_default_resilient_caller():
+    """获取进程级共享的弹性层（配置来自环境变量），所有会话共用同一个熔断器"""
+    global _default_caller
+    with _default_caller_lock:
+        if _default_caller is None:
+            _default_caller = ResilientCaller(
+                max_retries=int(os.getenv('DEEPSEEK_MAX_RETRIES', 2)),
+                retry_budget=float(os.getenv('DEEPSEEK_RETRY_BUDGET', 45)),
+                hedge=os.getenv('DEEPSEEK_HEDGE', '1') not in ('0', 'false', 'False'),
+                failure_threshold=int(os.getenv('DEEPSEEK_BREAKER_THRESHOLD', 5)),
+                reset_timeout=float(os.getenv('DEEPSEEK_BREAKER_RESET', 30)),
+                # 与http_pool的单主机并发上限（DEEPSEEK_POOL_PER_HOST）一致
+                hedge_workers=int(os.getenv('DEEPSEEK_POOL_PER_HOST', 10))
+            )
+        return _default_caller
@@ -0,0 +1,308 @@
+# result_schema.py
+"""
+DeepSeek结构化输出的解析与校验：
+
+1. 快速解码（安装了orjson时使用orjson，否则使用标准库json）
+2. 本地修复：去掉代码块围栏和JSON前后的说明文字、删除尾随逗号
+3. 按评估的结果结构校验字段并做类型规整（如"true"→True）
+4. 仍无法得到合法结果时，用截断后的原输出向模型发起一次简短的修复请求；再失败则由调用方使用规则回退
+"""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from metrics import registry
+
+LLM_OUTPUT_PARSES = registry.counter(
+    "llm_output_parses_total",
+    "结构化输出解析结果，按schema和outcome（decoded/repaired/reasked/failed）区分")
+
+# 修复请求中原输出的最大字符数
+REPAIR_MAX_CHARS = 2000
+
+REPAIR_SYSTEM_PROMPT = """你是一个JSON格式修复助手。用户会给出一段不符合要求的模型输出、问题说明和所需字段。
+请只返回修复后的JSON对象，不要添加任何解释、代码块标记或其他文字；无法从原输出确定的字段请按其类型给出合理值。"""
+
+_FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+
+_TRUE_TEXTS = ("true", "是", "yes", "1")
+_FALSE_TEXTS = ("false", "否", "no", "0")
+
+
+def loads(text):
+    """快速JSON解码，失败时抛出ValueError"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def repair_json_text(text):
+    """
+    本地修复常见的格式问题：代码块围栏、JSON前后的说明文字、尾随逗号
+
+    Returns:
+        str: 修复后的文本（不保证可解码）
+    """
+    text = text.strip()
+    fence = _FENCE_PATTERN.search(text)
+    if fence:
+        text = fence.group(1).strip()
+    start = text.find('{')
+    end = text.rfind('}')
+    if start != -1 and end > start:
+        text = text[start:end + 1]
+    return _strip_trailing_commas(text)
+
+
+def _strip_trailing_commas(text):
+    # 只删除字符串之外、紧接在}或]之前的逗号，字符串值中的",}"",]"保持原样
+    chars = []
+    in_string = False
+    escaped = False
+    comma = None
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            comma = None
+        elif char == ',':
+            comma = len(chars)
+        elif char in '}]':
+            if comma is not None:
+                chars[comma] = ''
+                comma = None
+        elif not char.isspace():
+            comma = None
+        chars.append(char)
+    return ''.join(chars)
+
+
+def decode_json(text):
+    """
+    解码JSON，直接解码失败时先做本地修复
+
+    Returns:
+        tuple: (解码结果, 是否经过修复)
+
+    Raises:
+        ValueError: 修复后仍无法解码
+    """
+    try:
+        return loads(text), False
+    except ValueError:
+        return loads(repair_json_text(text)), True
+
+
+class Field:
+    """结果字段：kind为bool、int、float、str或list"""
+
+    def __init__(self, name, kind, required=True):
+        self.name = name
+        self.kind = kind
+        self.required = required
+
+    def coerce(self, value):
+        """
+        将值规整为字段类型
+
+        Raises:
+            ValueError: 无法规整
+        """
+        if self.kind is bool:
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, (int, float)) and value in (0, 1):
+                return bool(value)
+            if isinstance(value, str) and value.strip().lower() in _TRUE_TEXTS + _FALSE_TEXTS:
+                return value.strip().lower() in _TRUE_TEXTS
+        elif self.kind is int:
+            if isinstance(value, bool):
+                raise ValueError(f"{self.name}应为整数")
+            if isinstance(value, int):
+                return value
+            number = float(value)
+            if number.is_integer():
+                return int(number)
+        elif self.kind is float:
+            if not isinstance(value, bool):
+                return float(value)
+        elif self.kind is str:
+            if isinstance(value, str):
+                return value
+            if isinstance(value, (list, dict)):
+                return json.dumps(value, ensure_ascii=False)
+            return str(value)
+        elif self.kind is list:
+            if isinstance(value, list):
+                return value
+            if isinstance(value, str):
+                return [value] if value.strip() else []
+        raise ValueError(f"{self.name}应为{self.kind.__name__}类型")
+
+    def describe(self):
+        type_names = {bool: "true/false", int: "整数", float: "数字", str: "字符串", list: "字符串数组"}
+        return f"{self.name}（{type_names[self.kind]}{'' if self.required else '，可选'}）"
+
+
+class ResultSchema:
+    """评估结果结构"""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def validate(self, data):
+        """
+        校验并规整解码后的结果，保留结构之外的字段
+
+        Returns:
+            tuple: (规整后的结果, 错误列表)，有错误时结果为None
+        """
+        if not isinstance(data, dict):
+            return None, ["输出不是JSON对象"]
+        result = dict(data)
+        errors = []
+        for field in self.fields:
+            if field.name not in data or data[field.name] is None:
+                if field.required:
+                    errors.append(f"缺少字段{field.name}")
+                else:
+                    # 缺少的可选字段保持为None，不以0、空字符串等默认值冒充模型给出的结果
+                    result[field.name] = None
+                continue
+            try:
+                result[field.name] = field.coerce(data[field.name])
+            except (TypeError, ValueError):
+                errors.append(f"字段{field.name}类型错误，应为{field.describe()}")
+        if errors:
+            return None, errors
+        return result, []
+
+    def describe(self):
+        return "、".join(field.describe() for field in self.fields)
+
+
+UPDRS_RESULT_SCHEMA = ResultSchema("updrs", [
+    Field("has_parkinson", bool),
+    Field("core_standard_met", bool),
+    Field("rigidity_standard_met", bool),
+    Field("tremor_standard_met", bool),
+    Field("core_items_met", list, required=False),
+    Field("rigidity_score", float, required=False),
+    Field("tremor_items_met", list, required=False),
+    Field("assessment", str),
+])
+
+EXCLUSION_RESULT_SCHEMA = ResultSchema("exclusion", [
+    Field("is_primary_parkinson", bool),
+    Field("total_criteria", int, required=False),
+    Field("positive_criteria_count", int, required=False),
+    Field("positive_criteria_details", list, required=False),
+    Field("assessment", str),
+])
+
+BLOOD_RESULT_SCHEMA = ResultSchema("blood", [
+    Field("diagnosis_type", str),
+    Field("diagnosis_label", str, required=False),
+    Field("abnormal_items", list, required=False),
+    Field("reasoning", str),
+    Field("suggested_conditions", list),
+])
+
+
+def parse_content(content, schema):
+    """
+    解码、本地修复并校验模型输出
+
+    Returns:
+        tuple: (合法结果或None, 错误列表, 是否经过本地修复)
+    """
+    try:
+        data, repaired = decode_json(content)
+    except ValueError as e:
+        return None, [f"JSON无法解析: {e}"], True
+    result, errors = schema.validate(data)
+    return result, errors, repaired
+
+
+def conforms(result, schema):
+    """成功结果的内容能否在本地（不发起修复请求）解析为符合结构的结果，用于决定是否缓存"""
+    if not result.get("success"):
+        return False
+    parsed, _, _ = parse_content(result.get("content") or "", schema)
+    return parsed is not None
+
+
+def build_repair_prompt(content, errors, schema):
+    """构建修复请求的用户提示词（原输出截断到REPAIR_MAX_CHARS字符）"""
+    truncated = content[:REPAIR_MAX_CHARS]
+    note = "（已截断）" if len(content) > REPAIR_MAX_CHARS else ""
+    return f"""问题：{'；'.join(errors)}
+所需字段：{schema.describe()}
+
+原输出{note}：
+{truncated}"""
+
+
+def _local_outcome(parsed, repaired, schema):
+    if parsed is not None:
+        LLM_OUTPUT_PARSES.inc(schema=schema.name, outcome="repaired" if repaired else "decoded")
+
+
+def parse_llm_result(result, schema, client=None):
+    """
+    将call_deepseek的成功结果解析为符合结构的评估结果，必要时发起一次修复请求
+
+    Args:
+        result: call_deepseek返回的成功结果（含content）
+        schema: ResultSchema
+        client: DeepSeekClient，为None时不发起修复请求
+
+    Returns:
+        dict: 合法的评估结果，无法修复时为None（调用方应使用规则回退）
+    """
+    content = result.get("content") or ""
+    parsed, errors, repaired = parse_content(content, schema)
+    _local_outcome(parsed, repaired, schema)
+    if parsed is not None:
+        return parsed
+    if client is None:
+        LLM_OUTPUT_PARSES.inc(schema=schema.name, outcome="failed")
+        return None
+
+    repair = client.call_deepseek(REPAIR_SYSTEM_PROMPT, build_repair_prompt(content, errors, schema), schema=schema)
+    return _accept_repair(repair, schema)
+
+
+async def parse_llm_result_async(result, schema, client=None):
+    """parse_llm_result的异步版本，client为AsyncDeepSeekClient"""
+    content = result.get("content") or ""
+    parsed, errors, repaired = parse_content(content, schema)
+    _local_outcome(parsed, repaired, schema)
+    if parsed is not None:
+        return parsed
+    if client is None:
+        LLM_OUTPUT_PARSES.inc(schema=schema.name, outcome="failed")
+        return None
+
+    repair = await client.call_deepseek(REPAIR_SYSTEM_PROMPT, build_repair_prompt(content, errors, schema),
+                                        schema=schema)
+    return _accept_repair(repair, schema)
+
+
+def _accept_repair(repair, schema):
+    parsed = None
+    if repair["success"]:
+        parsed, _, _ = parse_content(repair.get("content") or "", schema)
+    LLM_OUTPUT_PARSES.inc(schema=schema.name, outcome="reasked" if parsed is not None else "failed")
+    return parsed
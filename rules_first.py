@@ -0,0 +1,245 @@
+# rules_first.py
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from result_schema import parse_llm_result
+
+# 执行模式：llm —— 由DeepSeek给出结论（规则仅作回退）；rules_first —— 本地规则直接给出结论
+EXECUTION_MODES = ("llm", "rules_first")
+# 规则优先模式下LLM叙述的生成方式：off —— 不调用；lazy —— 首次查看时调用；background —— 立即后台调用
+NARRATIVE_MODES = ("off", "lazy", "background")
+
+_settings = {
+    "execution_mode": os.getenv('PD_EXECUTION_MODE', 'llm'),
+    "narrative_mode": os.getenv('PD_NARRATIVE_MODE', 'background'),
+}
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('PD_NARRATIVE_WORKERS', 2)),
+                               thread_name_prefix="llm-narrative")
+# 尚未完成的叙述任务上限（lazy模式下未查看的任务超出时丢弃最早的）、已完成叙述与不一致记录的保留条数
+MAX_PENDING_JOBS = 256
+MAX_FINISHED_NARRATIVES = 256
+MAX_DISCREPANCIES = 500
+
+_lock = threading.Lock()
+_job_ids = itertools.count(1)
+# 未完成的任务（持有患者数据的闭包），完成后即移除，只保留叙述文本
+_jobs = OrderedDict()
+_narratives = OrderedDict()
+_discrepancies = deque(maxlen=MAX_DISCREPANCIES)
+_comparison_count = {"compared": 0, "disagreed": 0}
+
+
+def get_execution_mode():
+    """获取当前执行模式"""
+    return _settings["execution_mode"]
+
+
+def get_narrative_mode():
+    """获取规则优先模式下LLM叙述的生成方式"""
+    return _settings["narrative_mode"]
+
+
+def set_execution_mode(mode, narrative_mode=None):
+    """
+    设置执行模式
+
+    Args:
+        mode: "llm" 或 "rules_first"
+        narrative_mode: 可选，"off"/"lazy"/"background"
+    """
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"无效的执行模式: {mode}")
+    if narrative_mode is not None and narrative_mode not in NARRATIVE_MODES:
+        raise ValueError(f"无效的叙述生成方式: {narrative_mode}")
+    _settings["execution_mode"] = mode
+    if narrative_mode is not None:
+        _settings["narrative_mode"] = narrative_mode
+
+
+def is_rules_first():
+    return _settings["execution_mode"] == "rules_first"
+
+
+def run_rules_first(assessor, rules_result, llm_call, verdict_keys, narrative_field, schema):
+    """
+    规则优先执行：立即返回本地规则结论，LLM仅用于生成可选叙述并核对结论
+
+    Args:
+        assessor: 评估器名称（如"updrs"、"exclusion"）
+        rules_result: 本地规则评估结果
+        llm_call: 无参函数，返回call_deepseek格式的结果
+        verdict_keys: 需要与LLM结论比对的字段
+        narrative_field: LLM结果中的叙述字段名
+        schema: LLM结果的结构（result_schema.ResultSchema），比对前按其校验并规整类型
+
+    Returns:
+        dict: 规则评估结果（附带source和narrative_job字段）
+    """
+    result = dict(rules_result)
+    result["source"] = "rules"
+
+    narrative_mode = _settings["narrative_mode"]
+    if narrative_mode == "off":
+        return result
+
+    job_id = f"{assessor}-{next(_job_ids)}"
+    with _lock:
+        _jobs[job_id] = {
+            "assessor": assessor,
+            "rules_result": rules_result,
+            "llm_call": llm_call,
+            "verdict_keys": verdict_keys,
+            "narrative_field": narrative_field,
+            "schema": schema,
+            "future": None,
+        }
+        _evict_pending_jobs()
+    result["narrative_job"] = job_id
+
+    if narrative_mode == "background":
+        _submit(job_id)
+    return result
+
+
+def _evict_pending_jobs():
+    # 调用方已持有锁；只丢弃尚未开始的任务（lazy模式下从未查看），运行中的任务完成后自行移除
+    for job_id in list(_jobs):
+        if len(_jobs) <= MAX_PENDING_JOBS:
+            break
+        if _jobs[job_id]["future"] is None:
+            del _jobs[job_id]
+
+
+def _submit(job_id):
+    """
+    Returns:
+        Future: 任务的Future，任务已完成（已移除）或已被丢弃时为None
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        if job["future"] is None:
+            job["future"] = _executor.submit(_run_llm_job, job_id, job)
+        return job["future"]
+
+
+def _run_llm_job(job_id, job):
+    narrative = None
+    try:
+        narrative = _compare_with_llm(job)
+    finally:
+        # 完成后释放任务（及其中的患者数据），只保留有限条数的叙述文本
+        with _lock:
+            _jobs.pop(job_id, None)
+            _narratives[job_id] = narrative
+            while len(_narratives) > MAX_FINISHED_NARRATIVES:
+                _narratives.popitem(last=False)
+    return narrative
+
+
+def _compare_with_llm(job):
+    llm_result = job["llm_call"]()
+    if not llm_result.get("success"):
+        return None
+
+    # 先按结构校验并规整类型（如字符串形式的布尔值），不合格的输出不参与比对
+    parsed = parse_llm_result(llm_result, job["schema"])
+    if parsed is None:
+        return None
+    differences = diff_verdicts(job["rules_result"], parsed, job["verdict_keys"])
+    with _lock:
+        _comparison_count["compared"] += 1
+        if differences:
+            _comparison_count["disagreed"] += 1
+            _discrepancies.append({
+                "assessor": job["assessor"],
+                "timestamp": time.time(),
+                "differences": differences,
+            })
+    return parsed.get(job["narrative_field"])
+
+
+def get_llm_narrative(result, wait=False, timeout=None):
+    """
+    获取规则优先结果对应的LLM叙述
+
+    Args:
+        result: run_rules_first返回的结果
+        wait: 是否等待LLM调用完成
+        timeout: 等待超时时间（秒）
+
+    Returns:
+        str或None: 已生成的叙述；尚未完成、调用失败或未启用时为None
+    """
+    job_id = result.get("narrative_job")
+    if job_id is None:
+        return None
+    with _lock:
+        if job_id in _narratives:
+            return _narratives[job_id]
+
+    # lazy模式下首次查看时才发起调用
+    future = _submit(job_id)
+    if future is None:
+        # 提交前刚好完成，或任务已被丢弃
+        with _lock:
+            return _narratives.get(job_id)
+    if not wait and not future.done():
+        return None
+    try:
+        return future.result(timeout=timeout)
+    except Exception:
+        return None
+
+
+def is_narrative_pending(result):
+    """判断LLM叙述是否仍在生成中"""
+    with _lock:
+        job = _jobs.get(result.get("narrative_job"))
+        return job is not None and job["future"] is not None and not job["future"].done()
+
+
+def diff_verdicts(rules_result, llm_result, verdict_keys):
+    """
+    比对规则结论与LLM结论
+
+    Returns:
+        list: 不一致的字段列表，每项为{"field", "rules", "llm"}
+    """
+    differences = []
+    for key in verdict_keys:
+        rules_value = rules_result.get(key)
+        llm_value = llm_result.get(key)
+        if rules_value != llm_value:
+            differences.append({"field": key, "rules": rules_value, "llm": llm_value})
+    return differences
+
+
+def get_discrepancy_report():
+    """返回规则与LLM结论不一致的汇总报告"""
+    with _lock:
+        return {
+            "compared": _comparison_count["compared"],
+            "disagreed": _comparison_count["disagreed"],
+            "cases": list(_discrepancies),
+        }
+
+
+class RulesFirstCompletion:
+    """与StreamingCompletion接口一致的规则结果包装，迭代时一次性输出叙述文本"""
+
+    def __init__(self, result, field):
+        self.result = {"success": True, "parsed_content": result}
+        self.final_result = result
+        self.field = field
+
+    def __iter__(self):
+        narrative = self.final_result.get(self.field, "")
+        if narrative:
+            yield narrative
@@ -0,0 +1,130 @@
+# sop_rules.py
+
+# 提示继发性帕金森综合征的影像学发现
+CT_SECONDARY_FINDINGS = ["正常压力性脑积水", "Fahr病"]
+MRI_SECONDARY_FINDINGS = ["脑炎", "正常压力性脑积水", "血管性帕金森综合征"]
+
+# 提示MSA/PSP的警示征象编号
+MSA_WARNING_SIGNS = [1, 3, 4, 5, 7, 9]
+PSP_WARNING_SIGNS = [1, 3, 6]
+
+# MRPI指数异常阈值
+MRPI_THRESHOLD = 13.55
+
+# 步骤1中提示继发性病史、绝对排除体征的patient_info字段
+SECONDARY_HISTORY_KEYS = ['head_trauma', 'drug_induced_parkinson', 'toxic_induced_parkinson']
+EXCLUSION_SIGN_KEYS = ['orthostatic_hypotension', 'cerebellar_ataxia', 'cerebellar_eye_movement',
+                       'vertical_saccade_slowing', 'vertical_gaze_palsy', 'apraxia']
+
+def has_secondary_imaging(ct_findings, mri_findings):
+    """判断CT或MRI是否存在提示继发性帕金森综合征的发现"""
+    ct_has_abnormal = any(finding in ct_findings for finding in CT_SECONDARY_FINDINGS)
+    mri_has_abnormal = any(finding in mri_findings for finding in MRI_SECONDARY_FINDINGS)
+    return ct_has_abnormal or mri_has_abnormal
+
+def derive_step4_result(selected_conditions, ct_findings, mri_findings):
+    """
+    步骤4汇总：血检病因、CT、MRI三项均完成后才给出结论（与原步骤4页面侧边栏的判定一致），
+    任一项提示继发性即为继发性帕金森综合征，否则为疑似帕金森综合征
+    
+    Args:
+        selected_conditions: 血检提示的病因（医生确认的条件或规则建议），"无"表示未发现继发性因素
+        ct_findings: CT发现列表
+        mri_findings: MRI发现列表
+        
+    Returns:
+        str: "继发性帕金森综合征"/"疑似帕金森综合征"，任一项未完成时为None
+    """
+    if not (selected_conditions and ct_findings and mri_findings):
+        return None
+    blood_secondary = "无" not in selected_conditions
+    if blood_secondary or has_secondary_imaging(ct_findings, mri_findings):
+        return "继发性帕金森综合征"
+    return "疑似帕金森综合征"
+
+def classify_primary_vs_atypical(warning_signs, supportive_criteria, msa_features, psp_features, mrpi_index):
+    """
+    步骤5诊断逻辑：根据警示征象与支持条件区分原发性与叠加性帕金森综合征
+    
+    Args:
+        warning_signs: 存在的警示征象编号列表
+        supportive_criteria: 存在的支持条件编号列表
+        msa_features: MSA特异性影像学特征
+        psp_features: PSP特异性影像学特征
+        mrpi_index: MRPI指数
+        
+    Returns:
+        dict: 诊断结果，包括diagnosis、reason以及是否怀疑MSA/PSP
+    """
+    num_warning_signs = len(warning_signs)
+    num_supportive_criteria = len(supportive_criteria)
+    
+    suspect_msa = False
+    suspect_psp = False
+    
+    if num_warning_signs == 0:
+        diagnosis = "原发性帕金森病"
+        reason = "未发现警示征象，符合原发性帕金森病诊断"
+    elif num_warning_signs == 1:
+        if num_supportive_criteria >= 1:
+            diagnosis = "原发性帕金森病"
+            reason = "1条警示征象被1条支持条件抵消"
+        else:
+            diagnosis = "帕金森叠加综合征"
+            reason = "1条警示征象未被支持条件抵消"
+    elif num_warning_signs == 2:
+        if num_supportive_criteria >= 2:
+            diagnosis = "原发性帕金森病"
+            reason = "2条警示征象被2条支持条件抵消"
+        else:
+            diagnosis = "帕金森叠加综合征"
+            reason = "2条警示征象未被足够支持条件抵消"
+    else:  # num_warning_signs >= 3
+        diagnosis = "帕金森叠加综合征"
+        reason = "3条或以上警示征象，诊断不能成立"
+        
+        # 进一步区分叠加综合征类型
+        suspect_msa = bool(any(sign in MSA_WARNING_SIGNS for sign in warning_signs) or msa_features)
+        suspect_psp = bool(any(sign in PSP_WARNING_SIGNS for sign in warning_signs) or psp_features)
+    
+    return {
+        "diagnosis": diagnosis,
+        "reason": reason,
+        "suspect_msa": suspect_msa,
+        "suspect_psp": suspect_psp,
+        "mrpi_abnormal": mrpi_index > MRPI_THRESHOLD
+    }
+
+def derive_diagnosis_tag(secondary_history=False, exclusion_signs=False, has_parkinson=None,
+                         is_primary_parkinson=None, step4_result=None, step5_result=None):
+    """
+    根据各步骤结果推导患者诊断标签
+    
+    Args:
+        secondary_history: 步骤1是否存在继发性帕金森综合征相关病史
+        exclusion_signs: 步骤1体格检查是否存在绝对排除项
+        has_parkinson: 步骤2 UPDRS评估结论（None表示未评估）
+        is_primary_parkinson: 步骤3绝对排除标准结论（None表示未评估）
+        step4_result: 步骤4汇总结果（"继发性帕金森综合征"/"疑似帕金森综合征"/None）
+        step5_result: 步骤5诊断结果（"原发性帕金森病"/"帕金森叠加综合征"/None）
+        
+    Returns:
+        str: 诊断标签
+    """
+    # 步骤5的结果优先级最高
+    if step5_result:
+        if step5_result == "原发性帕金森病":
+            return '原发性帕金森综合征'
+        return '叠加性帕金森综合征'
+    
+    if secondary_history:
+        return '继发性帕金森综合征'
+    if exclusion_signs:
+        return '非原发性帕金森综合征'
+    if has_parkinson is False:
+        return '非原发性帕金森综合征'
+    if is_primary_parkinson is False:
+        return '非原发性帕金森综合征'
+    if step4_result == "继发性帕金森综合征":
+        return '继发性帕金森综合征'
+    return '疑似帕金森综合征'
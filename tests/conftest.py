@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# 应用模块位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
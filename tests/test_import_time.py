@@ -0,0 +1,23 @@
+# tests/test_import_time.py
+import importlib.util
+import os
+
+import pytest
+
+from import_profile import STARTUP_MODULES, STARTUP_PAGES, check_modules
+
+# 与 import_profile.py 命令行相同的预算（环境变量PD_IMPORT_BUDGET_MS，默认250毫秒）
+BUDGET_MS = float(os.getenv("PD_IMPORT_BUDGET_MS", 250))
+
+
+@pytest.mark.parametrize("module", STARTUP_MODULES)
+def test_module_import_budget(module):
+    _, failures = check_modules([module], BUDGET_MS)
+    assert not failures, "\n".join(failures)
+
+
+@pytest.mark.skipif(importlib.util.find_spec("streamlit") is None, reason="检查页面需要安装streamlit")
+@pytest.mark.parametrize("page", STARTUP_PAGES)
+def test_page_import_budget(page):
+    _, failures = check_modules([page], BUDGET_MS)
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,56 @@
+# tests/test_job_queue.py
+import threading
+import time
+from concurrent.futures import Future
+
+from job_queue import JobQueue, DONE, FAILED
+
+
+def _wait(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job.finished:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("任务未在限定时间内结束")
+
+
+def test_future_job_releases_worker():
+    queue = JobQueue(max_workers=1)
+    future = Future()
+    slow = queue.submit("slow", lambda job: future)
+    fast = queue.submit("fast", lambda job: 42)
+
+    # 唯一的工作线程没有被等待中的Future占住
+    assert _wait(queue, fast).result == 42
+    assert not queue.get(slow).finished
+
+    future.set_result({"success": True})
+    job = _wait(queue, slow)
+    assert job.status == DONE
+    assert job.result == {"success": True}
+
+
+def test_future_job_failure():
+    queue = JobQueue(max_workers=1)
+    future = Future()
+    job_id = queue.submit("broken", lambda job: future)
+    threading.Timer(0.05, future.set_exception, (RuntimeError("进程退出"),)).start()
+
+    job = _wait(queue, job_id)
+    assert job.status == FAILED
+    assert job.error == "进程退出"
+
+
+def test_dedup_only_unfinished_jobs():
+    queue = JobQueue(max_workers=1)
+    future = Future()
+    first = queue.submit("updrs", lambda job: future, fingerprint="same")
+    assert queue.submit("updrs", lambda job: future, fingerprint="same") == first
+
+    future.set_result({"success": True})
+    _wait(queue, first)
+    second = queue.submit("updrs", lambda job: {"success": True}, fingerprint="same")
+    assert second != first
+    assert _wait(queue, second).result is not queue.get(first).result
@@ -0,0 +1,40 @@
+# tests/test_lab_reference.py
+import math
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from lab_reference import parse_reference_range, evaluate_lab_data
+from ai_blood_analysis import BloodTestAnalyzer
+
+
+@pytest.mark.parametrize("text, low, high", [
+    ("135-145", 135.0, 145.0),
+    ("135-145 mmol/L", 135.0, 145.0),
+    ("135-145mmol/L", 135.0, 145.0),
+    ("0~40U/L", 0.0, 40.0),
+    ("<40 U/L", math.nan, 40.0),
+    (">=3 g/L", 3.0, math.nan),
+])
+def test_reference_with_unit(text, low, high):
+    parsed_low, parsed_high, expected = parse_reference_range(text)
+    assert expected is None
+    for parsed, wanted in ((parsed_low, low), (parsed_high, high)):
+        assert (math.isnan(parsed) and math.isnan(wanted)) or parsed == wanted
+
+
+def test_low_sodium_with_unit_in_reference():
+    lab_data = pd.DataFrame({
+        '名称': ['钠(Na)'], '结果': ['130'], '单位': ['mmol/L'], '参考值': ['135-145mmol/L'],
+    })
+    assert "低钠血症" in BloodTestAnalyzer()._analyze_with_rules(lab_data)['abnormal_items']
+
+
+def test_unparseable_numeric_reference_falls_back_to_template():
+    lab_data = pd.DataFrame({
+        '名称': ['谷丙转氨酶(ALT)'], '结果': ['50'], '单位': ['U/L'], '参考值': ['见报告'],
+    })
+    flags = evaluate_lab_data(lab_data)
+    assert flags['high'].iloc[0] == 40.0
+    assert bool(flags['is_high'].iloc[0])
@@ -0,0 +1,30 @@
+# tests/test_result_schema.py
+import json
+
+from result_schema import UPDRS_RESULT_SCHEMA, decode_json, repair_json_text
+
+
+def test_trailing_commas_removed_outside_strings():
+    text = '```json\n{"items": ["a", "b",], "n": 1,}\n```'
+    assert json.loads(repair_json_text(text)) == {"items": ["a", "b"], "n": 1}
+
+
+def test_trailing_commas_kept_inside_strings():
+    text = '{"assessment": "结论: ,} 与 ,] 原样保留", "note": "引号\\",}",}'
+    data, repaired = decode_json(text)
+    assert repaired
+    assert data == {"assessment": "结论: ,} 与 ,] 原样保留", "note": "引号\",}"}
+
+
+def test_missing_optional_fields_stay_none():
+    result, errors = UPDRS_RESULT_SCHEMA.validate({
+        "has_parkinson": True,
+        "core_standard_met": True,
+        "rigidity_standard_met": False,
+        "tremor_standard_met": "是",
+        "assessment": "……",
+    })
+    assert errors == []
+    assert result["rigidity_score"] is None
+    assert result["core_items_met"] is None
+    assert result["tremor_standard_met"] is True
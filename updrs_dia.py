@@ -1,20 +1,43 @@
 # diagnosis_rules.py
-from deepseek_client import deepseek_client
-import pandas as pd
+from deepseek_client import get_deepseek_client
+from rules_first import is_rules_first, run_rules_first, RulesFirstCompletion
+from metrics import record_assessment, timed_assessment
+from prompt_builder import encode_scores, record_prompt_size
+from result_schema import UPDRS_RESULT_SCHEMA, parse_llm_result, parse_llm_result_async
 
-def assess_updrs_parkinson(updrs_data):
-    """
-    使用DeepSeek根据UPDRS评分判断帕金森综合症
-    
-    Args:
-        updrs_data: DataFrame包含检测项目和评分
-        
-    Returns:
-        dict: 评估结果
-    """
-    
-    # 系统提示词
-    system_prompt = """你是一个专业的神经科医生助手。请严格按照给定的判断步骤分析UPDRS-III评分数据，判断患者是否患有帕金森综合症。
+# 标准的UPDRS-III检测项目
+STANDARD_UPDRS_ITEMS = [
+    "3.1 言语表达", "3.2 面部表情", "3.3 强直（颈+四肢）","3.4 手指叩击（右）", "3.5 手指叩击（左）", 
+    "3.6 手掌握合（右）", "3.7 手掌握合（左）","3.8 前臂旋前-旋后（右）", "3.9 前臂旋前-旋后（左）", 
+    "3.10 脚趾叩击（右）","3.11 脚趾叩击（左）", "3.12 足跟点地（右）", "3.13 足跟点地（左）", 
+    "3.14 后拉试验", "3.15 静止性震颤（多部位）", "3.16 姿势性震颤（上肢）","3.17 运动灵活性（手指-足快速轮替）",
+    "3.18 步态&冻结观察",
+]
+
+# 核心标准（运动迟缓）检测项
+UPDRS_CORE_ITEMS = [
+    "3.4 手指叩击（右）", "3.5 手指叩击（左）", "3.6 手掌握合（右）", 
+    "3.7 手掌握合（左）", "3.8 前臂旋前-旋后（右）", "3.9 前臂旋前-旋后（左）",
+    "3.10 脚趾叩击（右）", "3.11 脚趾叩击（左）", "3.12 足跟点地（右）", "3.13 足跟点地（左）"
+]
+
+# 辅助标准（肌强直）检测项
+UPDRS_RIGIDITY_ITEM = "3.3 强直（颈+四肢）"
+
+# 辅助标准（静止性震颤）检测项
+UPDRS_TREMOR_ITEMS = ["3.17 运动灵活性（手指-足快速轮替）", "3.18 步态&冻结观察"]
+
+# 判断步骤（静态规则文本）
+UPDRS_RULES = """1. 首先，要判断【3.4 手指叩击（右）】、【3.5 手指叩击（左）】、【3.6 手掌握合（右）】、【3.7 手掌握合（左）】、【3.8 前臂旋前-旋后（右）】、【3.9 前臂旋前-旋后（左）】、【3.10 脚趾叩击（右）】、【3.11 脚趾叩击（左）】、【3.12 足跟点地（右）】、【3.13 足跟点地（左）】这10个检测项是否有至少1个检测项的评分大于等于2。如果满足条件，则说明病人具备"运动迟缓"这个"核心标准"。
+
+2. 其次，判断【3.3 强直（颈+四肢）】检测项的评分是否大于等于2。如果满足条件，则说明病人具备"肌强直"的"辅助标准"。
+
+3. 第三，判断【3.17 运动灵活性（手指-足快速轮替）】、【3.18 步态&冻结观察】这2个检测项是否至少有1个检测项的评分大于等于2。如果满足条件，则说明病人具备"姿势不稳"的"辅助标准"。
+
+4. 如果满足"核心标准"及至少1项"辅助标准"，则可以初步判断病人属于帕金森综合症。否则，其他任何情况都表示病人不患有帕金森综合症。"""
+
+# 角色说明与输出格式（系统提示词的开头部分）
+UPDRS_FORMAT_PROMPT = """你是一个专业的神经科医生助手。请严格按照给定的判断步骤分析UPDRS-III评分数据，判断患者是否患有帕金森综合症。
 
 请严格按照以下JSON格式返回评估结果：
 {
@@ -30,41 +53,123 @@ def assess_updrs_parkinson(updrs_data):
 
 请严格按照用户提供的判断步骤进行分析，不要自行修改标准。"""
 
+# 系统提示词包含全部静态规则，作为各次调用相同的前缀；用户提示词只有紧凑编码的评分
+UPDRS_SYSTEM_PROMPT = UPDRS_FORMAT_PROMPT + """
+
+判断步骤如下：
+
+""" + UPDRS_RULES + """
+
+用户将以"项目编号=评分"的形式提供UPDRS-III各检测项的评分（0-4分）。请根据上述的判断步骤，仿照给定的格式输出详细的UPDRSIII标准核对结果。"""
+
+# 规则优先模式下与LLM结论比对的字段
+UPDRS_VERDICT_KEYS = ["has_parkinson", "core_standard_met", "rigidity_standard_met", "tremor_standard_met"]
+
+@timed_assessment("updrs")
+def assess_updrs_parkinson(updrs_data):
+    """
+    使用DeepSeek根据UPDRS评分判断帕金森综合症
+    
+    Args:
+        updrs_data: DataFrame包含检测项目和评分
+        
+    Returns:
+        dict: 评估结果
+    """
+    
+    if is_rules_first():
+        return assess_updrs_rules_first(updrs_data)
+    
     # 构建用户提示词
     user_prompt = build_updrs_prompt(updrs_data)
     
     # 调用DeepSeek API
-    result = deepseek_client.call_deepseek(system_prompt, user_prompt)
+    client = get_deepseek_client()
+    result = client.call_deepseek(UPDRS_SYSTEM_PROMPT, user_prompt, schema=UPDRS_RESULT_SCHEMA)
+    parsed = parse_llm_result(result, UPDRS_RESULT_SCHEMA, client) if result["success"] else None
     
-    if result["success"]:
-        return result["parsed_content"]
+    if parsed is not None:
+        record_assessment("updrs", "ai")
+        return parsed
     else:
-        # API调用失败时使用规则回退
+        # API调用失败或输出无法修复时使用规则回退
+        record_assessment("updrs", "fallback")
         return fallback_updrs_assessment(updrs_data)
 
-def build_updrs_prompt(updrs_data):
-    """构建UPDRS评估的用户提示词"""
+@timed_assessment("updrs")
+async def assess_updrs_parkinson_async(updrs_data, client):
+    """
+    assess_updrs_parkinson的异步版本，供并发评估使用
     
-    # 将DataFrame转换为易读的文本格式
-    items_text = ""
-    for _, row in updrs_data.iterrows():
-        items_text += f"- {row['检测项目']}: 评分={row['评分']}\n"
+    Args:
+        updrs_data: DataFrame包含检测项目和评分
+        client: AsyncDeepSeekClient实例
+        
+    Returns:
+        dict: 评估结果
+    """
+    if is_rules_first():
+        return assess_updrs_rules_first(updrs_data)
     
-    prompt = f"""请读取UPDRS III的检测项和对应评分。这些检测项是用来判断患者是否患有帕金森综合症的，判断步骤如下：
-
-1. 首先，要判断【3.4 手指叩击（右）】、【3.5 手指叩击（左）】、【3.6 手掌握合（右）】、【3.7 手掌握合（左）】、【3.8 前臂旋前-旋后（右）】、【3.9 前臂旋前-旋后（左）】、【3.10 脚趾叩击（右）】、【3.11 脚趾叩击（左）】、【3.12 足跟点地（右）】、【3.13 足跟点地（左）】这10个检测项是否有至少1个检测项的评分大于等于2。如果满足条件，则说明病人具备"运动迟缓"这个"核心标准"。
-
-2. 其次，判断【3.3 强直（颈+四肢）】检测项的评分是否大于等于2。如果满足条件，则说明病人具备"肌强直"的"辅助标准"。
-
-3. 第三，判断【3.17 运动灵活性（手指-足快速轮替）】、【3.18 步态&冻结观察】这2个检测项是否至少有1个检测项的评分大于等于2。如果满足条件，则说明病人具备"姿势不稳"的"辅助标准"。
-
-4. 如果满足"核心标准"及至少1项"辅助标准"，则可以初步判断病人属于帕金森综合症。否则，其他任何情况都表示病人不患有帕金森综合症。
+    user_prompt = build_updrs_prompt(updrs_data)
+    result = await client.call_deepseek(UPDRS_SYSTEM_PROMPT, user_prompt, schema=UPDRS_RESULT_SCHEMA)
+    parsed = await parse_llm_result_async(result, UPDRS_RESULT_SCHEMA, client) if result["success"] else None
+    
+    if parsed is not None:
+        record_assessment("updrs", "ai")
+        return parsed
+    else:
+        record_assessment("updrs", "fallback")
+        return fallback_updrs_assessment(updrs_data)
 
-当前患者的UPDRS-III评分数据：
-{items_text}
+def assess_updrs_rules_first(updrs_data):
+    """
+    规则优先评估：本地规则立即给出结论，DeepSeek仅用于可选叙述并核对结论
+    
+    Args:
+        updrs_data: DataFrame包含检测项目和评分
+        
+    Returns:
+        dict: 规则评估结果
+    """
+    updrs_data = updrs_data.copy()
+    record_assessment("updrs", "rules_first")
+    return run_rules_first(
+        "updrs",
+        fallback_updrs_assessment(updrs_data),
+        lambda: get_deepseek_client().call_deepseek(UPDRS_SYSTEM_PROMPT, build_updrs_prompt(updrs_data),
+                                                    schema=UPDRS_RESULT_SCHEMA),
+        UPDRS_VERDICT_KEYS,
+        "assessment",
+        UPDRS_RESULT_SCHEMA
+    )
 
-请你根据上述的判断步骤，仿照给定的格式输出详细的UPDRSIII标准核对结果。"""
+def stream_updrs_parkinson(updrs_data):
+    """
+    流式版本的UPDRS评估，评估详情文本随生成逐段输出
     
+    Args:
+        updrs_data: DataFrame包含检测项目和评分
+        
+    Returns:
+        StreamingCompletion: 迭代得到assessment文本片段，结束后final_result为评估结果
+    """
+    if is_rules_first():
+        return RulesFirstCompletion(assess_updrs_rules_first(updrs_data), "assessment")
+    
+    user_prompt = build_updrs_prompt(updrs_data)
+    return get_deepseek_client().stream_deepseek(
+        UPDRS_SYSTEM_PROMPT, user_prompt,
+        field="assessment",
+        fallback=lambda: fallback_updrs_assessment(updrs_data),
+        assessor="updrs",
+        schema=UPDRS_RESULT_SCHEMA
+    )
+
+def build_updrs_prompt(updrs_data):
+    """构建UPDRS评估的用户提示词（紧凑编码的评分，规则文本在系统提示词中）"""
+    prompt = f"当前患者的UPDRS-III评分：{encode_scores(updrs_data['检测项目'], updrs_data['评分'])}"
+    record_prompt_size("updrs", UPDRS_SYSTEM_PROMPT, prompt)
     return prompt
 
 def fallback_updrs_assessment(updrs_data):
@@ -74,22 +179,15 @@ def fallback_updrs_assessment(updrs_data):
     scores_dict = dict(zip(updrs_data['检测项目'], updrs_data['评分']))
     
     # 1. 核心标准判断 - 运动迟缓
-    core_items = [
-        "3.4 手指叩击（右）", "3.5 手指叩击（左）", "3.6 手掌握合（右）", 
-        "3.7 手掌握合（左）", "3.8 前臂旋前-旋后（右）", "3.9 前臂旋前-旋后（左）",
-        "3.10 脚趾叩击（右）", "3.11 脚趾叩击（左）", "3.12 足跟点地（右）", "3.13 足跟点地（左）"
-    ]
-    
-    core_met_items = [item for item in core_items if scores_dict.get(item, 0) >= 2]
+    core_met_items = [item for item in UPDRS_CORE_ITEMS if scores_dict.get(item, 0) >= 2]
     core_standard_met = len(core_met_items) > 0
     
     # 2. 辅助标准1 - 肌强直
-    rigidity_score = scores_dict.get("3.3 强直（颈+四肢）", 0)
+    rigidity_score = scores_dict.get(UPDRS_RIGIDITY_ITEM, 0)
     rigidity_standard_met = rigidity_score >= 2
     
     # 3. 辅助标准2 - 静止性震颤
-    tremor_items = ["3.17 运动灵活性（手指-足快速轮替）", "3.18 步态&冻结观察"]
-    tremor_met_items = [item for item in tremor_items if scores_dict.get(item, 0) >= 2]
+    tremor_met_items = [item for item in UPDRS_TREMOR_ITEMS if scores_dict.get(item, 0) >= 2]
     tremor_standard_met = len(tremor_met_items) > 0
     
     # 4. 最终判断
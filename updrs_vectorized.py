@@ -0,0 +1,146 @@
+# updrs_vectorized.py
+"""
+批量（向量化）UPDRS-III评分：一次处理 患者数×18项 的评分矩阵，与fallback_updrs_assessment判断规则一致。
+
+用法：
+    python updrs_vectorized.py [--patients 1000000]    # 先与逐行规则比对，再测吞吐量
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from updrs_dia import (
+    STANDARD_UPDRS_ITEMS, UPDRS_CORE_ITEMS, UPDRS_RIGIDITY_ITEM, UPDRS_TREMOR_ITEMS,
+    fallback_updrs_assessment
+)
+
+
+def _column_selector(items, wanted):
+    """返回wanted各项在items中的列号，不存在的项为-1（按评分0处理，与逐行规则一致）"""
+    positions = {item: i for i, item in enumerate(items)}
+    return np.array([positions.get(item, -1) for item in wanted], dtype=np.intp)
+
+
+def _take(matrix, columns):
+    """按列号取子矩阵，-1列填0"""
+    present = columns >= 0
+    if present.all():
+        return matrix[:, columns]
+    result = np.zeros((matrix.shape[0], len(columns)), dtype=matrix.dtype)
+    result[:, present] = matrix[:, columns[present]]
+    return result
+
+
+def score_updrs_matrix(scores, items=None):
+    """
+    向量化UPDRS-III评估
+
+    Args:
+        scores: 患者×检测项目的评分矩阵（ndarray），或以检测项目为列名的宽表DataFrame
+        items: ndarray各列对应的检测项目名称，默认为STANDARD_UPDRS_ITEMS
+
+    Returns:
+        dict: 每个键对应长度为患者数的数组
+            core_standard_met / rigidity_standard_met / tremor_standard_met / has_parkinson: bool
+            rigidity_score: 肌强直评分
+            core_items_met: 患者×10 的布尔矩阵（列顺序同UPDRS_CORE_ITEMS）
+            tremor_items_met: 患者×2 的布尔矩阵（列顺序同UPDRS_TREMOR_ITEMS）
+    """
+    if isinstance(scores, pd.DataFrame):
+        items = list(scores.columns)
+        matrix = scores.to_numpy(dtype=np.float64)
+    else:
+        items = list(items if items is not None else STANDARD_UPDRS_ITEMS)
+        matrix = np.asarray(scores)
+        if matrix.ndim != 2 or matrix.shape[1] != len(items):
+            raise ValueError(f"评分矩阵应为 患者数×{len(items)} 的二维数组")
+
+    core_items_met = _take(matrix, _column_selector(items, UPDRS_CORE_ITEMS)) >= 2
+    rigidity_score = _take(matrix, _column_selector(items, [UPDRS_RIGIDITY_ITEM]))[:, 0]
+    tremor_items_met = _take(matrix, _column_selector(items, UPDRS_TREMOR_ITEMS)) >= 2
+
+    core_standard_met = core_items_met.any(axis=1)
+    rigidity_standard_met = rigidity_score >= 2
+    tremor_standard_met = tremor_items_met.any(axis=1)
+
+    return {
+        "core_standard_met": core_standard_met,
+        "rigidity_standard_met": rigidity_standard_met,
+        "tremor_standard_met": tremor_standard_met,
+        "has_parkinson": core_standard_met & (rigidity_standard_met | tremor_standard_met),
+        "rigidity_score": rigidity_score,
+        "core_items_met": core_items_met,
+        "tremor_items_met": tremor_items_met,
+    }
+
+
+def updrs_frames_to_matrix(updrs_frames, items=None):
+    """将多个步骤2格式（检测项目, 评分）的DataFrame合并为宽表DataFrame，缺失项按0处理"""
+    items = list(items if items is not None else STANDARD_UPDRS_ITEMS)
+    rows = [dict(zip(df['检测项目'], df['评分'])) for df in updrs_frames]
+    return pd.DataFrame.from_records(rows, columns=items).fillna(0)
+
+
+def verify_against_scalar(n_patients=5000, seed=0):
+    """
+    用随机评分比对向量化结果与fallback_updrs_assessment逐行结果
+
+    Returns:
+        int: 比对的患者数（不一致时抛出AssertionError）
+    """
+    rng = np.random.default_rng(seed)
+    matrix = rng.integers(0, 5, size=(n_patients, len(STANDARD_UPDRS_ITEMS)))
+    vectorized = score_updrs_matrix(matrix)
+
+    for row in range(n_patients):
+        scalar = fallback_updrs_assessment(pd.DataFrame({
+            '检测项目': STANDARD_UPDRS_ITEMS,
+            '评分': matrix[row]
+        }))
+        for key in ("core_standard_met", "rigidity_standard_met", "tremor_standard_met", "has_parkinson"):
+            assert bool(vectorized[key][row]) == scalar[key], (row, key)
+        assert vectorized["rigidity_score"][row] == scalar["rigidity_score"], (row, "rigidity_score")
+        core_met = [item for item, met in zip(UPDRS_CORE_ITEMS, vectorized["core_items_met"][row]) if met]
+        tremor_met = [item for item, met in zip(UPDRS_TREMOR_ITEMS, vectorized["tremor_items_met"][row]) if met]
+        assert core_met == scalar["core_items_met"], (row, "core_items_met")
+        assert tremor_met == scalar["tremor_items_met"], (row, "tremor_items_met")
+    return n_patients
+
+
+def benchmark(n_patients=1_000_000, seed=0):
+    """
+    测量向量化评分吞吐量
+
+    Returns:
+        dict: 患者数、耗时（秒）、每秒处理患者数
+    """
+    rng = np.random.default_rng(seed)
+    matrix = rng.integers(0, 5, size=(n_patients, len(STANDARD_UPDRS_ITEMS)), dtype=np.int8)
+    start = time.perf_counter()
+    score_updrs_matrix(matrix)
+    elapsed = time.perf_counter() - start
+    return {
+        "patients": n_patients,
+        "seconds": elapsed,
+        "patients_per_second": n_patients / elapsed if elapsed else float('inf'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="向量化UPDRS评分校验与基准测试")
+    parser.add_argument("--patients", type=int, default=1_000_000, help="基准测试患者数")
+    parser.add_argument("--verify", type=int, default=5000, help="与逐行规则比对的患者数")
+    args = parser.parse_args(argv)
+
+    verified = verify_against_scalar(args.verify)
+    print(f"与fallback_updrs_assessment逐行比对一致：{verified} 名患者")
+
+    result = benchmark(args.patients)
+    print(f"向量化评分 {result['patients']} 名患者用时 {result['seconds']:.3f} 秒"
+          f"（{result['patients_per_second']:,.0f} 名/秒）")
+
+
+if __name__ == "__main__":
+    main()
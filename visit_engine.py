@@ -0,0 +1,271 @@
+# visit_engine.py
+"""
+随访记录与增量再诊断：每次随访保存输入数据与各步骤结果，
+再诊断时只重新计算输入（或依赖步骤）发生变化的步骤，其余步骤复用上次随访或结果缓存中的结果。
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from patient_store import get_patient_store, encode_state_value
+from updrs_dia import fallback_updrs_assessment
+from aec_dia import fallback_exclusion_assessment
+from ai_blood_analysis import get_blood_analyzer
+from sop_rules import (
+    SECONDARY_HISTORY_KEYS, EXCLUSION_SIGN_KEYS,
+    derive_step4_result, classify_primary_vs_atypical, derive_diagnosis_tag
+)
+
+# 规则逻辑变化时递增，使所有步骤摘要失效
+RULES_VERSION = 1
+
+# 随访时间序列缓存的患者数上限
+MAX_CACHED_TIMELINES = 64
+
+# (数据库路径, 患者ID) -> (最近随访序号, 随访列表)；保存随访时失效
+_timelines = OrderedDict()
+_timelines_lock = threading.Lock()
+
+
+def _compute_history(inputs, deps):
+    history = inputs["history"] or {}
+    return {
+        "secondary_history": any(history.get(key, False) for key in SECONDARY_HISTORY_KEYS),
+        "exclusion_signs": any(history.get(key, False) for key in EXCLUSION_SIGN_KEYS),
+    }
+
+
+def _compute_updrs(inputs, deps):
+    if inputs["updrs_data"] is None:
+        return None
+    return fallback_updrs_assessment(inputs["updrs_data"])
+
+
+def _compute_exclusion(inputs, deps):
+    if not inputs["exclusion_criteria"]:
+        return None
+    return fallback_exclusion_assessment(inputs["exclusion_criteria"])
+
+
+def _compute_blood(inputs, deps):
+    if inputs["lab_data"] is None:
+        return None
+    return get_blood_analyzer()._analyze_with_rules(inputs["lab_data"])
+
+
+def _compute_step4(inputs, deps):
+    # 医生确认的条件优先，否则使用规则建议
+    conditions = inputs["selected_conditions"]
+    if not conditions and deps["blood"]:
+        conditions = deps["blood"].get("suggested_conditions", [])
+    return derive_step4_result(conditions, inputs["ct_findings"], inputs["mri_findings"])
+
+
+def _compute_step5(inputs, deps):
+    if inputs["warning_signs"] is None:
+        return None
+    return classify_primary_vs_atypical(
+        inputs["warning_signs"],
+        inputs["supportive_criteria"] or [],
+        inputs["msa_features"] or [],
+        inputs["psp_features"] or [],
+        inputs["mrpi_index"] or 0
+    )
+
+
+def _compute_diagnosis_tag(inputs, deps):
+    history = deps["history"]
+    return derive_diagnosis_tag(
+        secondary_history=history["secondary_history"],
+        exclusion_signs=history["exclusion_signs"],
+        has_parkinson=deps["updrs"]["has_parkinson"] if deps["updrs"] else None,
+        is_primary_parkinson=deps["exclusion"]["is_primary_parkinson"] if deps["exclusion"] else None,
+        step4_result=deps["step4"],
+        step5_result=deps["step5"]["diagnosis"] if deps["step5"] else None
+    )
+
+
+# (步骤, 读取的随访输入键, 依赖步骤, 计算函数)，按依赖顺序排列
+VISIT_STEPS = [
+    ("history", ("history",), (), _compute_history),
+    ("updrs", ("updrs_data",), (), _compute_updrs),
+    ("exclusion", ("exclusion_criteria",), (), _compute_exclusion),
+    ("blood", ("lab_data",), (), _compute_blood),
+    ("step4", ("selected_conditions", "ct_findings", "mri_findings"), ("blood",), _compute_step4),
+    ("step5", ("warning_signs", "supportive_criteria", "msa_features", "psp_features", "mrpi_index"),
+     (), _compute_step5),
+    ("diagnosis_tag", (), ("history", "updrs", "exclusion", "step4", "step5"), _compute_diagnosis_tag),
+]
+
+
+def extract_visit_inputs(state):
+    """
+    从会话状态中提取一次随访的输入数据
+
+    Args:
+        state: 会话状态（或同样结构的字典）
+
+    Returns:
+        dict: 随访输入，步骤5未完成诊断时其输入为None
+    """
+    patient_info = state.get('patient_info') or {}
+    ct_data = state.get('ct_data') or {}
+    mri_data = state.get('mri_data') or {}
+    imaging = state.get('page5_imaging') or {}
+    step5_done = state.get('page5_diagnosis_result') is not None
+
+    return {
+        "history": {key: bool(patient_info.get(key, False))
+                    for key in SECONDARY_HISTORY_KEYS + EXCLUSION_SIGN_KEYS},
+        "updrs_data": state.get('updrs_data'),
+        "exclusion_criteria": state.get('exclusion_criteria'),
+        "lab_data": state.get('lab_data'),
+        "selected_conditions": list(state.get('selected_conditions') or []),
+        "ct_findings": list(ct_data.get('findings') or []),
+        "mri_findings": list(mri_data.get('findings') or []),
+        "warning_signs": list(state.get('page5_warning_signs') or []) if step5_done else None,
+        "supportive_criteria": list(state.get('page5_supportive_criteria') or []) if step5_done else None,
+        "msa_features": list(imaging.get('msa_features') or []) if step5_done else None,
+        "psp_features": list(imaging.get('psp_features') or []) if step5_done else None,
+        "mrpi_index": imaging.get('mrpi_index', 0) if step5_done else None,
+    }
+
+
+def step_digest(step, step_inputs, dependency_digests):
+    """计算步骤摘要：规则版本 + 本步骤输入 + 依赖步骤摘要"""
+    payload = json.dumps(
+        [RULES_VERSION, step, encode_state_value(step_inputs), list(dependency_digests)],
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def compute_step_digests(inputs):
+    """只计算各步骤摘要（不执行规则），用于判断哪些步骤需要重算"""
+    digests = {}
+    for step, keys, deps, _ in VISIT_STEPS:
+        digests[step] = step_digest(step, {key: inputs.get(key) for key in keys},
+                                    [digests[dep] for dep in deps])
+    return digests
+
+
+def rediagnose(inputs, previous=None, store=None):
+    """
+    增量再诊断
+
+    Args:
+        inputs: 随访输入（extract_visit_inputs的输出）
+        previous: 上一次随访记录（含step_digests和results），为None时只使用结果缓存
+        store: PatientStore，提供跨随访/跨患者的步骤结果缓存，为None时不使用缓存
+
+    Returns:
+        tuple: (各步骤结果, 各步骤摘要, 重新计算的步骤列表)
+    """
+    previous_digests = previous["step_digests"] if previous else {}
+    previous_results = previous["results"] if previous else {}
+    digests = compute_step_digests(inputs)
+
+    results = {}
+    recomputed = []
+    for step, keys, deps, compute in VISIT_STEPS:
+        digest = digests[step]
+        if previous_digests.get(step) == digest and step in previous_results:
+            results[step] = previous_results[step]
+            continue
+        if store is not None:
+            cached = store.get_step_results(step, [digest])
+            if digest in cached:
+                results[step] = cached[digest]
+                continue
+        results[step] = compute({key: inputs.get(key) for key in keys},
+                                {dep: results[dep] for dep in deps})
+        recomputed.append(step)
+
+    if store is not None and recomputed:
+        store.put_step_results([(step, digests[step], results[step]) for step in recomputed])
+    return results, digests, recomputed
+
+
+def save_visit(patient_id, state, store=None):
+    """
+    将当前会话保存为一次新的随访，并基于上一次随访增量再诊断
+
+    Returns:
+        dict: {"visit_no": 随访序号, "results": 各步骤结果, "recomputed": 重新计算的步骤}
+    """
+    store = store or get_patient_store()
+    inputs = extract_visit_inputs(state)
+    visits = store.list_visits(patient_id, include_inputs=False)
+    previous = visits[-1] if visits else None
+
+    results, digests, recomputed = rediagnose(inputs, previous, store)
+    visit_no = store.add_visit(patient_id, inputs, digests, results)
+    with _timelines_lock:
+        _timelines.pop((store.db_path, patient_id), None)
+    return {"visit_no": visit_no, "results": results, "recomputed": recomputed}
+
+
+def load_timeline(patient_id, store=None):
+    """
+    读取患者全部随访；只有规则版本变化导致摘要不一致的步骤才会重算并回写。
+    结果按(患者, 最近随访序号)缓存，随访未增加时页面重跑不再解码全部随访和重新计算摘要
+
+    Returns:
+        tuple: (随访列表, 重新计算的步骤总数)
+    """
+    store = store or get_patient_store()
+    key = (store.db_path, patient_id)
+    latest_visit_no = store.latest_visit_no(patient_id)
+    with _timelines_lock:
+        cached = _timelines.get(key)
+        if cached is not None and cached[0] == latest_visit_no:
+            _timelines.move_to_end(key)
+            # 缓存的随访摘要均已与当前规则一致，无需重算
+            return cached[1], 0
+
+    visits = store.list_visits(patient_id)
+
+    total_recomputed = 0
+    previous = None
+    for visit in visits:
+        if compute_step_digests(visit["inputs"]) != visit["step_digests"]:
+            # 本次随访自身保存的摘要含旧的规则版本，无法复用；复用上一次随访（已按当前规则更新）和结果缓存
+            results, digests, recomputed = rediagnose(visit["inputs"], previous, store)
+            store.update_visit_results(patient_id, visit["visit_no"], digests, results)
+            visit["step_digests"] = digests
+            visit["results"] = results
+            total_recomputed += len(recomputed)
+        previous = visit
+
+    with _timelines_lock:
+        _timelines[key] = (visits[-1]["visit_no"] if visits else 0, visits)
+        while len(_timelines) > MAX_CACHED_TIMELINES:
+            _timelines.popitem(last=False)
+    return visits, total_recomputed
+
+
+def timeline_frame(visits):
+    """将随访列表整理为时间序列表格（每次随访一行）"""
+    import pandas as pd
+    rows = []
+    for visit in visits:
+        inputs = visit.get("inputs") or {}
+        results = visit["results"]
+        updrs_data = inputs.get("updrs_data")
+        updrs = results.get("updrs")
+        step5 = results.get("step5")
+        rows.append({
+            "随访": visit["visit_no"],
+            "日期": pd.to_datetime(visit["visited_at"], unit='s'),
+            "UPDRS总分": float(pd.to_numeric(updrs_data['评分'], errors='coerce').sum())
+            if updrs_data is not None else None,
+            "强直评分": updrs["rigidity_score"] if updrs else None,
+            "警示征象数": len(inputs["warning_signs"]) if inputs.get("warning_signs") is not None else None,
+            "MSA影像特征": "、".join(inputs.get("msa_features") or []),
+            "PSP影像特征": "、".join(inputs.get("psp_features") or []),
+            "MRPI指数": inputs.get("mrpi_index"),
+            "步骤5结果": step5["diagnosis"] if step5 else None,
+            "诊断标签": results.get("diagnosis_tag"),
+        })
+    return pd.DataFrame(rows)